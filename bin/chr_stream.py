@@ -0,0 +1,598 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# chr_stream.py: Runs TSEBRA one chromosome at a time, so that only the
+# gene predictions and hints of one chromosome are in memory at once.
+# ==============================================================
+import csv
+import heapq
+import io
+import os
+import pickle
+import multiprocessing
+import sys
+import tempfile
+from bisect import bisect_left
+
+from genome_anno import Anno, set_gtf_ids
+from overlap_graph import Graph
+from evidence import Evidence
+from compressed import open_file, file_format
+from tabix import TabixIndex, index_path
+from file_cache import cache_path, fingerprint, is_unchanged, write_atomic
+from gtf_writer import GtfWriter, line_key
+
+# maximal number of bytes of a block in ChrBlocks
+BLOCK_SIZE = 1 << 20
+# prefix of the file name of a saved ChrBlocks index, see cache_path()
+INDEX_PREFIX = 'chridx'
+
+class ChrBlocks:
+    """
+        Index of the byte ranges of each chromosome in a gtf/gff file.
+        The lines of one chromosome, or of a region, can be read without
+        reading the whole file. A gzip file can't be read from an offset
+        without decompressing everything before it, so it is decompressed
+        once into a temporary file while it is scanned, and the lines are
+        read from this copy.
+    """
+    def __init__(self, path, scan=True, tmp_dir=None):
+        """
+            Args:
+                path (str): Path to a gtf/gff file, plain or compressed.
+                            Offsets refer to the uncompressed data.
+                scan (boolean): Create the index by reading the file.
+                tmp_dir (str): Directory for the uncompressed copy of a gzip file.
+        """
+        self.path = path
+        self.tmp_dir = tmp_dir
+        # path of the uncompressed copy of a gzip file, None for other files
+        self.copy_path = None
+        # self.blocks[chr] = [[byte_offset, byte_length, first_line_number,
+        #   min_start, max_end]]
+        # one block for each run of consecutive lines of a chromosome,
+        # runs longer than BLOCK_SIZE are split
+        self.blocks = {}
+        if scan:
+            self.scan()
+
+    def scan(self):
+        """
+            Read the first, fourth and fifth column of all lines and create
+            the block index.
+        """
+        offset = 0
+        block = None
+        current_chr = None
+        copy = None
+        if file_format(self.path) == 'gzip':
+            copy = tempfile.NamedTemporaryFile(dir=self.tmp_dir, prefix='tsebra_', \
+                suffix='.copy', delete=False)
+            self.copy_path = copy.name
+        with open_file(self.path, binary=True) as file:
+            for line_number, line in enumerate(file):
+                if copy is not None:
+                    copy.write(line)
+                if line[:1] == b'#' or not line.strip():
+                    # comments stay in the current block, the parser skips them
+                    if block:
+                        block[1] += len(line)
+                    offset += len(line)
+                    continue
+                columns = line.split(b'\t', 5)
+                chr = columns[0].decode()
+                if chr == current_chr and block[1] < BLOCK_SIZE:
+                    block[1] += len(line)
+                else:
+                    current_chr = chr
+                    block = [offset, len(line), line_number, -1, -1]
+                    if chr not in self.blocks.keys():
+                        self.blocks.update({chr : []})
+                    self.blocks[chr].append(block)
+                try:
+                    start, end = int(columns[3]), int(columns[4])
+                    if block[3] < 0 or start < block[3]:
+                        block[3] = start
+                    if end > block[4]:
+                        block[4] = end
+                except (IndexError, ValueError):
+                    pass
+                offset += len(line)
+        if copy is not None:
+            copy.close()
+
+    def close(self):
+        """
+            Remove the uncompressed copy of a gzip file.
+        """
+        if self.copy_path is not None and os.path.exists(self.copy_path):
+            os.remove(self.copy_path)
+        self.copy_path = None
+
+    def chromosomes(self):
+        """
+            Returns:
+                (list(str)): Chromosome names in order of their first occurrence.
+        """
+        return list(self.blocks.keys())
+
+    def size(self, chr):
+        """
+            Returns:
+                (int): Number of bytes of all lines of chr.
+        """
+        return sum([b[1] for b in self.blocks.get(chr, [])])
+
+    def rows(self, chr, start=None, end=None):
+        """
+            Read all lines of one chromosome, or all lines of the blocks
+            that overlap a region.
+
+            Args:
+                chr (str): Chromosome name
+                start (int): Start of the region, whole chr if None
+                end (int): End of the region
+
+            Yields:
+                (int, list(str)): Line number in the file and line as list
+        """
+        with open_file(self.copy_path or self.path, binary=True) as file:
+            for offset, length, line_number, min_start, max_end in self.blocks.get(chr, []):
+                if start is not None and (min_start > end or max_end < start):
+                    continue
+                file.seek(offset)
+                text = io.StringIO(file.read(length).decode(), newline=None)
+                for i, line in enumerate(csv.reader(text, delimiter='\t')):
+                    yield line_number + i, line
+
+def input_index(path, index_dir='', tmp_dir=None):
+    """
+        Index of an input file. A tabix or CSI index is used if the file has
+        one, otherwise a ChrBlocks index is created or loaded. Nothing is
+        written next to the input file.
+
+        Args:
+            path (str): Path to a gtf/gff file
+            index_dir (str): Directory in which the ChrBlocks index is saved
+                             and loaded in later runs, the index isn't saved
+                             if it is empty. Not used for gzip files, they are
+                             scanned in each run to create their uncompressed copy.
+            tmp_dir (str): Directory for the uncompressed copy of a gzip file.
+
+        Returns:
+            (ChrBlocks or TabixIndex): Index of the file.
+    """
+    input_format = file_format(path)
+    if index_path(path) and input_format == 'bgzf':
+        return TabixIndex(path)
+    if not index_dir or input_format == 'gzip':
+        return ChrBlocks(path, tmp_dir=tmp_dir)
+    chr_index = cache_path(index_dir, INDEX_PREFIX, [path])
+    if os.path.exists(chr_index):
+        try:
+            with open(chr_index, 'rb') as file:
+                file_fingerprint, blocks = pickle.load(file)
+            mtime = file_fingerprint[2]
+            if is_unchanged(path, file_fingerprint):
+                result = ChrBlocks(path, scan=False)
+                result.blocks = blocks
+                # save the new mtime, so that the file isn't hashed again
+                if not file_fingerprint[2] == mtime:
+                    save_input_index(chr_index, file_fingerprint, blocks)
+                return result
+        except (pickle.UnpicklingError, EOFError, ValueError):
+            pass
+    result = ChrBlocks(path)
+    save_input_index(chr_index, fingerprint(path), result.blocks)
+    return result
+
+def save_input_index(chr_index, file_fingerprint, blocks):
+    """
+        Save the fingerprint of an input file and the blocks of its
+        sequences, see input_index().
+    """
+    try:
+        write_atomic(chr_index, lambda file: pickle.dump([file_fingerprint, \
+            blocks], file, pickle.HIGHEST_PROTOCOL))
+    except OSError:
+        sys.stderr.write('WARNING: Could not save the index {}.\n'.format(chr_index))
+
+def component_key(record):
+    """
+        Returns:
+            (tuple(int)): Component key of a record [component_key, tx_id, gtf_lines]
+    """
+    return record[0]
+
+def coordinate_key(record):
+    """
+        Returns:
+            (tuple): Sequence name and start of a record [component_key, tx_id, gtf_lines]
+    """
+    return line_key(record[2][0])
+
+class OutputSpill:
+    """
+        Temporary file for the selected transcripts of one annotation.
+        Each chromosome adds one run of records sorted by key,
+        merge() returns all records sorted by key.
+    """
+    def __init__(self, tmp_dir=None, key=component_key):
+        """
+            Args:
+                tmp_dir (str): Directory for the temporary file.
+                key (function): Key of the records, component_key() or coordinate_key()
+        """
+        self.file = tempfile.TemporaryFile(dir=tmp_dir)
+        self.key = key
+        # self.runs = [[first_key, last_key, byte_offset, numb_records]]
+        self.runs = []
+
+    def add_run(self, records):
+        """
+            Args:
+                records (list(list)): List of [component_key, tx_id, gtf_lines]
+                                      sorted by component_key
+        """
+        if not records:
+            return
+        records = sorted(records, key=self.key)
+        self.file.seek(0, 2)
+        self.runs.append([self.key(records[0]), self.key(records[-1]), \
+            self.file.tell(), len(records)])
+        for r in records:
+            pickle.dump(r, self.file, pickle.HIGHEST_PROTOCOL)
+
+    def __read_chain__(self, chain):
+        # read runs that don't overlap one after another
+        for first_key, last_key, pos, numb_records in chain:
+            for i in range(numb_records):
+                self.file.seek(pos)
+                record = pickle.load(self.file)
+                pos = self.file.tell()
+                yield record
+
+    def merge(self):
+        """
+            Yields:
+                (list): Records of all runs sorted by key.
+        """
+        # put runs with disjoint key ranges into the same chain,
+        # usually this results in one chain per input annotation
+        chains = []
+        for run in sorted(self.runs, key=lambda r:r[0]):
+            for c in chains:
+                if c[-1][1] < run[0]:
+                    c.append(run)
+                    break
+            else:
+                chains.append([run])
+        return heapq.merge(*[self.__read_chain__(c) for c in chains], \
+            key=self.key)
+
+    def close(self):
+        self.file.close()
+
+def read_region(blocks, chr, start, end, anno_id, fix_ids=False):
+    """
+        Read all transcripts of a gene prediction file that overlap a region.
+        The region that is read is extended until it includes all lines of
+        these transcripts.
+
+        Args:
+            blocks (ChrBlocks or TabixIndex): Index of the gene prediction file
+            chr (str): Chromosome name
+            start (int): Start of the region
+            end (int): End of the region
+            anno_id (str): Annotation ID
+            fix_ids (boolean): Add chromosome and strand to the transcript
+                               and gene IDs, see Anno.
+
+        Returns:
+            (Anno): Annotation with all transcripts that overlap the region.
+            (int): Start of the region covered by these transcripts.
+            (int): End of the region covered by these transcripts.
+    """
+    read_start, read_end = start, end
+    while True:
+        anno = Anno(blocks.path, anno_id, fix_ids=fix_ids)
+        anno.addGtf(blocks.rows(chr, read_start, read_end))
+        selected = [tx for tx in anno.transcripts.values() \
+            if tx.start <= end and tx.end >= start]
+        tx_start = min([read_start] + [tx.start for tx in selected])
+        tx_end = max([read_end] + [tx.end for tx in selected])
+        if tx_start == read_start and tx_end == read_end:
+            break
+        read_start, read_end = tx_start, tx_end
+    selected = set([tx.id for tx in selected])
+    for tx_id in list(anno.transcripts.keys()):
+        if tx_id not in selected:
+            del anno.transcripts[tx_id]
+    anno.norm_tx_format()
+    return anno, read_start, read_end
+
+def select_chr(chr, gtf_blocks, hint_blocks, para, verbose=0, hint_db=None, \
+    start=None, end=None, fix_ids=False):
+    """
+        Read all gene predictions and hints of one chromosome, build the
+        overlap graph and select transcripts.
+
+        Args:
+            chr (str): Chromosome name
+            gtf_blocks (list(ChrBlocks)): Index of each gene prediction file
+            hint_blocks (list(ChrBlocks)): Index of each hintfile
+            para (dict(float)): Parameter and source weights, sources
+                                without weight get weight 1
+            verbose (int): Verbose mode if verbose > 0.
+            hint_db (HintDB): Hints are taken from hint_db instead of
+                              hint_blocks if it is set.
+            start (int): Only transcripts that overlap [start, end] are
+                         selected, all transcripts of chr if start is None.
+            end (int): End of the region.
+            fix_ids (boolean): Add chromosome and strand to the transcript
+                               and gene IDs of the gene predictions.
+
+        Returns:
+            (list(tuple(int))): Keys of all components of the chromosome.
+            (list(list(list))): For each annotation a list of [component_key,
+                                tx_id, gtf_lines] of all selected transcripts.
+            (list(str)): Sources that had no weight in para.
+            (dict): Statistics of the chromosome, number of duplicate
+                    transcripts of each annotation ('duplicate_tx') and
+                    [lookups, hits] of features ('feature_lookups') and
+                    [skipped, total] feature evaluations ('skipped_features').
+    """
+    anno = []
+    hint_start, hint_end = start, end
+    for i, blocks in enumerate(gtf_blocks):
+        if start is None:
+            anno.append(Anno(blocks.path, 'anno{}'.format(i+1), fix_ids=fix_ids))
+            anno[-1].addGtf(blocks.rows(chr))
+            anno[-1].norm_tx_format()
+        else:
+            # hints are only needed in the region of the transcripts
+            a, read_start, read_end = read_region(blocks, chr, start, end, \
+                'anno{}'.format(i+1), fix_ids)
+            anno.append(a)
+            hint_start = min(hint_start, read_start)
+            hint_end = max(hint_end, read_end)
+
+    if hint_db is None:
+        evi = Evidence()
+        for blocks in hint_blocks:
+            evi.add_hintfile(blocks.path, blocks.rows(chr, hint_start, hint_end))
+    else:
+        evi = hint_db.get_evidence(chr)
+    para = para.copy()
+    new_src = []
+    for src in evi.src:
+        if src not in para.keys():
+            new_src.append(src)
+            para.update({src : 1})
+    evi.set_weights(para)
+
+    graph = Graph(anno, para=para, verbose=verbose)
+    graph.build()
+    graph.add_node_features(evi)
+    combined_prediction = graph.get_decided_graph()
+
+    # a component is identified across chromosomes by its first node in
+    # the order of the in-memory pipeline: (annotation, line in gtf file)
+    anno_index = {a.id : i for i, a in enumerate(anno)}
+    component_keys = []
+    for component in graph.components:
+        tx = graph.__tx__(component[0])
+        component_keys.append((anno_index[tx.source_anno], tx.line_number))
+
+    records = []
+    for a in anno:
+        records.append([])
+        for tx_id, component_id in combined_prediction[a.id]:
+            key = component_keys[int(component_id.split('_')[1]) - 1]
+            records[-1].append([key, tx_id, a.transcripts[tx_id].get_gtf(a.id)])
+    stats = {'duplicate_tx' : [graph.duplicate_tx[a.id] for a in anno], \
+        'feature_lookups' : graph.feature_lookups, \
+        'skipped_features' : graph.skipped_features}
+    return component_keys, records, new_src, stats
+
+# arguments of select_chr() in a worker process, set by init_worker()
+worker_args = []
+
+def init_worker(gtf_blocks, hint_blocks, para, verbose, hint_db, fix_ids):
+    global worker_args
+    worker_args = [gtf_blocks, hint_blocks, para, verbose, hint_db, fix_ids]
+
+def select_chr_worker(task):
+    """
+        select_chr() in a worker process.
+
+        Args:
+            task (list): chr, start and end of the region
+
+        Returns:
+            (list): task and the results of select_chr()
+    """
+    chr, start, end = task
+    gtf_blocks, hint_blocks, para, verbose, hint_db, fix_ids = worker_args
+    return [task] + list(select_chr(chr, gtf_blocks, hint_blocks, para, \
+        verbose, hint_db, start, end, fix_ids))
+
+def task_name(task):
+    """
+        Returns:
+            (str): Name of a chromosome or region
+    """
+    if task[1] is None:
+        return task[0]
+    return '{}:{}-{}'.format(*task)
+
+class ChrStream:
+    """
+        Streaming version of the TSEBRA pipeline. Inputs are read, and
+        transcripts are selected one chromosome at a time. The output is
+        identical to the output of the in-memory pipeline.
+    """
+    def __init__(self, gtf, hintfiles, para, verbose=0, quiet=False, tmp_dir=None, \
+        threads=1, hint_db=None, regions=None, sort=False, fix_ids=False, \
+        index_dir=''):
+        """
+            Args:
+                gtf (list(str)): Paths to gene prediction files
+                hintfiles (list(str)): Paths to hintfiles
+                para (dict(float)): Parameter and source weights
+                verbose (int): Verbose mode if verbose > 0.
+                quiet (boolean): Quiet mode.
+                tmp_dir (str): Directory for temporary files.
+                threads (int): Number of worker processes, each processes
+                               one chromosome at a time.
+                hint_db (HintDB): HintDB of the hintfiles, the hintfiles
+                                  aren't read if it is set.
+                regions (list(list)): [chr, start, end] of each region, start
+                                      and end are None for a whole chromosome.
+                                      All chromosomes if regions is None.
+                sort (boolean): Sort the output by sequence name and start.
+                fix_ids (boolean): Add chromosome and strand to the transcript
+                                   and gene IDs of the gene predictions.
+                index_dir (str): Directory for the indices of the input files,
+                                 they are saved for later runs if it is set.
+        """
+        self.para = para
+        self.v = verbose
+        self.quiet = quiet
+        self.threads = threads
+        self.regions = regions
+        self.gtf_blocks = [input_index(g, index_dir, tmp_dir) for g in gtf]
+        self.hint_db = hint_db
+        self.hint_blocks = []
+        if hint_db is None:
+            self.hint_blocks = [input_index(h, index_dir, tmp_dir) for h in hintfiles]
+        self.sort = sort
+        self.fix_ids = fix_ids
+        key = component_key
+        if sort:
+            key = coordinate_key
+        self.spill = [OutputSpill(tmp_dir, key) for g in gtf]
+        # keys of all components of all chromosomes
+        self.component_keys = []
+        # self.duplicate_tx[anno_id] = number of duplicate transcripts
+        self.duplicate_tx = {'anno{}'.format(i+1) : 0 for i in range(len(gtf))}
+        # [lookups, hits] of features of all chromosomes
+        self.feature_lookups = [0, 0]
+        # [skipped, total] evaluations of features of all chromosomes
+        self.skipped_features = [0, 0]
+
+    def chromosomes(self):
+        """
+            Returns:
+                (list(str)): Names of all chromosomes with gene predictions.
+        """
+        chr_list = []
+        for blocks in self.gtf_blocks:
+            chr_list += [c for c in blocks.chromosomes() if c not in chr_list]
+        return chr_list
+
+    def tasks(self):
+        """
+            Returns:
+                (list(list)): [chr, start, end] of all chromosomes or regions
+        """
+        if self.regions is not None:
+            return self.regions
+        return [[chr, None, None] for chr in self.chromosomes()]
+
+    def chr_size(self, chr):
+        """
+            Returns:
+                (int): Number of bytes of all input lines of a chromosome.
+        """
+        size = sum([b.size(chr) for b in self.gtf_blocks + self.hint_blocks])
+        if self.hint_db is not None:
+            size += self.hint_db.size(chr)
+        return size
+
+    def run(self):
+        """
+            Select transcripts for each chromosome and store them in
+            temporary files. With more than one thread, chromosomes are
+            processed in parallel, largest first. The result does not depend
+            on the order in which chromosomes finish.
+        """
+        tasks = self.tasks()
+        chr_list = self.chromosomes()
+        for task in tasks:
+            if task[0] not in chr_list:
+                sys.stderr.write('WARNING: Sequence {} is not in any gene '.format(\
+                    task[0]) + 'prediction file.\n')
+        if self.threads < 2:
+            for chr, start, end in tasks:
+                if not self.quiet:
+                    sys.stderr.write('### SELECT TRANSCRIPTS OF SEQUENCE: [{}]\n'.format(\
+                        task_name([chr, start, end])))
+                self.add_chr_result(*select_chr(chr, self.gtf_blocks, \
+                    self.hint_blocks, self.para, self.v, self.hint_db, start, end, \
+                    self.fix_ids))
+            return
+
+        tasks = sorted(tasks, key=lambda t:-self.chr_size(t[0]))
+        with multiprocessing.Pool(self.threads, init_worker, (self.gtf_blocks, \
+            self.hint_blocks, self.para, self.v, self.hint_db, self.fix_ids)) as pool:
+            for result in pool.imap_unordered(select_chr_worker, tasks):
+                if not self.quiet:
+                    sys.stderr.write('### SELECTED TRANSCRIPTS OF SEQUENCE: [{}]\n'.format(\
+                        task_name(result[0])))
+                self.add_chr_result(*result[1:])
+
+    def add_chr_result(self, component_keys, records, new_src=[], stats={}):
+        """
+            Args:
+                component_keys (list(tuple(int))): Keys of the components of a chromosome.
+                records (list(list(list))): Selected transcripts for each annotation.
+                new_src (list(str)): Sources without weight in the configuration.
+                stats (dict): Statistics of the chromosome, see select_chr().
+        """
+        for i, numb in enumerate(stats.get('duplicate_tx', [])):
+            self.duplicate_tx['anno{}'.format(i+1)] += numb
+        for i, numb in enumerate(stats.get('feature_lookups', [])):
+            self.feature_lookups[i] += numb
+        for i, numb in enumerate(stats.get('skipped_features', [])):
+            self.skipped_features[i] += numb
+        for src in new_src:
+            if src not in self.para.keys():
+                sys.stderr.write('ConfigError: No weight for src={}, it is set to 1\n'.format(src))
+                self.para.update({src : 1})
+        self.component_keys += component_keys
+        for spill, r in zip(self.spill, records):
+            spill.add_run(r)
+
+    def write(self, out, bgzf=False):
+        """
+            Write the combined gene prediction, sorted by sequence name and
+            start if self.sort is set.
+
+            Args:
+                out (str): Path to the output file.
+                bgzf (boolean): Write BGZF with a tabix index, requires self.sort.
+        """
+        self.component_keys.sort()
+
+        def spill_gtf(i, spill):
+            # gtf lines of each transcript of a spill with the final IDs
+            for key, tx_id, gtf in spill.merge():
+                gene_id = 'g_{}'.format(bisect_left(self.component_keys, key) + 1)
+                yield set_gtf_ids(gtf, 'anno{}.{}'.format(i+1, tx_id), gene_id)
+
+        with GtfWriter(out, self.sort, bgzf=bgzf) as writer:
+            for i, spill in enumerate(self.spill):
+                writer.add(spill_gtf(i, spill))
+        self.close()
+
+    def close(self):
+        """
+            Remove the temporary files.
+        """
+        for spill in self.spill:
+            spill.close()
+        for blocks in self.gtf_blocks + self.hint_blocks:
+            if isinstance(blocks, ChrBlocks):
+                blocks.close()
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# compressed.py: Transparent reading of plain, gzip and BGZF
+# compressed input files, and writing of BGZF files.
+# ==============================================================
+import io
+import os
+import gzip
+import zlib
+import queue
+import struct
+import threading
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+class BgzfError(Exception):
+    pass
+
+# number of threads that decompress or compress BGZF blocks
+BGZF_THREADS = min(4, os.cpu_count() or 1)
+# maximal number of uncompressed bytes of a BGZF block (same as bgzip)
+BGZF_BLOCK_SIZE = 0xff00
+# size of the chunks that PrefetchReader reads ahead, and their maximal number
+PREFETCH_CHUNK_SIZE = 1 << 20
+PREFETCH_CHUNKS = 32
+# empty BGZF block at the end of a file
+BGZF_EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+def file_format(path):
+    """
+        Returns:
+            (str): 'bgzf', 'gzip' or 'plain'
+    """
+    with open(path, 'rb') as file:
+        header = file.read(18)
+    if not header[:2] == b'\x1f\x8b':
+        return 'plain'
+    # BGZF: gzip member with the extra subfield 'BC' (block size)
+    if len(header) == 18 and header[3] & 4 and header[12:14] == b'BC':
+        return 'bgzf'
+    return 'gzip'
+
+def open_file(path, binary=False, threads=None, prefetch=False):
+    """
+        Open a plain, gzip or BGZF compressed file for reading.
+
+        Args:
+            path (str): Path to the file.
+            binary (boolean): Read bytes instead of text.
+            threads (int): Number of threads for the decompression of BGZF blocks.
+            prefetch (boolean): Read and decompress the file ahead of the
+                                current position in a background thread,
+                                see PrefetchReader.
+
+        Returns:
+            (file object): Readable file, seekable by offsets in the
+                           uncompressed data (not with prefetch).
+    """
+    if prefetch:
+        file = io.BufferedReader(PrefetchReader(path, threads), 1 << 16)
+        if binary:
+            return file
+        return io.TextIOWrapper(file)
+    format = file_format(path)
+    if format == 'plain':
+        return open(path, 'rb' if binary else 'r')
+    if format == 'gzip':
+        return gzip.open(path, 'rb' if binary else 'rt')
+    file = io.BufferedReader(BgzfReader(path, threads), 1 << 16)
+    if binary:
+        return file
+    return io.TextIOWrapper(file)
+
+def inflate_block(cdata, crc, isize):
+    """
+        Returns:
+            (bytes): Uncompressed data of a BGZF block.
+    """
+    data = zlib.decompress(cdata, -15)
+    if not len(data) == isize or not zlib.crc32(data) & 0xffffffff == crc:
+        raise BgzfError('Corrupt BGZF block.')
+    return data
+
+class BgzfReader(io.RawIOBase):
+    """
+        Reader for BGZF files. The blocks ahead of the current position
+        are decompressed in parallel by a pool of threads.
+    """
+    def __init__(self, path, threads=None):
+        """
+            Args:
+                path (str): Path to a BGZF file.
+                threads (int): Number of threads, BGZF_THREADS if None.
+        """
+        self.file = open(path, 'rb')
+        self.threads = threads or BGZF_THREADS
+        self.pool = ThreadPoolExecutor(self.threads)
+        # offsets of all blocks found so far, in the file and in the
+        # uncompressed data, the last entry is the offset of the next block
+        self.block_offsets = [0]
+        self.data_offsets = [0]
+        # decompressed blocks ahead of the current position
+        self.pending = deque()
+        # current block, position in it and in the uncompressed data
+        self.data = b''
+        self.data_pos = 0
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        if not self.closed:
+            self.pool.shutdown(wait=False)
+            self.file.close()
+        super().close()
+
+    def __next_block__(self):
+        # read the block at the current offset of self.file,
+        # returns its data without decompression or None at the end
+        header = self.file.read(18)
+        if len(header) == 0:
+            return None
+        if len(header) < 18 or not header[:4] == b'\x1f\x8b\x08\x04':
+            raise BgzfError('{} is not in BGZF format.'.format(self.file.name))
+        xlen = struct.unpack('<H', header[10:12])[0]
+        extra = header[12:] + self.file.read(xlen - 6)
+        bsize = None
+        i = 0
+        while i + 4 <= len(extra):
+            slen = struct.unpack('<H', extra[i+2:i+4])[0]
+            if extra[i:i+2] == b'BC':
+                bsize = struct.unpack('<H', extra[i+4:i+6])[0]
+            i += 4 + slen
+        if bsize is None:
+            raise BgzfError('{} is not in BGZF format.'.format(self.file.name))
+        block = self.file.read(bsize - xlen - 11)
+        crc, isize = struct.unpack('<II', block[-8:])
+        start = self.file.tell() - bsize - 1
+        if start == self.block_offsets[-1]:
+            self.block_offsets.append(self.file.tell())
+            self.data_offsets.append(self.data_offsets[-1] + isize)
+        return block[:-8], crc, isize
+
+    def __fill__(self):
+        # decompress the next blocks in the thread pool
+        while len(self.pending) < 4 * self.threads:
+            block = self.__next_block__()
+            if block is None:
+                break
+            self.pending.append(self.pool.submit(inflate_block, *block))
+
+    def readinto(self, buffer):
+        while self.data_pos == len(self.data):
+            self.__fill__()
+            if not self.pending:
+                return 0
+            self.data = self.pending.popleft().result()
+            self.data_pos = 0
+        n = min(len(buffer), len(self.data) - self.data_pos)
+        buffer[:n] = self.data[self.data_pos:self.data_pos + n]
+        self.data_pos += n
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif not whence == io.SEEK_SET:
+            raise io.UnsupportedOperation('BgzfReader only seeks from the start.')
+        for future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        # extend the block index without decompressing until it includes offset
+        self.file.seek(self.block_offsets[-1])
+        while self.data_offsets[-1] <= offset and self.__next_block__() is not None:
+            pass
+        i = max(bisect_right(self.data_offsets, offset) - 1, 0)
+        self.file.seek(self.block_offsets[i])
+        self.data = b''
+        self.data_pos = 0
+        self.pos = self.data_offsets[i]
+        # skip to offset in the block
+        skip = offset - self.pos
+        while skip > 0:
+            n = self.readinto(bytearray(min(skip, 1 << 16)))
+            if n == 0:
+                # behind the end of the data, like a plain file
+                self.pos = offset
+                break
+            skip -= n
+        return self.pos
+
+class PrefetchReader(io.RawIOBase):
+    """
+        Reader for plain, gzip or BGZF files that reads and decompresses
+        the file in a background thread, up to PREFETCH_CHUNKS chunks ahead
+        of the current position. Waiting for the storage (e.g. a network
+        file system) and the decompression overlap with the processing of
+        the lines in the main thread, and with the reading of other files.
+    """
+    def __init__(self, path, threads=None):
+        """
+            Args:
+                path (str): Path to the file.
+                threads (int): Number of threads for the decompression of
+                               BGZF blocks.
+        """
+        self.path = path
+        # chunks of uncompressed data, b'' at the end of the file or the
+        # exception of the background thread
+        self.chunks = queue.Queue(PREFETCH_CHUNKS)
+        self.stopped = threading.Event()
+        # current chunk and position in it
+        self.data = b''
+        self.data_pos = 0
+        self.eof = False
+        self.thread = threading.Thread(target=self.__read_ahead__, args=(threads,), \
+            daemon=True)
+        self.thread.start()
+
+    def readable(self):
+        return True
+
+    def close(self):
+        # the background thread stops at its next chunk
+        self.stopped.set()
+        super().close()
+
+    def __read_ahead__(self, threads):
+        try:
+            with open_file(self.path, binary=True, threads=threads) as file:
+                while not self.stopped.is_set():
+                    chunk = file.read(PREFETCH_CHUNK_SIZE)
+                    self.__put__(chunk)
+                    if not chunk:
+                        break
+        except Exception as error:
+            self.__put__(error)
+
+    def __put__(self, item):
+        # wait until the main thread has read a chunk, or closed the reader
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def readinto(self, buffer):
+        if self.data_pos == len(self.data):
+            if self.eof:
+                return 0
+            chunk = self.chunks.get()
+            if isinstance(chunk, Exception):
+                self.eof = True
+                raise chunk
+            self.data = memoryview(chunk)
+            self.data_pos = 0
+            if not chunk:
+                self.eof = True
+                return 0
+        n = min(len(buffer), len(self.data) - self.data_pos)
+        buffer[:n] = self.data[self.data_pos:self.data_pos + n]
+        self.data_pos += n
+        return n
+
+def deflate_block(data, level=6):
+    """
+        Returns:
+            (bytes): BGZF block of data.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+    return b'\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0' \
+        + struct.pack('<H', len(cdata) + 25) + cdata \
+        + struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+class BgzfWriter:
+    """
+        Writer for BGZF files. Full blocks are compressed by a pool of
+        threads while the next blocks are filled.
+    """
+    def __init__(self, path, threads=None, level=6, block_size=BGZF_BLOCK_SIZE):
+        """
+            Args:
+                path (str): Path to the BGZF file.
+                threads (int): Number of threads, BGZF_THREADS if None.
+                level (int): Compression level.
+                block_size (int): Number of uncompressed bytes of a block.
+        """
+        self.file = open(path, 'wb')
+        self.threads = threads or BGZF_THREADS
+        self.pool = ThreadPoolExecutor(self.threads)
+        self.level = level
+        self.block_size = block_size
+        # uncompressed data of the current block
+        self.data = bytearray()
+        # number of blocks before the current block
+        self.numb_blocks = 0
+        # blocks that are compressed but not written
+        self.pending = deque()
+        # offsets of the written blocks in the file,
+        # the last entry is the offset of the next block
+        self.block_offsets = [0]
+        self.closed = False
+
+    def write(self, data):
+        """
+            Args:
+                data (str or bytes): Data to append, str is UTF-8 encoded.
+
+            Returns:
+                (int): Number of bytes written.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        self.data += data
+        while len(self.data) >= self.block_size:
+            self.__submit__(bytes(self.data[:self.block_size]))
+            del self.data[:self.block_size]
+        return len(data)
+
+    def tell(self):
+        """
+            Returns:
+                (int): Position in the uncompressed data as number of the
+                       block << 16 | offset in the block, see virtual_offset().
+        """
+        return self.numb_blocks << 16 | len(self.data)
+
+    def virtual_offset(self, pos):
+        """
+            Args:
+                pos (int): Position from tell() in a block that was written.
+
+            Returns:
+                (int): Virtual file offset of the position.
+        """
+        return self.block_offsets[pos >> 16] << 16 | pos & 0xffff
+
+    def __submit__(self, data):
+        # compress a block in the thread pool, write finished blocks
+        self.pending.append(self.pool.submit(deflate_block, data, self.level))
+        self.numb_blocks += 1
+        while len(self.pending) > 4 * self.threads:
+            self.__write_block__()
+
+    def __write_block__(self):
+        block = self.pending.popleft().result()
+        self.file.write(block)
+        self.block_offsets.append(self.block_offsets[-1] + len(block))
+
+    def close(self):
+        """
+            Write all blocks and the EOF block and close the file.
+        """
+        if self.closed:
+            return
+        if self.data:
+            self.__submit__(bytes(self.data))
+            self.data = bytearray()
+        while self.pending:
+            self.__write_block__()
+        self.file.write(BGZF_EOF)
+        self.pool.shutdown()
+        self.file.close()
+        self.closed = True
@@ -4,7 +4,17 @@
 #
 # evdence.py: Handles the extrinsic evidence from the hintfiles
 # ==============================================================
+import io
 import csv
+from array import array
+from bisect import bisect_left
+
+from compressed import open_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 class NotGtfFormat(Exception):
     pass
@@ -12,6 +22,29 @@ class NotGtfFormat(Exception):
 class AttributeMissing(Exception):
     pass
 
+# hint types used by TSEBRA and their name in the evidence index,
+# hints of all other types (e.g. exonpart, CDSpart, dss, ass) are skipped
+HINT_TYPES = {'intron' : 'intron', 'start' : 'start', 'stop' : 'stop', \
+    'start_codon' : 'start', 'stop_codon' : 'stop'}
+
+def get_src_mult(line):
+    """
+        Args:
+            line (list(str)): GFF line of a hint
+
+        Returns:
+            (str): Source of the hint
+            (str): Multiplicity of the hint
+    """
+    attribute = line[8]
+    try:
+        src = attribute.split('src=')[1].split(';')[0]
+    except IndexError:
+        raise AttributeMissing('Source of Hint is missing in line {}.'.format(line))
+    if 'mult=' in attribute:
+        return src, attribute.split('mult=')[1].split(';')[0]
+    return src, '1'
+
 class Hint:
     """
         Class handling the data structures and methods for a hint
@@ -31,17 +64,7 @@ class Hint:
             self.score, self.strand, self.phase, attribute = line
         self.start = int(self.start)
         self.end = int(self.end)
-
-        try:
-            self.src = attribute.split('src=')[1].split(';')[0]
-        except IndexError:
-            raise AttributeMissing('Source of Hint is missing in line {}.'.format(line))
-
-        self.mult = ''
-        if 'mult=' in attribute:
-            self.mult = attribute.split('mult=')[1].split(';')[0]
-        else:
-            self.mult= '1'
+        self.src, self.mult = get_src_mult(line)
 
         self.pri = ''
         if 'pri=' in attribute:
@@ -69,16 +92,22 @@ class Hintfile:
     """
         Class handling the data structures and methods for a hintfile
     """
-    def __init__(self, path):
+    def __init__(self, path, rows=None):
         """
             Args:
                 path (str): Path to the hintfile.
+                rows (iterable(int, list(str))): Line numbers and lines of the
+                                                 hintfile, the whole file is
+                                                 read if rows is None.
         """
         # dictonary containing evidence
         # self.hints[chromosom_id] = [Hints()]
         self.hints = {}
         self.src = set()
-        self.read_file(path)
+        if rows is None:
+            self.read_file(path)
+        else:
+            self.add_rows(rows)
 
     def read_file(self, path):
         """
@@ -86,16 +115,248 @@ class Hintfile:
             and create a dict of Hints.
         """
         #
-        with open(path, 'r') as file:
-            hints_csv = csv.reader(file, delimiter='\t')
-            for line in hints_csv:
-                if line[0][0] == '#':
-                    continue
-                new_hint = Hint(line)
-                if not new_hint.chr in self.hints.keys():
-                    self.hints.update({new_hint.chr : []})
-                self.hints[new_hint.chr].append(new_hint)
-                self.src.add(new_hint.src)
+        with open_file(path) as file:
+            self.add_rows(enumerate(csv.reader(file, delimiter='\t')))
+
+    def add_rows(self, rows):
+        """
+            Create Hints from lines of a gff file.
+
+            Args:
+                rows (iterable(int, list(str))): Line numbers and lines of a gff file
+        """
+        for line_number, line in rows:
+            if line[0][0] == '#':
+                continue
+            new_hint = Hint(line)
+            if not new_hint.chr in self.hints.keys():
+                self.hints.update({new_hint.chr : []})
+            self.hints[new_hint.chr].append(new_hint)
+            self.src.add(new_hint.src)
+
+# minimal number of new hints in HintArrays before they are merged
+COMPACT_SIZE = 1 << 16
+
+class HintArrays:
+    """
+        Hints of one sequence, type and strand as arrays sorted by
+        coordinates. New hints are collected by add() and merged into the
+        sorted arrays by compact().
+    """
+    def __init__(self):
+        # self.keys[i] = start << 32 | end of the i-th hint
+        self.keys = array('Q')
+        # sources and multiplicities of the i-th hint are
+        # self.src[self.offset[i]:self.offset[i+1]] and
+        # self.mult[self.offset[i]:self.offset[i+1]]
+        self.offset = array('I', [0])
+        self.src = array('H')
+        self.mult = array('q')
+        # self.weighted_mult[j] = self.mult[j] weighted by the source self.src[j],
+        # None if no weights are set (see set_weights())
+        self.weighted_mult = None
+        # hints added since the last compact(), in input order
+        self.new_keys = array('Q')
+        self.new_src = array('H')
+        self.new_mult = array('q')
+
+    def __len__(self):
+        return len(self.keys)
+
+    def set_arrays(self, keys, offset, src, mult):
+        """
+            Use existing arrays or memoryviews of merged hints, e.g. from a HintDB.
+        """
+        self.keys = keys
+        self.offset = offset
+        self.src = src
+        self.mult = mult
+        self.weighted_mult = None
+
+    def add(self, start, end, src, mult):
+        """
+            Args:
+                start (int): Start coordinate
+                end (int): End coordinate
+                src (int): Source code
+                mult (int): Multiplicity
+        """
+        self.new_keys.append(start << 32 | end)
+        self.new_src.append(src)
+        self.new_mult.append(mult)
+        # merge when the new hints outnumber the merged ones, this keeps
+        # the memory close to the aggregated hints at linear total cost
+        if len(self.new_keys) >= max(COMPACT_SIZE, len(self.src)):
+            self.compact()
+
+    def compact(self):
+        """
+            Merge the hints added since the last compact() into the sorted
+            arrays. Multiplicities of hints with the same coordinates and
+            source are added up, the sources of a hint are kept in order of
+            their first occurrence.
+        """
+        if len(self.new_keys) == 0:
+            return
+        if np is None:
+            self.__compact_lists__()
+        else:
+            self.__compact_arrays__()
+        self.new_keys = array('Q')
+        self.new_src = array('H')
+        self.new_mult = array('q')
+        self.weighted_mult = None
+
+    def __compact_lists__(self):
+        hints = {}
+        for i, key in enumerate(self.keys):
+            hints.update({key : {}})
+            for j in range(self.offset[i], self.offset[i+1]):
+                hints[key].update({self.src[j] : self.mult[j]})
+        for key, src, mult in zip(self.new_keys, self.new_src, self.new_mult):
+            if key not in hints.keys():
+                hints.update({key : {}})
+            if src not in hints[key].keys():
+                hints[key].update({src : 0})
+            hints[key][src] += mult
+        self.keys = array('Q', sorted(hints.keys()))
+        self.offset = array('I', [0])
+        self.src = array('H')
+        self.mult = array('q')
+        for key in self.keys:
+            for src, mult in hints[key].items():
+                self.src.append(src)
+                self.mult.append(mult)
+            self.offset.append(len(self.src))
+
+    def __compact_arrays__(self):
+        offset = np.frombuffer(self.offset, dtype='I').astype(np.int64)
+        keys = np.concatenate([np.repeat(np.frombuffer(self.keys, dtype=np.uint64), \
+            np.diff(offset)), np.frombuffer(self.new_keys, dtype=np.uint64)])
+        src = np.concatenate([np.frombuffer(self.src, dtype='H'), \
+            np.frombuffer(self.new_src, dtype='H')])
+        mult = np.concatenate([np.frombuffer(self.mult, dtype=np.int64), \
+            np.frombuffer(self.new_mult, dtype=np.int64)])
+
+        # add up the multiplicities of each pair of coordinates and source
+        occurrence = np.arange(len(keys))
+        order = np.lexsort((occurrence, src, keys))
+        keys, src, mult = keys[order], src[order], mult[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = (keys[1:] != keys[:-1]) | (src[1:] != src[:-1])
+        first = np.flatnonzero(first)
+        mult = np.add.reduceat(mult, first)
+        keys, src, occurrence = keys[first], src[first], order[first]
+
+        # sources of a hint in order of their first occurrence
+        order = np.lexsort((occurrence, keys))
+        keys, src, mult = keys[order], src[order], mult[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        first = np.flatnonzero(first)
+        self.keys = to_array('Q', keys[first])
+        self.offset = to_array('I', np.append(first, len(keys)))
+        self.src = to_array('H', src)
+        self.mult = to_array('q', mult)
+
+    def merge(self, other, src_map):
+        """
+            Add all hints of another HintArrays, e.g. of another hintfile.
+
+            Args:
+                other (HintArrays): Hints that are added.
+                src_map (list(int)): Source code in self for each source code in other.
+        """
+        other.compact()
+        if len(other) == 0:
+            return
+        if np is None:
+            for i, key in enumerate(other.keys):
+                for j in range(other.offset[i], other.offset[i+1]):
+                    self.new_keys.append(key)
+                    self.new_src.append(src_map[other.src[j]])
+                    self.new_mult.append(other.mult[j])
+        else:
+            offset = np.frombuffer(other.offset, dtype='I').astype(np.int64)
+            self.new_keys.extend(to_array('Q', np.repeat(np.frombuffer(other.keys, \
+                dtype=np.uint64), np.diff(offset))))
+            self.new_src.extend(to_array('H', np.array(src_map)[np.frombuffer(\
+                other.src, dtype='H')]))
+            self.new_mult.extend(array('q', other.mult))
+        self.compact()
+
+    def set_weights(self, weight):
+        """
+            Weight the multiplicity of each source of each hint. The terms
+            aren't added up, so that the scores of transcripts can add all
+            terms in one sum.
+
+            Args:
+                weight (list(float)): Weight of each source code.
+        """
+        if np is None:
+            self.weighted_mult = array('d', [weight[s] * m for s, m in \
+                zip(self.src, self.mult)])
+            return
+        self.weighted_mult = to_array('d', np.array(weight, dtype=np.float64)[\
+            np.frombuffer(self.src, dtype='H')] * np.frombuffer(self.mult, dtype=np.int64))
+
+    def get(self, start, end):
+        """
+            Args:
+                start (int): Start coordinate
+                end (int): End coordinate
+
+            Returns:
+                (int): Index of the hint in self.keys, -1 if there is no hint
+                       with these coordinates.
+        """
+        key = int(start) << 32 | int(end)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+        return -1
+
+    def src_mult(self, i):
+        """
+            Returns:
+                (list(tuple(int))): Source code and multiplicity of each source of the i-th hint.
+        """
+        return [(self.src[j], self.mult[j]) for j in range(self.offset[i], \
+            self.offset[i+1])]
+
+    def find(self, start, end):
+        """
+            Look up many hints at once.
+
+            Args:
+                start (numpy.ndarray): Start coordinates
+                end (numpy.ndarray): End coordinates
+
+            Returns:
+                (numpy.ndarray): Index of each hint in self.keys, -1 if
+                                 there is no hint with these coordinates.
+                                 A list if NumPy isn't available.
+        """
+        if np is None:
+            return [self.get(s, e) for s, e in zip(start, end)]
+        if len(self.keys) == 0:
+            return np.full(len(start), -1, dtype=np.int64)
+        keys = np.frombuffer(self.keys, dtype=np.uint64)
+        query = np.left_shift(np.asarray(start).astype(np.uint64), np.uint64(32)) \
+            | np.asarray(end).astype(np.uint64)
+        pos = np.searchsorted(keys, query)
+        pos[pos == len(keys)] = 0
+        return np.where(keys[pos] == query, pos, -1)
+
+def to_array(typecode, values):
+    """
+        Returns:
+            (array): Copy of a numpy.ndarray as array of typecode.
+    """
+    result = array(typecode)
+    result.frombytes(values.astype(result.typecode).tobytes())
+    return result
 
 class Evidence:
     """
@@ -103,36 +364,189 @@ class Evidence:
         from one or more hintfiles.
     """
     def __init__(self):
-        # hint_keys[chr][start_end_type_strand][src] = multiplicity
-        self.hint_keys = {}
+        # index of all hints
+        # self.index[(chr, type, strand)] = HintArrays()
+        self.index = {}
         self.src = set()
+        # sources in order of their first occurrence, position is the source code
+        self.src_list = []
+        self.src_code = {}
+        # source weights of the scores in the index, None if there are no scores
+        self.sw = None
+
+    def set_weights(self, hint_source_weight):
+        """
+            Fold the source weights into the index: the multiplicity of each
+            source of a hint is weighted once. Afterwards get_weighted()
+            returns these terms for a feature with a single lookup.
+            The multiplicities of each source remain available with get_hint().
+
+            Args:
+                hint_source_weight (dict(float)): Weight of each source.
+        """
+        self.sw = dict(hint_source_weight)
+        weight = [self.sw[src] for src in self.src_list]
+        for hint_arrays in self.index.values():
+            hint_arrays.set_weights(weight)
+
+    def add_hintfile(self, path_to_hintfile, rows=None, file=None):
+        """
+            Read hintfile. Hints are added to the index line by line,
+            only hints of a type in HINT_TYPES are kept.
+
+            Args:
+                path_to_hintfile (str): Path to the hintfile.
+                rows (iterable(int, list(str))): Line numbers and lines of the
+                                                 hintfile, the whole file is
+                                                 read if rows is None.
+                file (file object): The hintfile opened in binary mode, e.g.
+                                    with prefetch (see compressed.open_file),
+                                    it is opened here if None.
+        """
+        if rows is None:
+            if file is None:
+                file = open_file(path_to_hintfile, binary=True)
+            with io.TextIOWrapper(file) as text:
+                self.add_rows(enumerate(csv.reader(text, delimiter='\t')))
+        else:
+            self.add_rows(rows)
+        for hint_arrays in self.index.values():
+            hint_arrays.compact()
+        if self.sw is not None:
+            self.set_weights(self.sw)
+
+    def add_rows(self, rows):
+        """
+            Add hints from lines of a gff file.
+
+            Args:
+                rows (iterable(int, list(str))): Line numbers and lines of a gff file
+        """
+        for line_number, line in rows:
+            if line[0][0] == '#':
+                continue
+            if not len(line) == 9:
+                raise NotGtfFormat('File not in gtf Format. Error at line: {}'.format(line))
+            type = HINT_TYPES.get(line[2])
+            if type is None:
+                continue
+            src, mult = get_src_mult(line)
+            start, end, mult = int(line[3]), int(line[4]), int(mult)
+            # coordinates are packed into 64 bit keys, see HintArrays
+            if not (0 <= start < 1 << 32 and 0 <= end < 1 << 32):
+                raise NotGtfFormat('Coordinates have to be between 0 and 2^32-1. ' \
+                    + 'Error at line: {}'.format(line))
+            if not -(1 << 63) <= mult < 1 << 63:
+                raise NotGtfFormat('Multiplicity has to be a 64 bit integer. ' \
+                    + 'Error at line: {}'.format(line))
+            self.add_hint(line[0], type, line[6], start, end, src, mult)
 
-    def add_hintfile(self, path_to_hintfile):
-        """
-            Read hintfile
-        """
-        # read hintfile
-        hintfile = Hintfile(path_to_hintfile)
-        self.src = self.src.union(hintfile.src)
-        for chr in hintfile.hints.keys():
-            if chr not in self.hint_keys.keys():
-                self.hint_keys.update({chr : {}})
-            for hint in hintfile.hints[chr]:
-                new_key = '{}_{}_{}_{}'.format(hint.start, hint.end, \
-                    hint.type, hint.strand)
-                if not new_key in self.hint_keys[chr].keys():
-                    self.hint_keys[chr].update({new_key : {}})
-                if not hint.src in self.hint_keys[chr][new_key].keys():
-                    self.hint_keys[chr][new_key].update({hint.src : 0})
-                self.hint_keys[chr][new_key][hint.src] += int(hint.mult)
+    def add_hint(self, chr, type, strand, start, end, src, mult):
+        """
+            Add a hint to the index, it can be looked up after the next
+            compact() of its HintArrays.
+        """
+        if src not in self.src_code.keys():
+            self.src_code.update({src : len(self.src_list)})
+            self.src_list.append(src)
+            self.src.add(src)
+        key = (chr, type, strand)
+        if key not in self.index.keys():
+            self.index.update({key : HintArrays()})
+        self.index[key].add(start, end, self.src_code[src], mult)
+
+    def add_evidence(self, other):
+        """
+            Add all hints of another Evidence object, e.g. of a hintfile
+            read in another process. Adding the Evidence of each hintfile in
+            order gives the same index and source codes as reading the
+            hintfiles one after another.
+
+            Args:
+                other (Evidence): Evidence that is added.
+        """
+        src_map = []
+        for src in other.src_list:
+            if src not in self.src_code.keys():
+                self.src_code.update({src : len(self.src_list)})
+                self.src_list.append(src)
+                self.src.add(src)
+            src_map.append(self.src_code[src])
+        for key, hint_arrays in other.index.items():
+            if key not in self.index.keys():
+                self.index.update({key : HintArrays()})
+            self.index[key].merge(hint_arrays, src_map)
+        if self.sw is not None:
+            self.set_weights(self.sw)
 
     def get_hint(self, chr, start, end, type, strand):
         if type == 'start_codon':
             type = 'start'
         elif type == 'stop_codon':
             type = 'stop'
-        key = '{}_{}_{}_{}'.format(start, end, type, strand)
-        if chr in self.hint_keys.keys():
-            if key in self.hint_keys[chr].keys():
-                return self.hint_keys[chr][key]
-        return {}
+        hint_arrays = self.index.get((chr, type, strand))
+        if hint_arrays is None:
+            return {}
+        i = hint_arrays.get(start, end)
+        if i < 0:
+            return {}
+        hint = {}
+        for j in range(hint_arrays.offset[i], hint_arrays.offset[i+1]):
+            hint[self.src_list[hint_arrays.src[j]]] = hint_arrays.mult[j]
+        return hint
+
+    def get_weighted(self, chr, start, end, type, strand):
+        """
+            Args:
+                chr (str): Chromosome name
+                start (int): Start coordinate
+                end (int): End coordinate
+                type (str): Feature type, e.g. intron or start_codon
+                strand (str): Strand (+/-)
+
+            Returns:
+                (tuple(float)): Multiplicity of each source of the hint weighted
+                                by source, in order of the sources (see
+                                set_weights()), empty if there is no hint
+                                for the feature.
+        """
+        if type == 'start_codon':
+            type = 'start'
+        elif type == 'stop_codon':
+            type = 'stop'
+        hint_arrays = self.index.get((chr, type, strand))
+        if hint_arrays is None:
+            return ()
+        i = hint_arrays.get(start, end)
+        if i < 0:
+            return ()
+        return tuple(hint_arrays.weighted_mult[hint_arrays.offset[i]:\
+            hint_arrays.offset[i+1]])
+
+    def find_hints(self, chr, type, strand, start, end):
+        """
+            Look up many hints of one sequence, type and strand at once.
+
+            Args:
+                chr (str): Chromosome name
+                type (str): Hint type
+                strand (str): Strand (+/-)
+                start (numpy.ndarray): Start coordinates
+                end (numpy.ndarray): End coordinates
+
+            Returns:
+                (HintArrays): HintArrays of chr, type and strand, None if there are no hints.
+                (numpy.ndarray): Index of each hint in HintArrays, -1 if
+                                 there is no hint with these coordinates.
+        """
+        if type == 'start_codon':
+            type = 'start'
+        elif type == 'stop_codon':
+            type = 'stop'
+        hint_arrays = self.index.get((chr, type, strand))
+        if hint_arrays is None:
+            hint_arrays = HintArrays()
+        pos = hint_arrays.find(start, end)
+        if len(hint_arrays) == 0:
+            return None, pos
+        return hint_arrays, pos
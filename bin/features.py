@@ -5,61 +5,158 @@
 # features.py: Handles the features for a transcript
 # ==============================================================
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# line types with hints used for the features
+FEATURE_TYPES = ['intron', 'start_codon', 'stop_codon']
+
+class FeatureCache:
+    """
+        Memo table of the weighted hints of intron and start/stop codon features.
+        Each distinct feature is looked up once, transcripts that share a
+        feature (isoforms, identical gene models from different gene
+        predictions) use the stored result.
+    """
+    def __init__(self, evi, hint_source_weight):
+        """
+            Args:
+                evi (Evidence): Evidence class object containing all extrinsic evidence.
+                hint_source_weight (dict(int)): Weights for each evidence source.
+        """
+        self.evi = evi
+        self.sw = hint_source_weight
+        # use the weighted multiplicities of evi if they are weighted with
+        # hint_source_weight, otherwise weight the multiplicities of each hint
+        self.weighted = pre_weighted(evi, hint_source_weight)
+        # weighted multiplicities of all features that were looked up, an
+        # empty tuple for features without a hint, grouped by sequence, type
+        # and strand and keyed by the coordinates
+        # self.table[(chr, type, strand)] = {start << 32 | end : (weighted mult, ...)}
+        # (int keys and tuples of floats aren't tracked by the garbage
+        # collector, a large table doesn't slow down its collections)
+        self.table = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return sum([len(t) for t in self.table.values()])
+
+    def get(self, chr, start, end, type, strand):
+        """
+            Returns:
+                (tuple(float)): Multiplicity of each source of the hint
+                                weighted by source, in order of the sources.
+                                Empty if there is no hint for the feature.
+        """
+        self.lookups += 1
+        group = self.table.get((chr, type, strand))
+        if group is None:
+            group = {}
+            self.table.update({(chr, type, strand) : group})
+        key = start << 32 | end
+        if key in group:
+            self.hits += 1
+            return group[key]
+        if self.weighted:
+            terms = self.evi.get_weighted(chr, start, end, type, strand)
+        else:
+            hint = self.evi.get_hint(chr, start, end, type, strand)
+            terms = tuple([self.sw[src] * hint[src] for src in hint.keys()])
+        group.update({key : terms})
+        return terms
+
+def pre_weighted(evi, hint_source_weight):
+    """
+        Returns:
+            (boolean): True if the multiplicities of evi are weighted with
+                       hint_source_weight, see Evidence.set_weights().
+    """
+    return evi.sw is not None and evi.sw == hint_source_weight
+
 class Node_features:
     """
         Class handling the features for a transcripts.
         Features are scores that characterize the support of the transcript
-        by extrinsic evidence in different ways.
+        by extrinsic evidence in different ways. Each feature is computed
+        on its first access, see get_feature().
     """
-    def __init__(self, tx, evi, hint_source_weight={'P' : 0.1, 'E' : 10, 'C' : 5,  'M' : 1}):
+    def __init__(self, tx, evi, hint_source_weight={'P' : 0.1, 'E' : 10, 'C' : 5,  'M' : 1}, \
+        cache=None):
         """
             Args:
                 tx (Transcript): Transcript class object containing a transcript.
                 evi (Evidence): Evidence class object containing all extrinsic evidence.
                 hint_source_weight (dict(int)): Weights for each evidence source.
+                cache (FeatureCache): Memo table shared by all transcripts,
+                                      a new one is used if it is None.
         """
         self.sw = hint_source_weight
-        self.evi_list = {'intron' : [], 'start_codon' : [], 'stop_codon': []}
+        if cache is None:
+            cache = FeatureCache(evi, hint_source_weight)
+        # weighted multiplicities of each source of the hints that support
+        # the introns and start/stop codons of tx, one tuple per hint
+        self.evi_terms = {'intron' : [], 'start_codon' : [], 'stop_codon': []}
         self.numb_introns = 0
-        self.__init_hints__(tx, evi)
+        self.__init_hints__(tx, cache)
         # feature vector specifies the support of
-        # introns, start/stop codons for a transcript
+        # introns, start/stop codons for a transcript, None if not computed yet
         # self.feature_vector[0] : (supported introns by evidence of tx) / (number of introns in tx)
         # self.feature_vector[1] : (supported start/stop codons by evidence of tx) / 2
         # self.feature_vector[2] : sum of multiplicities of intron evidence for tx
         # self.feature_vector[3] : sum of multiplicities of start/stop codon evidence for tx
         # self.feature_vector[4] : 1 if tx is from anno_pref, 0 otherwise
-        self.feature_vector = self.create_feature_vec()
+        self.feature_vector = [None] * 4
 
-    def __init_hints__(self, tx, evi):
+    def __init_hints__(self, tx, cache):
         """
-            Collect hints from evi that support tx.
+            Collect hints that support tx.
 
             Args:
                 tx (Transcript): Transcript class object containing a transcript.
-                evi (Evidence): Evidence class object containing all extrinsic evidence.
+                cache (FeatureCache): Memo table of the hints of all features.
         """
-        cds_len = 0
-        for type in ['intron', 'start_codon', 'stop_codon']:
-            for line in tx.transcript_lines[type]:
-                hint = evi.get_hint(line[0], line[3], line[4], line[2], \
-                    line[6])
-                if hint:
-                    self.evi_list[type].append(hint)
-        if tx.transcript_lines['intron']:
-            self.numb_introns = len(tx.transcript_lines['intron'])
+        store = tx.store
+        for type in FEATURE_TYPES:
+            rows = tx.type_rows(type)
+            for r in rows:
+                terms = cache.get(store.value('chr', r), store.start[r], \
+                    store.end[r], type, store.value('strand', r))
+                if terms:
+                    self.evi_terms[type].append(terms)
+            # tuples of floats aren't tracked by the garbage collector after
+            # its first pass, the features of many transcripts can be kept
+            self.evi_terms[type] = tuple(self.evi_terms[type])
+            if type == 'intron':
+                self.numb_introns = len(rows)
 
-    def create_feature_vec(self):
+    def get_feature(self, i):
         """
-            Compute all features.
+            Compute a feature on its first access. The hints of all introns
+            and start/stop codons are collected by __init__(), the sums of
+            their multiplicities are only computed if they are needed.
+
+            Args:
+                i (int): Position of the feature in the feature vector.
 
             Returns:
-                (list(float)): List of feature scores.
+                (float): Feature score.
         """
-        return [self.relative_support(['intron'], self.numb_introns), \
-                self.relative_support(['start_codon', 'stop_codon'], 2.0), \
-                self.absolute_support(['intron']), \
-                self.absolute_support(['start_codon', 'stop_codon'])]
+        if self.feature_vector[i] is None:
+            if i == 0:
+                self.feature_vector[i] = self.relative_support(['intron'], \
+                    self.numb_introns)
+            elif i == 1:
+                self.feature_vector[i] = self.relative_support(['start_codon', \
+                    'stop_codon'], 2.0)
+            elif i == 2:
+                self.feature_vector[i] = self.absolute_support(['intron'])
+            else:
+                self.feature_vector[i] = self.absolute_support(['start_codon', \
+                    'stop_codon'])
+        return self.feature_vector[i]
 
     def relative_support(self, gene_feature_types, abs_numb):
         """
@@ -76,13 +173,15 @@ class Node_features:
         if abs_numb > 0:
             hint_numb = 0
             for type in gene_feature_types:
-                hint_numb += len(self.evi_list[type])
+                hint_numb += len(self.evi_terms[type])
             return hint_numb / abs_numb
         return 1
 
     def absolute_support(self, gene_feature_types):
         """
             Compute absolute support of introns or start/stop-codons.
+            The weighted multiplicities of all hints are added one after
+            another, the rounding depends on this order.
 
             Args:
                 gene_feature_types (str): Either introns or start/stop-codons
@@ -92,14 +191,211 @@ class Node_features:
         """
         score = 0.0
         for type in gene_feature_types:
-            for hint in self.evi_list[type]:
-                for src in hint.keys():
-                    score += self.sw[src] * hint[src]
+            for terms in self.evi_terms[type]:
+                for t in terms:
+                    score += t
         return score
 
     def get_features(self):
         """
             Returns:
-                (list(float)): List of feature scores.
+                (list(float)): List of all feature scores.
         """
-        return self.feature_vector
+        return [self.get_feature(i) for i in range(4)]
+
+def row_array(tx):
+    """
+        Returns:
+            (numpy.ndarray): Row indices of all lines of tx in tx.store
+    """
+    rows = tx.row_ids()
+    if isinstance(rows, range):
+        return np.arange(rows.start, rows.stop, dtype=np.int64)
+    return np.frombuffer(rows, dtype=rows.typecode).astype(np.int64)
+
+def feature_matrix(tx_list, evi, hint_source_weight, stats=None, absolute=None):
+    """
+        Compute the features of many transcripts at once with NumPy. The result
+        is the same as Node_features(tx, evi, hint_source_weight).get_features()
+        for each transcript, the weighted multiplicities of all hints are added
+        up in the same order. Each distinct feature is looked up and weighted
+        once, like in FeatureCache.
+
+        Args:
+            tx_list (list(Transcript)): List of Transcript class objects.
+            evi (Evidence): Evidence class object containing all extrinsic evidence.
+            hint_source_weight (dict(int)): Weights for each evidence source.
+            stats (list(int)): [lookups, hits], increased by the number of
+                               feature lines and of lines with a feature
+                               that was looked up before.
+            absolute (function): Gets the matrix with the relative support
+                                 (features 1 and 2) and returns a boolean
+                                 array of the transcripts whose absolute
+                                 support (features 3 and 4) is needed, it is
+                                 computed for all transcripts if None.
+
+        Returns:
+            (numpy.ndarray): Matrix with one row of 4 features per transcript,
+                             NaN for features that weren't needed.
+    """
+    numb_tx = len(tx_list)
+    # transcript index, line type (position in FEATURE_TYPES), row in the
+    # store, sequence, strand and coordinates of all intron, start and stop
+    # codon lines of all transcripts
+    line_tx = []
+    line_type = []
+    line_row = []
+    line_chr = []
+    line_strand = []
+    line_start = []
+    line_end = []
+    # names of sequences and strands, position is the code used for all stores,
+    # and the code of each name
+    chr_names, chr_index = [], {}
+    strand_names, strand_index = [], {}
+
+    def global_codes(names, index, values):
+        # codes of values in names, new values are added to names
+        for v in values:
+            if v not in index.keys():
+                index.update({v : len(names)})
+                names.append(v)
+        return np.array([index[v] for v in values] + [0], dtype=np.int64)
+
+    # transcripts of each store
+    stores = {}
+    for i, tx in enumerate(tx_list):
+        if id(tx.store) not in stores.keys():
+            stores.update({id(tx.store) : [tx.store, []]})
+        stores[id(tx.store)][1].append(i)
+
+    for store, tx_index in stores.values():
+        rows = [row_array(tx_list[i]) for i in tx_index]
+        tx = np.repeat(np.array(tx_index, dtype=np.int64), [len(r) for r in rows])
+        rows = np.concatenate(rows)
+        type_code = np.full(len(store.values['type']), -1, dtype=np.int64)
+        for i, type in enumerate(FEATURE_TYPES):
+            if type in store.value_index['type'].keys():
+                type_code[store.value_index['type'][type]] = i
+        type = type_code[np.frombuffer(store.codes['type'], dtype='B')[rows]]
+        select = type >= 0
+        rows = rows[select]
+        line_tx.append(tx[select])
+        line_type.append(type[select])
+        line_row.append(rows)
+        line_chr.append(global_codes(chr_names, chr_index, store.values['chr'])[\
+            np.frombuffer(store.codes['chr'], dtype='I')[rows]])
+        line_strand.append(global_codes(strand_names, strand_index, \
+            store.values['strand'])[\
+            np.frombuffer(store.codes['strand'], dtype='B')[rows]])
+        line_start.append(np.frombuffer(store.start, dtype='I')[rows].astype(np.int64))
+        line_end.append(np.frombuffer(store.end, dtype='I')[rows].astype(np.int64))
+
+    def concat(arrays):
+        if arrays:
+            return np.concatenate(arrays)
+        return np.zeros(0, dtype=np.int64)
+    line_tx, line_type, line_row, line_chr, line_strand, line_start, line_end = \
+        [concat(a) for a in [line_tx, line_type, line_row, line_chr, \
+        line_strand, line_start, line_end]]
+    numb_lines = len(line_tx)
+
+    # distinct features, sorted by sequence, type, strand and coordinates
+    group = (line_chr * len(FEATURE_TYPES) + line_type) * max(len(strand_names), 1) \
+        + line_strand
+    key = (line_start << 32) | line_end
+    order = np.lexsort((key, group))
+    new = np.ones(numb_lines, dtype=bool)
+    new[1:] = (group[order][1:] != group[order][:-1]) | (key[order][1:] != key[order][:-1])
+    line_feature = np.empty(numb_lines, dtype=np.int64)
+    line_feature[order] = np.cumsum(new) - 1
+    first = order[new]
+    numb_features = len(first)
+    if stats is not None:
+        stats[0] += numb_lines
+        stats[1] += numb_lines - numb_features
+
+    # look up the hints for each sequence, type and strand
+    feature_found = np.zeros(numb_features, dtype=bool)
+    # index of each feature in the HintArrays of its group, -1 if there is no hint
+    feature_pos = np.full(numb_features, -1, dtype=np.int64)
+    groups = []
+    bounds = np.flatnonzero(np.diff(group[first])) + 1
+    for select in np.split(np.arange(numb_features), bounds):
+        if len(select) == 0:
+            continue
+        i = first[select[0]]
+        hint_arrays, pos = evi.find_hints(chr_names[line_chr[i]], \
+            FEATURE_TYPES[line_type[i]], strand_names[line_strand[i]], \
+            line_start[first[select]], line_end[first[select]])
+        feature_found[select] = pos >= 0
+        feature_pos[select] = pos
+        if hint_arrays is not None:
+            groups.append([hint_arrays, select])
+    line_found = feature_found[line_feature]
+
+    # add up in the order of Node_features: lines of a transcript by type and row
+    order = np.lexsort((line_row, line_type, line_tx))
+    is_intron = line_type[order] == 0
+    intron_lines = order[is_intron]
+    stasto_lines = order[~is_intron]
+    numb_introns = np.bincount(line_tx[intron_lines], minlength=numb_tx)
+    supported_introns = np.bincount(line_tx[intron_lines], \
+        weights=line_found[intron_lines], minlength=numb_tx)
+    supported_stasto = np.bincount(line_tx[stasto_lines], \
+        weights=line_found[stasto_lines], minlength=numb_tx)
+    matrix = np.full((numb_tx, 4), np.nan)
+    matrix[:,0] = np.where(numb_introns > 0, supported_introns \
+        / np.maximum(numb_introns, 1), 1.0)
+    matrix[:,1] = supported_stasto / 2.0
+    if absolute is None:
+        tx_needed = np.ones(numb_tx, dtype=bool)
+    else:
+        tx_needed = np.asarray(absolute(matrix), dtype=bool)
+        intron_lines = intron_lines[tx_needed[line_tx[intron_lines]]]
+        stasto_lines = stasto_lines[tx_needed[line_tx[stasto_lines]]]
+    feature_needed = np.zeros(numb_features, dtype=bool)
+    feature_needed[line_feature[tx_needed[line_tx]]] = True
+
+    # weighted multiplicities of each feature in order of its sources,
+    # term_value[term_offset[f]:term_offset[f] + numb_terms[f]] for feature f
+    weighted = pre_weighted(evi, hint_source_weight)
+    weight = np.array([hint_source_weight[src] for src in evi.src_list] + [0], \
+        dtype=np.float64)
+    numb_terms = np.zeros(numb_features, dtype=np.int64)
+    term_groups = []
+    for hint_arrays, select in groups:
+        select = select[feature_found[select] & feature_needed[select]]
+        if len(select) == 0:
+            continue
+        pos = feature_pos[select]
+        offset = np.frombuffer(hint_arrays.offset, dtype='I').astype(np.int64)
+        numb_terms[select] = offset[pos + 1] - offset[pos]
+        term_groups.append([hint_arrays, select, offset[pos]])
+    term_offset = np.cumsum(numb_terms) - numb_terms
+    term_value = np.zeros(numb_terms.sum(), dtype=np.float64)
+    for hint_arrays, select, first_record in term_groups:
+        counts = numb_terms[select]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        records = np.repeat(first_record, counts) + within
+        if weighted:
+            score = np.frombuffer(hint_arrays.weighted_mult, dtype=np.float64)[records]
+        else:
+            score = weight[np.frombuffer(hint_arrays.src, dtype='H')[records]] \
+                * np.frombuffer(hint_arrays.mult, dtype=np.int64)[records]
+        term_value[np.repeat(term_offset[select], counts) + within] = score
+
+    def absolute_support(lines):
+        # add up the weighted multiplicities of the hints of lines one after
+        # another in the order of lines (np.bincount() adds the weights in
+        # input order), like Node_features.absolute_support()
+        feature = line_feature[lines]
+        counts = numb_terms[feature]
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        terms = np.repeat(term_offset[feature], counts) + within
+        return np.bincount(np.repeat(line_tx[lines], counts), \
+            weights=term_value[terms], minlength=numb_tx)
+
+    matrix[tx_needed, 2] = absolute_support(intron_lines)[tx_needed]
+    matrix[tx_needed, 3] = absolute_support(stasto_lines)[tx_needed]
+    return matrix
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# file_cache.py: Fingerprints of input files and a snapshot cache
+# for parsed gene predictions.
+# ==============================================================
+import os
+import sys
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+from genome_anno import Anno
+
+# first bytes of an annotation snapshot
+ANNO_MAGIC = b'TSEBRA_ANNO_04\n'
+
+def file_hash(path):
+    """
+        Returns:
+            (str): SHA-256 of the file content.
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def fingerprint(path):
+    """
+        Returns:
+            (list): Absolute path, size, mtime and SHA-256 of a file.
+    """
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns, file_hash(path)]
+
+def is_unchanged(path, file_fingerprint):
+    """
+        Check that a file still has the fingerprint. The content is only
+        hashed if size or mtime of the file changed. If only the mtime
+        changed (e.g. the file was touched or copied), file_fingerprint is
+        updated with the new mtime. The caller should save it again, so
+        that the file isn't hashed in each later check.
+
+        Args:
+            path (str): Path to a file
+            file_fingerprint (list): Fingerprint of the file from fingerprint()
+
+        Returns:
+            (boolean): True if the file hasn't changed.
+    """
+    fp_path, size, mtime, sha = file_fingerprint
+    if not os.path.abspath(path) == fp_path or not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size == size and stat.st_mtime_ns == mtime:
+        return True
+    if stat.st_size == size and file_hash(path) == sha:
+        file_fingerprint[2] = stat.st_mtime_ns
+        return True
+    return False
+
+def cache_path(cache_dir, prefix, paths):
+    """
+        Returns:
+            (str): Path of the cache file for a list of input files.
+    """
+    name = hashlib.sha1('\n'.join([os.path.abspath(p) for p in paths]).encode())
+    return os.path.join(cache_dir, '{}_{}.db'.format(prefix, name.hexdigest()[:16]))
+
+def write_atomic(path, write):
+    """
+        Create a file with write(file) and replace path with it at the end,
+        so that a cache file is always complete.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), \
+        delete=False) as file:
+        write(file)
+    os.replace(file.name, path)
+
+def load_anno(gtf, anno_id, cache_dir, quiet=False, line_refs=False, \
+    fix_ids=False):
+    """
+        Read and normalize a gene prediction file, or load it from a snapshot
+        in cache_dir. The snapshot is created if it doesn't exist or if the
+        file has changed. Each combination of line_refs and fix_ids has its
+        own snapshot.
+
+        Args:
+            gtf (str): Path to a gene prediction file
+            anno_id (str): Annotation ID
+            cache_dir (str): Directory of the snapshots.
+            quiet (boolean): Quiet mode.
+            line_refs (boolean): Keep byte offsets of the lines instead
+                                 of their attributes, see GtfStore.
+            fix_ids (boolean): Add chromosome and strand to the transcript
+                               and gene IDs.
+
+        Returns:
+            (Anno): Normalized annotation.
+    """
+    prefix = 'anno'
+    if fix_ids:
+        prefix += '_fixed'
+    if line_refs:
+        prefix += '_refs'
+    path = cache_path(cache_dir, prefix, [gtf])
+    if os.path.exists(path):
+        try:
+            with open(path, 'rb') as file:
+                if file.read(len(ANNO_MAGIC)) == ANNO_MAGIC:
+                    file_fingerprint = pickle.load(file)
+                    mtime = file_fingerprint[2]
+                    if is_unchanged(gtf, file_fingerprint):
+                        anno_start = file.tell()
+                        anno = pickle.load(file)
+                        anno.change_id(anno_id)
+                        if not quiet:
+                            sys.stderr.write('### ANNO CACHE HIT: [{}]\n'.format(path))
+                        if not file_fingerprint[2] == mtime:
+                            file.seek(anno_start)
+                            __save_fingerprint__(path, file_fingerprint, file)
+                        return anno
+        except (pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            pass
+    if not quiet:
+        sys.stderr.write('### ANNO CACHE MISS, CREATING: [{}]\n'.format(path))
+    anno = Anno(gtf, anno_id, line_refs, fix_ids)
+    anno.addGtf()
+    anno.norm_tx_format()
+
+    def write(file):
+        file.write(ANNO_MAGIC)
+        pickle.dump(fingerprint(gtf), file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(anno, file, pickle.HIGHEST_PROTOCOL)
+    write_atomic(path, write)
+    return anno
+
+def __save_fingerprint__(path, file_fingerprint, snapshot):
+    # replace the fingerprint of a snapshot, the pickled annotation
+    # is copied from the old snapshot at its current position
+    def write(file):
+        file.write(ANNO_MAGIC)
+        pickle.dump(file_fingerprint, file, pickle.HIGHEST_PROTOCOL)
+        shutil.copyfileobj(snapshot, file, 1 << 20)
+    try:
+        write_atomic(path, write)
+    except OSError:
+        sys.stderr.write('WARNING: Could not update the snapshot {}.\n'.format(path))
@@ -9,38 +9,56 @@ import sys
 import os
 import argparse
 
+from compressed import open_file
+
 class FormatError(Exception):
     pass
 
-class Chr:
-    def __init__(self):
-        self.genes = {}
-        self.txs = {}
+def fix_attribute(chr, strand, attribute):
+    """
+        Add chromosome and strand as prefix to the transcript and gene ID
+        of an attribute, e.g. transcript_id "chr1+_g1.t1";
+
+        Args:
+            chr (str): Chromosome name
+            strand (str): Strand (+/-)
+            attribute (str): Attribute column of a gtf line
+
+        Returns:
+            (str): Attribute with the new IDs
+    """
+    for key in ['transcript_id "', 'gene_id "']:
+        attribute = attribute.split(key, 1)
+        if len(attribute) > 1:
+            attribute = '{}{}{}{}_{}'.format(attribute[0], key, chr, strand, \
+                attribute[1])
+        else:
+            attribute = attribute[0]
+    return attribute
 
-def start2int(line):
-    line[3] = int(line[3])
-    return line
+def fix_lines(lines):
+    """
+        Replace gene/tx oldID with chr_strand_oldID in the lines of a gtf
+        file. Gene and transcript lines and lines that aren't in gtf format
+        are removed.
+
+        Args:
+            lines (iterable(str)): Lines of a gtf file
+
+        Yields:
+            (str): Line with new IDs
+    """
+    for line in lines:
+        line = line.split('\t')
+        if len(line) == 9 and line[2] not in ['gene', 'transcript']:
+            line[8] = fix_attribute(line[0], line[6], line[8])
+            yield '\t'.join(line)
 
 def main():
-    # replace gene/tx oldID with chr_strand_oldID
+    # lines are fixed one at a time while reading
     args = parseCmd()
-    result = ''
-    with open(args.gtf, 'r') as file:
-        for line in file.readlines():
-            line = line.split('\t')
-            if len(line) == 9:
-                if line[2] in ['gene', 'transcript']:
-                    continue
-                id_prefix = line[0] + line[6]
-                transcript_id = line[8].split('transcript_id "')[1].split('";')[0]
-                temp = line[8].split('transcript_id "')
-                line[8] = '{}transcript_id "{}_{}";{}'.format(temp[0], id_prefix, transcript_id, '";'.join(temp[1].split('";')[1:]))
-                gene_id = line[8].split('gene_id "')[1].split('";')[0]
-                temp = line[8].split('gene_id "')
-                line[8] = '{}gene_id "{}_{}";{}'.format(temp[0], id_prefix, gene_id, '";'.join(temp[1].split('";')[1:]))
-                result += '\t'.join(line)
-    with open(args.out, 'w+') as file:
-        file.write(result)
+    with open_file(args.gtf) as file, open(args.out, 'w+') as out:
+        out.writelines(fix_lines(file))
 
 def parseCmd():
     """Parse command line arguments
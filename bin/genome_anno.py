@@ -5,18 +5,252 @@
 # genome_anno.py: Handles the data structure for a genome annotation file
 # ==============================================================
 
+import io
 import os
 import sys
 import csv
+import mmap
+from array import array
+
+from compressed import open_file, file_format
+from fix_gtf_ids import fix_attribute
 
 class NotGtfFormat(Exception):
     pass
 
+def set_gtf_ids(gtf, tx_id, gene_id):
+    """
+        Write transcript and gene ID into the attribute column of gtf lines.
+
+        Args:
+            gtf (list(list(str))): List of lines in gtf format as lists
+            tx_id (str): Transcript ID
+            gene_id (str): Gene ID
+
+        Returns:
+            (list(list(str))): The same list of lines with new attributes
+    """
+    for g in gtf:
+        if g[2] == 'transcript':
+            g[8] = tx_id
+        else:
+            g[8] = 'transcript_id \"{}\"; gene_id \"{}";'.format(tx_id, gene_id)
+    return gtf
+
+def read_lines(file, ref):
+    """
+        Decode the lines of a file and record the byte offset and length
+        of each line.
+
+        Args:
+            file (file object): File opened in binary mode
+            ref (list(int)): [offset, length] of the last line, updated
+                             before each line is returned
+
+        Yields:
+            (str): Decoded line
+    """
+    offset = 0
+    for raw in file:
+        ref[0] = offset
+        ref[1] = len(raw.rstrip(b'\r\n'))
+        offset += len(raw)
+        yield raw.decode()
+
+class GtfStore:
+    """
+        Columnar store for the gtf lines of all transcripts of an annotation.
+        Coordinates are kept in typed arrays, all other columns as codes
+        into tables of their distinct values.
+        A line is a row index into the arrays.
+        If the store has line references, the attribute column of lines
+        from the gtf file isn't kept in memory. It is read from a memory
+        map of the file with the byte offset and length of the line.
+        With fix_ids, the IDs of these attributes are fixed when they are
+        read, like the IDs of the lines that are added.
+    """
+    # typecodes of the code arrays of each column
+    columns = {'chr' : 'I', 'source' : 'H', 'type' : 'B', 'score' : 'I', \
+        'strand' : 'B', 'phase' : 'B', 'attribute' : 'I'}
+
+    def __init__(self, path='', fix_ids=False):
+        """
+            Args:
+                path (str): Path to the uncompressed gtf file of the line
+                            references, the store has no line references
+                            if it is empty. The absolute path is kept, so
+                            that a pickled store can be used from another
+                            working directory.
+                fix_ids (boolean): The IDs of the lines in the gtf file
+                                   have chromosome and strand as prefix,
+                                   see fix_gtf_ids.fix_attribute().
+        """
+        self.start = array('I')
+        self.end = array('I')
+        self.path = ''
+        if path:
+            self.path = os.path.abspath(path)
+        self.fix_ids = fix_ids
+        # byte offset and length of each line in the gtf file,
+        # length is 0 for lines that aren't from the file
+        self.line_offset = array('Q')
+        self.line_length = array('I')
+        # memory map of the gtf file, opened on first use
+        self.mmap = None
+        # self.codes[column] = array of codes of all lines
+        self.codes = {}
+        # self.values[column] = list of distinct values, position is the code
+        self.values = {}
+        # self.value_index[column][value] = code
+        self.value_index = {}
+        for c in self.columns.keys():
+            self.codes.update({c : array(self.columns[c])})
+            self.values.update({c : []})
+            self.value_index.update({c : {}})
+
+    def __len__(self):
+        return len(self.start)
+
+    def code(self, column, value):
+        """
+            Args:
+                column (str): Column name
+                value (str): Value of a gtf column
+
+            Returns:
+                (int): Code of value, a new code is added if value is new
+        """
+        if value not in self.value_index[column]:
+            self.value_index[column].update({value : len(self.values[column])})
+            self.values[column].append(value)
+        return self.value_index[column][value]
+
+    def add_line(self, line, ref=None):
+        """
+            Args:
+                line (list): List of all elements of a line from a gtf file
+                ref (list(int)): Byte offset and length of the line in the
+                                 gtf file, None if it isn't from the file.
+
+            Returns:
+                (int): Row index of the new line
+        """
+        self.start.append(line[3])
+        self.end.append(line[4])
+        for c, i in [('chr', 0), ('source', 1), ('type', 2), ('score', 5), \
+            ('strand', 6), ('phase', 7)]:
+            self.codes[c].append(self.code(c, line[i]))
+        if self.path:
+            if ref is None:
+                ref = [0, 0]
+            self.line_offset.append(ref[0])
+            self.line_length.append(ref[1])
+            if ref[1]:
+                # the attribute is read from the file when it is needed
+                self.codes['attribute'].append(self.code('attribute', ''))
+                return len(self.start) - 1
+        self.codes['attribute'].append(self.code('attribute', line[8]))
+        return len(self.start) - 1
+
+    def value(self, column, row):
+        """
+            Returns:
+                (str): Value of column in a line
+        """
+        if column == 'attribute' and self.path and self.line_length[row]:
+            return self.__file_line__(row)[8]
+        return self.values[column][self.codes[column][row]]
+
+    def __file_line__(self, row):
+        # line of the gtf file as list, read from the memory map
+        if self.mmap is None:
+            with open(self.path, 'rb') as file:
+                self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        offset = self.line_offset[row]
+        raw = self.mmap[offset:offset + self.line_length[row]]
+        line = next(csv.reader([raw.decode()], delimiter='\t'))
+        if self.fix_ids:
+            line[8] = fix_attribute(line[0], line[6], line[8])
+        return line
+
+    def get_line(self, row, attribute=True):
+        """
+            Args:
+                row (int): Row index of the line
+                attribute (boolean): Read the attribute column, it is ''
+                                     otherwise (e.g. if it is replaced).
+
+            Returns:
+                (list): Line in gtf format as list
+        """
+        return [self.value('chr', row), self.value('source', row), \
+            self.value('type', row), self.start[row], self.end[row], \
+            self.value('score', row), self.value('strand', row), \
+            self.value('phase', row), \
+            self.value('attribute', row) if attribute else '']
+
+    def compact(self, transcripts):
+        """
+            Reorder the lines, so that the lines of each transcript are
+            consecutive and drop lines of transcripts that are not in
+            transcripts anymore. Afterwards each transcript is an offset
+            range into the arrays.
+
+            Args:
+                transcripts (list(Transcript)): All transcripts of the store.
+        """
+        start = array('I')
+        end = array('I')
+        line_offset = array('Q')
+        line_length = array('I')
+        codes = {c : array(self.columns[c]) for c in self.columns.keys()}
+        for tx in transcripts:
+            offset = len(start)
+            for r in tx.row_ids():
+                start.append(self.start[r])
+                end.append(self.end[r])
+                for c in codes.keys():
+                    codes[c].append(self.codes[c][r])
+                if self.path:
+                    line_offset.append(self.line_offset[r])
+                    line_length.append(self.line_length[r])
+            tx.set_range(offset, len(start) - offset)
+        self.start = start
+        self.end = end
+        self.line_offset = line_offset
+        self.line_length = line_length
+        self.codes = codes
+
+    def nbytes(self):
+        """
+            Returns:
+                (int): Size of all arrays in bytes.
+        """
+        size = self.start.itemsize * len(self.start) * 2
+        size += self.line_offset.itemsize * len(self.line_offset)
+        size += self.line_length.itemsize * len(self.line_length)
+        for c in self.codes.keys():
+            size += self.codes[c].itemsize * len(self.codes[c])
+        return size
+
+    def __getstate__(self):
+        # value_index is rebuilt from values when a pickled store is loaded,
+        # the memory map is opened again on first use
+        state = self.__dict__.copy()
+        del state['value_index']
+        state['mmap'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.value_index = {c : {v : i for i, v in enumerate(self.values[c])} \
+            for c in self.values.keys()}
+
 class Transcript:
     """
         Class handling the data structures and methods for a transcript
     """
-    def __init__(self, id, gene_id, chr, source_anno, strand):
+    def __init__(self, id, gene_id, chr, source_anno, strand, store=None):
         """
             Args:
                 id (str): Transcript ID
@@ -24,33 +258,93 @@ class Transcript:
                 chr (str): Chromosome/Sequence name where the transcript is located
                 source_anno (str): Anno ID
                 strand (str): Strand (+/-) on which the transctipt is located
+                store (GtfStore): Store for the gtf lines, shared by all
+                                  transcripts of an annotation
         """
         self.id = id
         self.chr = chr
         self.gene_id = gene_id
-        # self.transcript_lines[segment_type] = [lines of segment type]
-        self.transcript_lines = {}
-        self.gtf = []
+        if store is None:
+            store = GtfStore()
+        self.store = store
+        # row indices of the lines of the transcript in self.store,
+        # None if the lines are the range [offset, offset + length)
+        self.rows = array('I')
+        self.offset = 0
+        self.length = 0
+        # line types in order of their first occurrence
+        self.line_types = []
         self.source_anno = source_anno
         self.start = -1
         self.end = -1
-        self.cds_coords = {}
         self.strand = strand
+        # line number of the first line of the transcript in the gtf file
+        self.line_number = -1
+        # canonical key of the coding sequence, see get_cds_fingerprint()
+        self.cds_fingerprint = None
+
+    def row_ids(self):
+        """
+            Returns:
+                (iterable(int)): Row indices of all lines of the transcript in self.store
+        """
+        if self.rows is None:
+            return range(self.offset, self.offset + self.length)
+        return self.rows
 
-    def add_line(self, line):
+    def set_range(self, offset, length):
+        """
+            Set the lines of the transcript to a range of consecutive rows.
+        """
+        self.rows = None
+        self.offset = offset
+        self.length = length
+
+    def type_rows(self, type):
+        """
+            Returns:
+                (list(int)): Row indices of all lines of a type
+        """
+        if type not in self.line_types:
+            return []
+        code = self.store.code('type', type)
+        type_codes = self.store.codes['type']
+        return [r for r in self.row_ids() if type_codes[r] == code]
+
+    def get_lines(self, type):
+        """
+            Args:
+                type (str): Line type, e.g. 'CDS' or 'intron'
+
+            Returns:
+                (list(list)): All lines of one type in gtf format as lists
+        """
+        return [self.store.get_line(r) for r in self.type_rows(type)]
+
+    @property
+    def transcript_lines(self):
+        """
+            Returns:
+                (dict(list(list))): Lists of all lines for each line type
+        """
+        return {type : self.get_lines(type) for type in self.line_types}
+
+    def add_line(self, line, ref=None):
         """
             Add a single line from the gtf file to the transcript data structure.
 
             Args:
                 line (list): List of all elements of a line from a gtf file
+                ref (list(int)): Byte offset and length of the line in the
+                                 gtf file, see GtfStore.add_line()
         """
         if not (line[0] == self.chr or line[6] == self.strand):
             raise NotGtfFormat('File is not in gtf format. ' \
                 + 'Error in line {}\n'.format('\t'.join(map(str, line)))
                 + 'Transcript ID is not unique')
 
-        if line[2] not in self.transcript_lines.keys():
-            self.transcript_lines.update({line[2] : []})
+        if line[2] not in self.line_types:
+            self.line_types.append(line[2])
 
         line[3] = int(line[3])
         line[4] = int(line[4])
@@ -59,7 +353,14 @@ class Transcript:
         if self.end < 0 or line[4] > self.end:
             self.end = line[4]
 
-        self.transcript_lines[line[2]].append(line)
+        self.__append_row__(line, ref)
+        self.cds_fingerprint = None
+
+    def __append_row__(self, line, ref=None):
+        if self.rows is None:
+            # lines are added after the store was compacted
+            self.rows = array('I', self.row_ids())
+        self.rows.append(self.store.add_line(line, ref))
 
     def get_cds_coords(self):
         """
@@ -70,15 +371,40 @@ class Transcript:
                                         each each frame phase (0,1,2)
         """
         # returns dict of cds_coords[phase] = [start_coord, end_coord] of all CDS
-        if not self.cds_coords.keys():
-            self.cds_coords = {'0' : [], '1' : [], '2' : []}
-            if 'CDS' in self.transcript_lines.keys():
-                key  = 'CDS'
+        cds_coords = {'0' : [], '1' : [], '2' : []}
+        if 'CDS' in self.line_types:
+            key  = 'CDS'
+        else:
+            key = 'exon'
+        for r in self.type_rows(key):
+            cds_coords[self.store.value('phase', r)].append(\
+                [self.store.start[r], self.store.end[r]])
+        return cds_coords
+
+    def get_cds_fingerprint(self):
+        """
+            Canonical key of the coding sequence, it is computed once and
+            stored until a line is added. Two transcripts are duplicates if
+            their keys are equal.
+
+            Returns:
+                (tuple): Chromosome, strand, start and end of the transcript,
+                         the frame phases and the coords of the CDS segments
+                         sorted by frame phase and coords
+        """
+        if self.cds_fingerprint is None:
+            if 'CDS' in self.line_types:
+                key = 'CDS'
             else:
                 key = 'exon'
-            for line in self.transcript_lines[key]:
-                self.cds_coords[line[7]].append([line[3], line[4]])
-        return self.cds_coords
+            phase = self.store.codes['phase']
+            phase_values = self.store.values['phase']
+            segments = sorted([(phase_values[phase[r]], self.store.start[r] << 32 \
+                | self.store.end[r]) for r in self.type_rows(key)])
+            self.cds_fingerprint = (self.chr, self.strand, self.start, self.end, \
+                ''.join([s[0] for s in segments]), \
+                array('Q', [s[1] for s in segments]).tobytes())
+        return self.cds_fingerprint
 
     def add_missing_lines(self):
         """
@@ -103,7 +429,7 @@ class Transcript:
         """
             Check if tx has CDS or exons.
         """
-        if 'CDS' not in self.transcript_lines.keys() and 'exon' not in self.transcript_lines.keys():
+        if 'CDS' not in self.line_types and 'exon' not in self.line_types:
             sys.stderr.write('Skipping transcript {}, no CDS nor exons in {}\n'.format(self.id, self.id))
             return False
         return True
@@ -112,18 +438,16 @@ class Transcript:
         """
             Add intron lines.
         """
-        if not 'intron' in self.transcript_lines.keys():
-            self.transcript_lines.update({'intron' : []})
+        if not 'intron' in self.line_types:
+            self.line_types.append('intron')
             key = ''
-            if 'CDS' in self.transcript_lines.keys():
+            if 'CDS' in self.line_types:
                 key = 'CDS'
-            elif 'exon' in self.transcript_lines.keys():
+            elif 'exon' in self.line_types:
                 key = 'exon'
             if key:
-                exon_lst = []
-                for line in self.transcript_lines[key]:
-                    exon_lst.append(line)
-                exon_lst = sorted(exon_lst, key=lambda e:e[0])
+                exon_lst = [self.store.get_line(r, False) for r in \
+                    self.type_rows(key)]
                 for i in range(1, len(exon_lst)):
                     intron = []
                     intron += exon_lst[i][0:2]
@@ -133,19 +457,19 @@ class Transcript:
                     intron += exon_lst[i][5:8]
                     intron.append("gene_id \"{}\"; transcript_id \"{}\";".format(\
                     self.gene_id, self.id))
-                    self.transcript_lines['intron'].append(intron)
+                    self.__append_row__(intron)
 
     def find_transcript(self):
         """
             Add transcript lines.
         """
-        if not 'transcript' in self.transcript_lines.keys():
-            for k in self.transcript_lines.keys():
-                for line in self.transcript_lines[k]:
-                    if line[3] < self.start or self.start < 0:
-                        self.start = line[3]
-                    if line[4] > self.end:
-                        self.end = line[4]
+        if not 'transcript' in self.line_types:
+            # source and strand of the transcript line are taken from the
+            # last line of the last line type
+            for k in self.line_types:
+                rows = self.type_rows(k)
+                if rows:
+                    line = self.store.get_line(rows[-1], False)
             tx_line = [self.chr, line[1], 'transcript', self.start, self.end, \
             '.', line[6], '.', self.id]
             self.add_line(tx_line)
@@ -154,9 +478,9 @@ class Transcript:
         """
             Add start/stop codon lines.
         """
-        if not 'transcript' in self.transcript_lines.keys():
+        if not 'transcript' in self.line_types:
             self.find_transcript()
-        tx = self.transcript_lines['transcript'][0]
+        tx = self.store.get_line(self.type_rows('transcript')[0], False)
 
         line1 = [self.chr, tx[1], '', tx[3], tx[3] + 2, \
         '.', tx[6], '.', "gene_id \"{}\"; transcript_id \"{}\";".format(\
@@ -174,9 +498,9 @@ class Transcript:
             line2[2] = 'start_codon'
             stop = line1
             start = line2
-        if not 'start_codon' in self.transcript_lines.keys():
+        if not 'start_codon' in self.line_types:
             self.add_line(start)
-        if not 'stop_codon' in self.transcript_lines.keys():
+        if not 'stop_codon' in self.line_types:
             self.add_line(stop)
 
     def get_gtf(self, prefix='', new_gene_id=None):
@@ -186,7 +510,6 @@ class Transcript:
             Returns:
                 (list(list(str))): List of lines in gtf format as lists
         """
-        gtf = []
         if new_gene_id:
             g_id = new_gene_id
         else:
@@ -194,77 +517,135 @@ class Transcript:
 
         if prefix:
             prefix += '.'
-        for k in self.transcript_lines.keys():
-            for g in self.transcript_lines[k]:
-                if k == 'transcript':
-                    g[8] = prefix + self.id
-                else:
-                    g[8] = 'transcript_id \"{}\"; gene_id \"{}";'.format(\
-                        prefix + self.id, g_id)
-                gtf.append(g)
-        gtf = sorted(gtf, key=lambda g:g[3])
-        return gtf
+        # lines sorted by start, then by line type and order of the lines
+        type_rank = {self.store.code('type', k) : i \
+            for i, k in enumerate(self.line_types)}
+        type_codes = self.store.codes['type']
+        rows = sorted(self.row_ids(), key=lambda r:(self.store.start[r], \
+            type_rank[type_codes[r]], r))
+        # the attributes are replaced by the new IDs
+        gtf = [self.store.get_line(r, False) for r in rows]
+        return set_gtf_ids(gtf, prefix + self.id, g_id)
 
 class Anno:
     """
         Class handling the data structures and methods for a one genome annotation file
     """
-    def __init__(self, path, id):
+    def __init__(self, path, id, line_refs=False, fix_ids=False):
         """
             Args:
-                path (str): Path to the annotation/gene prediction file in gtf format.
+                path (str): Path to the annotation/gene prediction file in gtf format,
+                            it can be gzip or BGZF compressed.
                 id (str): Annotation ID
+                line_refs (boolean): Keep byte offsets of the lines of an
+                                     uncompressed file instead of their
+                                     attributes, see GtfStore.
+                fix_ids (boolean): Add chromosome and strand as prefix to
+                                   the transcript and gene IDs while the
+                                   file is read, same as fix_gtf_ids.py.
         """
         self.id = id
+        self.fix_ids = fix_ids
         self.genes = {'None' : []}
         self.gene_gtf = {}
         self.transcripts = {}
         self.path = path
+        # gtf lines of all transcripts
+        if line_refs and path and file_format(path) == 'plain':
+            self.store = GtfStore(path, fix_ids)
+        else:
+            if line_refs and path:
+                sys.stderr.write('WARNING: {} is compressed, its lines are kept '.format(\
+                    path) + 'in memory.\n')
+            self.store = GtfStore()
 
-    def addGtf(self):
+    def addGtf(self, rows=None, file=None):
         """
             Read a gtf file and create a dictionary of Transcript objects for
             all transcript in the file
+
+            Args:
+                rows (iterable(int, list(str))): Line numbers and lines of the
+                                                 gtf file, e.g. only the lines
+                                                 of one chromosome. The whole
+                                                 file at self.path is read if
+                                                 rows is None.
+                file (file object): The file at self.path opened in binary
+                                    mode, e.g. with prefetch (see
+                                    compressed.open_file), it is opened here
+                                    if None. It is closed after reading.
+        """
+        if rows is not None:
+            self.add_rows(rows)
+            return
+        if file is None:
+            file = open_file(self.path, binary=True)
+        with file:
+            if self.store.path:
+                ref = [0, 0]
+                self.add_rows(enumerate(csv.reader(read_lines(file, ref), \
+                    delimiter='\t')), ref)
+            else:
+                self.add_rows(enumerate(csv.reader(io.TextIOWrapper(file), \
+                    delimiter='\t')))
+
+    def add_rows(self, rows, ref=None):
         """
-        with open (self.path, 'r') as file:
-            file_lines = csv.reader(file, delimiter='\t')
-            for line in file_lines:
-                if line[0][0] ==  '#':
+            Create Transcript objects from lines of a gtf file.
+
+            Args:
+                rows (iterable(int, list(str))): Line numbers and lines of a gtf file
+                ref (list(int)): Byte offset and length of the current line,
+                                 see read_lines()
+        """
+        for line_number, line in rows:
+            if line[0][0] ==  '#':
+                continue
+            if self.fix_ids:
+                if line[2] in ['gene', 'transcript']:
                     continue
-                line[3] = int(line[3])
-                line[4] = int(line[4])
-                if line[2] == 'gene':
-                    gene_id = line[8]
-                    self.genes_update(gene_id)
-                    if not gene_id in self.gene_gtf.keys():
-                        self.gene_gtf.update({gene_id : line})
-                    else:
-                        sys.stderr.write('ERROR, gene_id not unique: {}'.format(gene_id))
-                elif line[2] == 'transcript':
-                    transcript_id = line[8]
-                    gene_id = transcript_id.split('.')[0]
-                    self.transcript_update(transcript_id, gene_id, line[0], line[6])
-                    self.transcripts[transcript_id].add_line(line)
+                line[8] = fix_attribute(line[0], line[6], line[8])
+            line[3] = int(line[3])
+            line[4] = int(line[4])
+            # coordinates are stored as unsigned 32 bit integers
+            if not (0 <= line[3] < 1 << 32 and 0 <= line[4] < 1 << 32):
+                raise NotGtfFormat('File: "{}" is not in gtf format. \n'.format(\
+                    self.path) + 'Error in line {}\n'.format('\t'.join(map(str, line))) \
+                    + 'Coordinates have to be between 0 and 2^32-1')
+            if line[2] == 'gene':
+                gene_id = line[8]
+                self.genes_update(gene_id)
+                if not gene_id in self.gene_gtf.keys():
+                    self.gene_gtf.update({gene_id : line})
+                else:
+                    sys.stderr.write('ERROR, gene_id not unique: {}'.format(gene_id))
+            elif line[2] == 'transcript':
+                transcript_id = line[8]
+                gene_id = transcript_id.split('.')[0]
+                self.transcript_update(transcript_id, gene_id, line[0], \
+                    line[6], line_number)
+                self.transcripts[transcript_id].add_line(line, ref)
+            else:
+                transcript_id = line[8].split('transcript_id "')
+                if len(transcript_id) > 1:
+                    transcript_id = transcript_id[1].split('";')[0]
                 else:
-                    transcript_id = line[8].split('transcript_id "')
-                    if len(transcript_id) > 1:
-                        transcript_id = transcript_id[1].split('";')[0]
-                    else:
-                        raise NotGtfFormat('File: "{}" is not in gtf format. \n'.format(\
-                            self.path) + 'Error in line {}\n'.format('\t'.join(map(str, line))))
-
-                    gene_id = line[8].split('gene_id "')
-                    if len(gene_id) > 1:
-                        gene_id = gene_id[1].split('";')[0]
-                    else:
-                        gene_id = 'None'
-                        for key, value in self.genes.items():
-                            if value == transcript_id:
-                                gene_id = key
-
-                    self.transcript_update(transcript_id, gene_id, line[0], line[6])
-                    self.genes_update(gene_id, transcript_id)
-                    self.transcripts[transcript_id].add_line(line)
+                    raise NotGtfFormat('File: "{}" is not in gtf format. \n'.format(\
+                        self.path) + 'Error in line {}\n'.format('\t'.join(map(str, line))))
+
+                gene_id = line[8].split('gene_id "')
+                if len(gene_id) > 1:
+                    gene_id = gene_id[1].split('";')[0]
+                else:
+                    gene_id = 'None'
+                    for key, value in self.genes.items():
+                        if value == transcript_id:
+                            gene_id = key
+
+                self.transcript_update(transcript_id, gene_id, line[0], \
+                    line[6], line_number)
+                self.genes_update(gene_id, transcript_id)
+                self.transcripts[transcript_id].add_line(line, ref)
 
         for tx_id in self.genes['None']:
             gene_id = tx_id + '_g'
@@ -283,6 +664,9 @@ class Anno:
                 tx_no_cds.append(k)
         for k in tx_no_cds:
             del self.transcripts[k]
+        self.store.compact(self.get_transcript_list())
+        for tx in self.get_transcript_list():
+            tx.get_cds_fingerprint()
 
     def genes_update(self, gene_id, transcript_id=''):
         """
@@ -300,7 +684,7 @@ class Anno:
             self.genes['None'].remove(transcript_id)
             self.transcripts[transcript_id].gene_id = gene_id
 
-    def transcript_update(self, t_id, g_id, chr, strand):
+    def transcript_update(self, t_id, g_id, chr, strand, line_number=-1):
         """
             Update transcript ID dict.
             Args:
@@ -308,9 +692,12 @@ class Anno:
                 g_id (str): Gene ID
                 chr (str): Chromosome name
                 strand (str): Strand (+/-)
+                line_number (int): Line number of the first line of the transcript
         """
         if not t_id in self.transcripts.keys():
-            self.transcripts.update({ t_id : Transcript(t_id, g_id, chr, self.id, strand)})
+            self.transcripts.update({ t_id : Transcript(t_id, g_id, chr, self.id, \
+                strand, self.store)})
+            self.transcripts[t_id].line_number = line_number
 
     def get_gtf(self):
         """
@@ -336,17 +723,32 @@ class Anno:
                 list(list(str)): Gtf file as list of lists
         """
         gtf = []
-        for tx in tx_list:
-            gtf += self.transcripts[tx[0]].get_gtf(self.id, tx[1])
+        for tx_gtf in self.iter_subset_gtf(tx_list):
+            gtf += tx_gtf
         return gtf
 
+    def iter_subset_gtf(self, tx_list, sort=False):
+        """
+            Get the gtf lines of a subset of transcripts one transcript at a time
+            Args:
+                tx_list (list(list(str))): List of transcript IDs and new gene IDs
+                sort (boolean): Sort the transcripts by sequence name and start
+            Yields:
+                list(list(str)): Gtf lines of a transcript as list of lists
+        """
+        if sort:
+            tx_list = sorted(tx_list, key=lambda tx:(self.transcripts[tx[0]].chr, \
+                self.transcripts[tx[0]].start))
+        for tx in tx_list:
+            yield self.transcripts[tx[0]].get_gtf(self.id, tx[1])
+
     def change_id(self, new_id):
         """
             Change annotation file ID.
         """
         self.id = new_id
         for k in self.transcripts.keys():
-            self.transcripts.source_anno = self.id
+            self.transcripts[k].source_anno = self.id
 
     def get_transcript_list(self):
         """
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# gtf_writer.py: Buffered writer for the combined gene prediction.
+# The lines can be sorted by sequence and start coordinate with a
+# k-way merge of the transcripts of each annotation, and written as
+# BGZF with a tabix index.
+# ==============================================================
+import os
+import csv
+import heapq
+
+from compressed import BgzfWriter
+from tabix import TabixIndexer
+
+# size of the write buffer in bytes
+BUFFER_SIZE = 1 << 20
+
+def line_key(line):
+    """
+        Returns:
+            (tuple): Sequence name and start coordinate of a gtf line
+    """
+    return (line[0], line[3])
+
+def sorted_lines(transcripts):
+    """
+        Sort the lines of transcripts that are sorted by sequence name and
+        start coordinate. Only the lines of transcripts that overlap
+        the current position are kept in memory.
+
+        Args:
+            transcripts (iterable(list(list))): Gtf lines of each transcript,
+                                                sorted by start coordinate
+                                                (see Transcript.get_gtf())
+
+        Yields:
+            (list): Gtf lines sorted by sequence name and start coordinate,
+                    lines with the same start are in input order.
+    """
+    # heap of [chr, start, i, line] of the lines that weren't written
+    heap = []
+    i = 0
+    for gtf in transcripts:
+        if not gtf:
+            continue
+        key = line_key(gtf[0])
+        while heap and (heap[0][0], heap[0][1]) <= key:
+            yield heapq.heappop(heap)[3]
+        for line in gtf:
+            heapq.heappush(heap, [line[0], line[3], i, line])
+            i += 1
+    while heap:
+        yield heapq.heappop(heap)[3]
+
+class GtfWriter:
+    """
+        Writes gtf lines through a buffered file. Without sorting, the
+        transcripts are written as they are added. Otherwise, the
+        transcripts of each annotation are added as a stream sorted by
+        sequence name and start coordinate, and close() merges the
+        streams of all annotations. BGZF output is always sorted, its
+        blocks are compressed in a thread pool while the next lines are
+        merged, and the tabix index is created on the fly.
+    """
+    def __init__(self, path, sort=False, buffer_size=BUFFER_SIZE, bgzf=False):
+        """
+            Args:
+                path (str): Path to the output file.
+                sort (boolean): Sort the lines by sequence name and start coordinate.
+                buffer_size (int): Size of the write buffer in bytes.
+                bgzf (boolean): Write sorted BGZF and its tabix index path.tbi,
+                                or path.csi for sequences longer than 2^29.
+        """
+        self.path = path
+        # TabixIndexer of the BGZF output, None for plain output
+        self.index = None
+        if bgzf:
+            self.file = BgzfWriter(path)
+            self.index = TabixIndexer()
+            sort = True
+        else:
+            self.file = open(path, 'w+', buffering=buffer_size)
+        self.writer = csv.writer(self.file, delimiter='\t', quotechar = "'")
+        self.sort = sort
+        # sorted transcript streams of all annotations, in input order
+        self.streams = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.file.close()
+
+    def add(self, transcripts):
+        """
+            Add the transcripts of one annotation.
+
+            Args:
+                transcripts (iterable(list(list))): Gtf lines of each
+                                                    transcript, sorted by
+                                                    sequence name and start
+                                                    if the output is sorted.
+        """
+        if self.sort:
+            self.streams.append(transcripts)
+            return
+        for gtf in transcripts:
+            self.__write__(gtf)
+
+    def __write__(self, lines):
+        # write lines and add them to the index
+        if self.index is None:
+            self.writer.writerows(lines)
+            return
+        for line in lines:
+            begin = self.file.tell()
+            self.writer.writerow(line)
+            self.index.add(line[0], line[3] - 1, line[4], begin, self.file.tell())
+
+    def close(self):
+        """
+            Write the merged streams if the output is sorted and close the file.
+            Lines with the same start are in the order of the annotations.
+        """
+        if self.sort:
+            self.__write__(heapq.merge(*[sorted_lines(s) for s in \
+                self.streams], key=line_key))
+            self.streams = []
+        self.file.close()
+        if self.index is not None:
+            suffix = self.index.suffix()
+            self.index.write(self.path + suffix, self.file.virtual_offset)
+            # an index of a previous output would be read first
+            for old in ['.tbi', '.csi']:
+                if not old == suffix and os.path.exists(self.path + old):
+                    os.remove(self.path + old)
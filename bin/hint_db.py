@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# hint_db.py: Binary index of the hints from one or more hintfiles,
+# it is created once and reused by later runs with the same hintfiles.
+# ==============================================================
+import os
+import sys
+import mmap
+import pickle
+
+from evidence import Evidence, HintArrays
+from file_cache import fingerprint, is_unchanged, cache_path, write_atomic
+
+class HintDBError(Exception):
+    pass
+
+# file format: MAGIC, length of the header (8 bytes), pickled header
+# and the arrays of all HintArrays, each aligned to 8 bytes
+MAGIC = b'TSEBRA_HINTDB_02'
+# typecodes of the keys, offset, src and mult arrays of a HintArrays
+TYPECODES = ['Q', 'I', 'H', 'q']
+ITEMSIZE = {'Q' : 8, 'q' : 8, 'I' : 4, 'H' : 2}
+
+class HintDB:
+    """
+        Hint index of one or more hintfiles in a binary file. The file is
+        memory-mapped, hints of a sequence are only read when they are used.
+    """
+    def __init__(self, path):
+        """
+            Args:
+                path (str): Path to the HintDB file.
+        """
+        self.path = path
+        with open(path, 'rb') as file:
+            if not file.read(len(MAGIC)) == MAGIC:
+                raise HintDBError('{} is not a hint database.'.format(path))
+            header_len = int.from_bytes(file.read(8), 'little')
+            # self.header = {'files' : [fingerprint], 'src_list' : [src],
+            #   'index' : {(chr, type, strand) : [[byte_offset, numb_values]]
+            #   of keys, offset, src and mult}}
+            self.header = pickle.loads(file.read(header_len))
+            # byte offsets in the index are relative to the first array
+            self.data_start = file.tell() + (-file.tell() % 8)
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = memoryview(self.mmap)
+
+    def __getstate__(self):
+        # worker processes open the file again
+        return {'path' : self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    def is_valid(self, hintfiles):
+        """
+            Check that the HintDB was created from the hintfiles and that
+            they haven't changed. Fingerprints of hintfiles with the same
+            content and a new mtime are updated, see save_header().
+
+            Args:
+                hintfiles (list(str)): Paths to hintfiles
+
+            Returns:
+                (boolean): True if the HintDB is up to date.
+        """
+        if not len(hintfiles) == len(self.header['files']):
+            return False
+        for path, file_fingerprint in zip(hintfiles, self.header['files']):
+            if not is_unchanged(path, file_fingerprint):
+                return False
+        return True
+
+    def save_header(self):
+        """
+            Write the HintDB file again with the current header, e.g. with
+            fingerprints that were updated by is_valid(). The arrays are
+            copied from the current file.
+        """
+        header = pickle.dumps(self.header, pickle.HIGHEST_PROTOCOL)
+
+        def write(file):
+            file.write(MAGIC)
+            file.write(len(header).to_bytes(8, 'little'))
+            file.write(header)
+            file.write(b'\0' * (-file.tell() % 8))
+            file.write(self.data[self.data_start:])
+        write_atomic(self.path, write)
+
+    def chromosomes(self):
+        """
+            Returns:
+                (list(str)): Names of all sequences with hints.
+        """
+        chr_list = []
+        for chr, type, strand in self.header['index'].keys():
+            if chr not in chr_list:
+                chr_list.append(chr)
+        return chr_list
+
+    def size(self, chr):
+        """
+            Returns:
+                (int): Number of bytes of all hints of chr.
+        """
+        return sum([sum([n * ITEMSIZE[typecode] for typecode, (pos, n) in \
+            zip(TYPECODES, arrays)]) for (c, type, strand), arrays \
+            in self.header['index'].items() if c == chr])
+
+    def get_evidence(self, chr=None):
+        """
+            Create an Evidence object with the hints of the HintDB,
+            the arrays are views of the file.
+
+            Args:
+                chr (str): Only hints of this sequence, all hints if None.
+
+            Returns:
+                (Evidence): Evidence with the hints of the HintDB.
+        """
+        evi = Evidence()
+        evi.src_list = list(self.header['src_list'])
+        evi.src_code = {src : i for i, src in enumerate(evi.src_list)}
+        evi.src = set(evi.src_list)
+        for key, arrays in self.header['index'].items():
+            if chr is not None and not key[0] == chr:
+                continue
+            evi.index.update({key : HintArrays()})
+            views = []
+            for typecode, (pos, n) in zip(TYPECODES, arrays):
+                pos += self.data_start
+                views.append(self.data[pos:pos + n * ITEMSIZE[typecode]].cast(typecode))
+            evi.index[key].set_arrays(*views)
+        return evi
+
+def write_hint_db(path, hintfiles, evi):
+    """
+        Write the hints of evi to a HintDB file. The file is replaced
+        at the end, so that a HintDB file is always complete.
+
+        Args:
+            path (str): Path to the HintDB file.
+            hintfiles (list(str)): Paths to the hintfiles of evi
+            evi (Evidence): Evidence with all hints of the hintfiles.
+    """
+    index = {}
+    pos = 0
+    for key, hint_arrays in evi.index.items():
+        index.update({key : []})
+        for values in [hint_arrays.keys, hint_arrays.offset, hint_arrays.src, \
+            hint_arrays.mult]:
+            index[key].append([pos, len(values)])
+            pos += len(values) * values.itemsize
+            pos += -pos % 8
+    header = pickle.dumps({'files' : [fingerprint(h) for h in hintfiles], \
+        'src_list' : evi.src_list, 'index' : index}, pickle.HIGHEST_PROTOCOL)
+
+    def write(file):
+        file.write(MAGIC)
+        file.write(len(header).to_bytes(8, 'little'))
+        file.write(header)
+        file.write(b'\0' * (-file.tell() % 8))
+        for hint_arrays in evi.index.values():
+            for values in [hint_arrays.keys, hint_arrays.offset, hint_arrays.src, \
+                hint_arrays.mult]:
+                values = bytes(values)
+                file.write(values + b'\0' * (-len(values) % 8))
+    write_atomic(path, write)
+
+def load_hint_db(hintfiles, cache_dir, quiet=False):
+    """
+        Open the HintDB of hintfiles in cache_dir. It is created if it
+        doesn't exist or if a hintfile has changed.
+
+        Args:
+            hintfiles (list(str)): Paths to hintfiles
+            cache_dir (str): Directory of the HintDB files.
+            quiet (boolean): Quiet mode.
+
+        Returns:
+            (HintDB): HintDB with all hints of the hintfiles.
+    """
+    path = cache_path(cache_dir, 'hints', hintfiles)
+    if os.path.exists(path):
+        try:
+            hint_db = HintDB(path)
+            mtimes = [f[2] for f in hint_db.header['files']]
+            if hint_db.is_valid(hintfiles):
+                if not quiet:
+                    sys.stderr.write('### HINT CACHE HIT: [{}]\n'.format(path))
+                # save the new mtimes, so that the hintfiles aren't hashed again
+                if not [f[2] for f in hint_db.header['files']] == mtimes:
+                    try:
+                        hint_db.save_header()
+                    except OSError:
+                        sys.stderr.write('WARNING: Could not update the hint ' \
+                            + 'database {}.\n'.format(path))
+                return hint_db
+        except (HintDBError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+    if not quiet:
+        sys.stderr.write('### HINT CACHE MISS, CREATING: [{}]\n'.format(path))
+    evi = Evidence()
+    for h in hintfiles:
+        if not quiet:
+            sys.stderr.write('### READING EXTRINSIC EVIDENCE: [{}]\n'.format(h))
+        evi.add_hintfile(h)
+    write_hint_db(path, hintfiles, evi)
+    return HintDB(path)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# input_loader.py: Reads the gene prediction files and hintfiles,
+# each file is read ahead while the previous one is parsed, or all
+# files are read concurrently in a pool of worker processes.
+# ==============================================================
+import os
+import sys
+import time
+import multiprocessing
+
+from genome_anno import Anno
+from evidence import Evidence
+from compressed import open_file
+
+# number of files that are read ahead of the file that is parsed
+PREFETCH_FILES = 1
+
+def read_gtf(gtf, anno_id, anno_cache='', quiet=False, line_refs=False, \
+    fix_ids=False, file=None):
+    """
+        Read and normalize a gene prediction file.
+
+        Args:
+            gtf (str): Path to a gene prediction file
+            anno_id (str): Annotation ID
+            anno_cache (str): Directory of the snapshots of normalized gene
+                              predictions, not used if it is empty.
+            quiet (boolean): Quiet mode.
+            line_refs (boolean): Keep byte offsets of the lines instead
+                                 of their attributes, see GtfStore.
+            fix_ids (boolean): Add chromosome and strand to the transcript
+                               and gene IDs, see fix_gtf_ids.py.
+            file (file object): The gene prediction file opened in binary
+                                mode, see Anno.addGtf(). Not used with
+                                anno_cache.
+
+        Returns:
+            (Anno): Normalized annotation.
+            (float): Time to load the file in seconds.
+    """
+    t = time.time()
+    if anno_cache:
+        from file_cache import load_anno
+        anno = load_anno(gtf, anno_id, anno_cache, quiet, line_refs, fix_ids)
+    else:
+        anno = Anno(gtf, anno_id, line_refs, fix_ids)
+        anno.addGtf(file=file)
+        anno.norm_tx_format()
+    return anno, time.time() - t
+
+def read_hintfile(path):
+    """
+        Returns:
+            (Evidence): Evidence of one hintfile.
+            (float): Time to load the file in seconds.
+    """
+    t = time.time()
+    evi = Evidence()
+    evi.add_hintfile(path)
+    return evi, time.time() - t
+
+def numb_processes(numb_inputs, processes=1):
+    """
+        Args:
+            numb_inputs (int): Number of input files
+            processes (int): Requested number of processes, number of CPUs if None.
+                             The default is to read the inputs in the main
+                             process, with the next file read ahead:
+                             returning the parsed annotations from worker
+                             processes costs more than it saves unless
+                             the inputs are large.
+
+        Returns:
+            (int): Number of worker processes, 1 if the inputs are read
+                   in the main process.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    return max(1, min(processes, numb_inputs))
+
+def load_inputs(gtf, hintfiles, processes=1, anno_cache='', hint_cache='', \
+    quiet=False, line_refs=False, fix_ids=False):
+    """
+        Read all gene prediction files and hintfiles. In the main process,
+        the files are parsed one after another, while the next file is read
+        and decompressed in a background thread (see prefetch()). With more
+        than one process, the files are read concurrently, largest first,
+        and merged in input order. Annotation IDs, source codes and the hint
+        index are the same as when the files are read one after another.
+
+        Args:
+            gtf (list(str)): Paths to gene prediction files
+            hintfiles (list(str)): Paths to hintfiles
+            processes (int): Number of worker processes, number of CPUs if None.
+                             The files are read in the main process by default.
+            anno_cache (str): Directory of the snapshots of normalized gene
+                              predictions, not used if it is empty.
+            hint_cache (str): Directory of the HintDB, the hintfiles are read
+                              in the main process through the HintDB if it is set.
+            quiet (boolean): Quiet mode.
+            line_refs (boolean): Keep byte offsets of the gene prediction
+                                 lines instead of their attributes.
+            fix_ids (boolean): Add chromosome and strand to the transcript
+                               and gene IDs of the gene predictions.
+
+        Returns:
+            (list(Anno)): Normalized annotation of each gene prediction file.
+            (Evidence): Evidence of all hintfiles.
+    """
+    tasks = [[read_gtf, [g, 'anno{}'.format(i+1), anno_cache, \
+        quiet, line_refs, fix_ids]] for i, g in enumerate(gtf)]
+    if not hint_cache:
+        tasks += [[read_hintfile, [h]] for h in hintfiles]
+    paths = [t[1][0] for t in tasks]
+    processes = numb_processes(len(tasks), processes)
+
+    t = time.time()
+    if processes < 2:
+        # files that are read from the input, the others through the caches
+        files = prefetch(([] if anno_cache else gtf) + ([] if hint_cache \
+            else hintfiles))
+        try:
+            anno = []
+            for i, g in enumerate(gtf):
+                if not quiet:
+                    sys.stderr.write('### READING GENE PREDICTION: [{}]\n'.format(g))
+                a, load_time = read_gtf(*tasks[i][1], \
+                    file=None if anno_cache else next(files))
+                anno.append(a)
+                report_time(g, load_time, quiet)
+            evi = load_hints(hintfiles, hint_cache, quiet)
+            if not hint_cache:
+                for h in hintfiles:
+                    if not quiet:
+                        sys.stderr.write('### READING EXTRINSIC EVIDENCE: [{}]\n'.format(h))
+                    t_hint = time.time()
+                    evi.add_hintfile(h, file=next(files))
+                    report_time(h, time.time() - t_hint, quiet)
+        finally:
+            files.close()
+    else:
+        if not quiet:
+            sys.stderr.write('### READING {} INPUTS WITH {} PROCESSES\n'.format(\
+                len(tasks), processes))
+        with multiprocessing.Pool(processes) as pool:
+            # submit the largest files first, results are collected in input order
+            pending = {}
+            for i in sorted(range(len(tasks)), key=lambda i:-os.path.getsize(paths[i])):
+                pending.update({i : pool.apply_async(*tasks[i])})
+            evi = load_hints(hintfiles, hint_cache, quiet)
+            results = []
+            for i, path in enumerate(paths):
+                results.append(pending[i].get())
+                report_time(path, results[-1][1], quiet)
+        anno = [r[0] for r in results[:len(gtf)]]
+        for partial_evi, load_time in results[len(gtf):]:
+            evi.add_evidence(partial_evi)
+
+    if not quiet:
+        sys.stderr.write('### READ ALL INPUTS IN {:.2f}s\n'.format(time.time() - t))
+    return anno, evi
+
+def prefetch(paths):
+    """
+        Open files one after another, each file and the next PREFETCH_FILES
+        files are read ahead in background threads.
+
+        Args:
+            paths (list(str)): Paths to the files
+
+        Yields:
+            (file object): Each file opened in binary mode with prefetch,
+                           see compressed.open_file().
+    """
+    files = []
+    try:
+        for i in range(len(paths)):
+            while len(files) < min(len(paths), i + PREFETCH_FILES + 1):
+                files.append(open_file(paths[len(files)], binary=True, \
+                    prefetch=True))
+            yield files[i]
+    finally:
+        for file in files:
+            file.close()
+
+def load_hints(hintfiles, hint_cache, quiet):
+    # Evidence of the HintDB, or an empty Evidence if the hintfiles are read
+    # by read_hintfile()
+    if not hint_cache:
+        return Evidence()
+    from hint_db import load_hint_db
+    t = time.time()
+    evi = load_hint_db(hintfiles, hint_cache, quiet).get_evidence()
+    report_time(hint_cache, time.time() - t, quiet)
+    return evi
+
+def report_time(path, load_time, quiet):
+    if not quiet:
+        sys.stderr.write('### LOADED [{}] IN {:.2f}s\n'.format(path, load_time))
@@ -7,7 +7,17 @@
 # Add a feature vector to each node.
 # Compare nodes with the 'decision rule'.
 # ==============================================================
-from features import Node_features
+import heapq
+from array import array
+from itertools import accumulate
+from collections.abc import Mapping
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from features import Node_features, FeatureCache, feature_matrix
 
 class Edge:
     """
@@ -21,34 +31,127 @@ class Edge:
         """
         self.node1 = n1_id
         self.node2 = n2_id
-        self.node_to_remove = None
 
 class Node:
     """
         Class handling a node that represents a transcript in the overlap graph.
+        The graph stores its nodes as integers with side tables, a Node
+        is a view of the i-th node.
     """
-    def __init__(self, a_id, t_id):
+    def __init__(self, graph, i):
         """
             Args:
-                a_id (str): Annotation ID of the transcript from Anno object
-                t_id (str): Transcript ID from Transcrpt object
+                graph (Graph): Overlap graph
+                i (int): Index of the node in the graph
         """
-        self.id = '{};{}'.format(a_id, t_id)
-        self.transcript_id = t_id
+        self.graph = graph
+        self.index = i
+        self.transcript_id = graph.node_tx[i]
         # ID of original annotation/gene prediction
-        self.anno_id = a_id
+        self.anno_id = graph.anno_ids[graph.node_anno[i]]
+        self.id = '{};{}'.format(self.anno_id, self.transcript_id)
+
+    @property
+    def component_id(self):
         # unique ID for a cluster of overlapping transcripts
-        self.component_id = None
+        if not self.graph.node_component:
+            return None
+        return 'g_{}'.format(self.graph.node_component[self.index] + 1)
 
+    @property
+    def edge_to(self):
         # dict of edge_ids of edges that are incident
         # self.edge_to[id of incident Node] = edge_id
-        self.edge_to = {}
-        self.feature_vector = [None] * 4
-        self.evi_support = False
+        g = self.graph
+        result = {}
+        for j in range(g.adj_offset[self.index], g.adj_offset[self.index + 1]):
+            result.update({g.__key__(g.adj_nodes[j]) : 'e{}'.format(g.adj_edges[j])})
+        return result
+
+    @property
+    def feature_vector(self):
+        # features of the transcript, None if they weren't computed (yet)
+        return self.graph.feature_vectors[self.index]
+
+    @feature_vector.setter
+    def feature_vector(self, feature_vector):
+        self.graph.feature_vectors[self.index] = feature_vector
+
+    @property
+    def features(self):
+        # Node_features of the transcript while features may be needed, it
+        # computes them on first access and shares self.feature_vector
+        return self.graph.node_features[self.index]
+
+    @features.setter
+    def features(self, features):
+        self.graph.node_features[self.index] = features
+
+    @property
+    def evi_support(self):
+        return self.graph.evi_support[self.index]
+
+    @evi_support.setter
+    def evi_support(self, support):
+        self.graph.evi_support[self.index] = support
+
+    def get_feature(self, i):
+        """
+            Args:
+                i (int): Position of the feature in the feature vector.
+
+            Returns:
+                (float): Feature score, computed on the first call.
+        """
+        return self.graph.__feature__(self.index, i)
+
+class NodeView(Mapping):
+    """
+        Read-only dict of all nodes of a graph, node IDs ('anno_id;tx_id')
+        are mapped to Node objects in the order of the nodes.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        return Node(self.graph, self.graph.__node_index__()[key])
+
+    def __iter__(self):
+        for i in range(len(self.graph.node_tx)):
+            yield self.graph.__key__(i)
+
+    def __len__(self):
+        return len(self.graph.node_tx)
+
+class EdgeView(Mapping):
+    """
+        Read-only dict of all edges of a graph, edge IDs ('e{i}') are
+        mapped to Edge objects in the order of the edges.
+    """
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __getitem__(self, key):
+        if not key.startswith('e') or not key[1:].isdigit():
+            raise KeyError(key)
+        i = int(key[1:])
+        if i >= len(self):
+            raise KeyError(key)
+        return Edge(self.graph.__key__(self.graph.edge_nodes[0][i]), \
+            self.graph.__key__(self.graph.edge_nodes[1][i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield 'e{}'.format(i)
+
+    def __len__(self):
+        return len(self.graph.edge_nodes[0])
 
 class Graph:
     """
         Overlap graph that can detect and filter overlapping transcripts.
+        Nodes are numbered in the order of the annotations and their
+        transcripts, edges are stored as compressed sparse row arrays.
     """
     def __init__(self, genome_anno_lst, para, verbose=0):
         """
@@ -58,24 +161,79 @@ class Graph:
                 para (dict(float)): Dictionary for parameter used for filtering of transcripts.
                 verbose (int): Verbose mode if verbose >0 .
         """
-        # self.nodes['anno;txid'] = Node(anno, txid)
-        self.nodes = {}
-
-        # self.edges['ei'] = Edge()
-        self.edges = {}
+        # side tables of the nodes, the i-th node is the transcript
+        # self.node_tx[i] of the annotation self.anno_ids[self.node_anno[i]]
+        self.anno_ids = []
+        self.node_anno = array('H')
+        self.node_tx = []
+        # self.anno_tx[self.node_anno[i]] = transcripts of the annotation of node i
+        self.anno_tx = []
+
+        # self.nodes['anno;txid'] = Node(), view of the nodes for the node IDs
+        self.nodes = NodeView(self)
+        # self.edges['ei'] = Edge(), view of the edges for the edge IDs
+        self.edges = EdgeView(self)
+
+        # self.node_index['anno;txid'] = index of the node, see __node_index__()
+        self.node_index = None
+        # node indices of all edges in the order of self.edges,
+        # self.edge_nodes[0][i] and self.edge_nodes[1][i] are node1 and node2 of edge i
+        self.edge_nodes = [array('I'), array('I')]
+        # adjacency of the nodes as compressed sparse rows, node i has the
+        # neighbors self.adj_nodes[j] connected by the edges self.adj_edges[j]
+        # for j in range(self.adj_offset[i], self.adj_offset[i+1])
+        self.adj_offset = array('I', [0])
+        self.adj_nodes = array('I')
+        self.adj_edges = array('I')
 
         # self.anno[annoid] = Anno()
         self.anno = {}
 
-        # list of connected graph components
-        self.component_list = []
-
-        # subset of all transcripts that weren't removed by the transcript comparison rule
-        self.decided_graph = []
+        # node indices of all connected graph components
+        self.components = []
+        # self.node_component[i] = index of the component of node i
+        self.node_component = array('I')
+
+        # disjoint-set forest of the connected components
+        # self.parent[i] = parent node of node i, self.parent[root] = root
+        self.parent = array('I')
+        # self.component_size[root] = number of nodes in the component of root
+        self.component_size = array('I')
+
+        # node indices of all transcripts that weren't removed by the
+        # transcript comparison rule, grouped by annotation
+        # self.decided[i] = nodes of annotation self.anno_ids[i] in the order
+        # of the components
+        self.decided = []
+        # self.removed[i] is True if the i-th node is removed by the
+        # transcript comparison rule, computed by decide_nodes()
+        self.removed = None
+
+        # features of each node, None if they weren't computed (yet)
+        self.feature_vectors = []
+        # Node_features of each node while features may be needed, see __feature__()
+        self.node_features = []
+        self.evi_support = []
+        # feature vectors of all nodes as matrix, computed by add_node_features()
+        self.feature_matrix = None
 
         # dict of duplicate genome annotation ids to new ids
         self.duplicates = {}
 
+        # number of transcripts of each annotation that were dropped by
+        # build() because an earlier transcript has the same CDS fingerprint
+        # self.duplicate_tx[anno_id] = number of duplicates
+        self.duplicate_tx = {}
+
+        # [lookups, hits] of the hints of intron and start/stop codon
+        # features in add_node_features(), a hit is a feature that was
+        # already looked up for another transcript
+        self.feature_lookups = [0, 0]
+
+        # [skipped, total] evaluations of node features, features are only
+        # computed if they are needed to decide an edge or the evidence support
+        self.skipped_features = [0, 0]
+
         # variables for verbose mode
         self.v = verbose
         self.f = [[],[],[],[]]
@@ -97,6 +255,41 @@ class Graph:
                 self.duplicates.update({new_id : ga.id})
                 ga.change_id(new_id)
             self.anno.update({ga.id : ga})
+        self.anno_ids = list(self.anno.keys())
+        self.anno_tx = [self.anno[k].transcripts for k in self.anno_ids]
+
+    @property
+    def decided_graph(self):
+        # node IDs of all transcripts that weren't removed by the
+        # transcript comparison rule
+        return [self.__key__(n) for nodes in self.decided for n in nodes]
+
+    @property
+    def component_list(self):
+        # lists of the node IDs of all connected graph components
+        return [[self.__key__(i) for i in c] for c in self.components]
+
+    def __key__(self, i):
+        # node ID of the i-th node as 'anno_id;tx_id'
+        return '{};{}'.format(self.anno_ids[self.node_anno[i]], self.node_tx[i])
+
+    def __node_index__(self):
+        # dict of node IDs to node indices, created on first use
+        if self.node_index is None:
+            self.node_index = {}
+            for i in range(len(self.node_tx)):
+                self.node_index.update({self.__key__(i) : i})
+        return self.node_index
+
+    def __tx__(self, i):
+        """
+            Args:
+                i (int): Index of a node
+
+            Returns:
+                (Transcript): Transcript of the node
+        """
+        return self.anno_tx[self.node_anno[i]][self.node_tx[i]]
 
     def __tx_from_key__(self, key):
         """
@@ -120,57 +313,198 @@ class Graph:
             Two transcripts overlap if they share at least 3 adjacent protein coding nucleotides.
         """
 
-        # tx_start_end[chr] = [tx_id, coord, id for start or end]
+        # tx_start_end[chr] = [node, coord, id for start or end]
         # for every tx one element for start and one for end
         # this dict is used to check for overlapping transcripts
         tx_start_end = {}
-        # used to check for duplicate txs, list of ['start_end_strand']
-        unique_tx_keys = {}
+        # CDS fingerprints of all unique transcripts, used to check for duplicate txs
+        unique_tx_keys = set()
 
-        for k in self.anno.keys():
+        for a, k in enumerate(self.anno_ids):
+            self.duplicate_tx.update({k : 0})
             for tx in self.anno[k].get_transcript_list():
                 if tx.chr not in tx_start_end.keys():
                     tx_start_end.update({tx.chr : []})
-                    unique_tx_keys.update({tx.chr : {}})
-                unique_key = '{}_{}_{}'.format(tx.start, tx.end, tx.strand)
-                if unique_key in unique_tx_keys[tx.chr].keys():
-                    check = False
-                    coords = tx.get_cds_coords()
-                    for t in unique_tx_keys[tx.chr][unique_key]:
-                        if coords == t.get_cds_coords():
-                            check = True
-                            break
-                    if check:
-                        continue
-                else:
-                    unique_tx_keys[tx.chr].update({unique_key : []})
-                unique_tx_keys[tx.chr][unique_key].append(tx)
-                key = '{};{}'.format(tx.source_anno, \
-                    tx.id)
-                self.nodes.update({key : Node(tx.source_anno, \
-                    tx.id)})
-                tx_start_end[tx.chr].append([key, tx.start, 0])
-                tx_start_end[tx.chr].append([key, tx.end, 1])
+                fingerprint = tx.get_cds_fingerprint()
+                if fingerprint in unique_tx_keys:
+                    self.duplicate_tx[k] += 1
+                    continue
+                unique_tx_keys.add(fingerprint)
+                node = len(self.node_tx)
+                self.node_anno.append(a)
+                self.node_tx.append(tx.id)
+                tx_start_end[tx.chr].append([node, tx.start, 0])
+                tx_start_end[tx.chr].append([node, tx.end, 1])
+        numb_nodes = len(self.node_tx)
+        self.node_index = None
+        self.feature_vectors = [[None] * 4 for i in range(numb_nodes)]
+        self.node_features = [None] * numb_nodes
+        self.evi_support = [False] * numb_nodes
+        self.parent = array('I', range(numb_nodes))
+        self.component_size = array('I', [1]) * numb_nodes
 
         # detect overlapping nodes
-        edge_count = 0
         for chr in tx_start_end.keys():
-            tx_start_end[chr] = sorted(tx_start_end[chr], key=lambda t:(t[1], t[2]))
-            open_intervals = []
-            for interval in tx_start_end[chr]:
-                if interval[2] == 0:
-                    open_intervals.append(interval[0])
+            for n1, n2 in self.overlapping_pairs(tx_start_end[chr]):
+                self.edge_nodes[0].append(n1)
+                self.edge_nodes[1].append(n2)
+                self.__union__(n1, n2)
+        self.__adjacency__()
+
+    def __adjacency__(self):
+        # compressed sparse rows of the edges, the neighbors of each node
+        # are in the order of the edges
+        numb_nodes = len(self.node_tx)
+        degree = [0] * numb_nodes
+        for n in self.edge_nodes[0]:
+            degree[n] += 1
+        for n in self.edge_nodes[1]:
+            degree[n] += 1
+        self.adj_offset = array('I', [0])
+        self.adj_offset.extend(accumulate(degree))
+        size = self.adj_offset[-1]
+        self.adj_nodes = array('I', [0]) * size
+        self.adj_edges = array('I', [0]) * size
+        # next free position in the row of each node
+        pos = self.adj_offset.tolist()
+        for e, (n1, n2) in enumerate(zip(self.edge_nodes[0], self.edge_nodes[1])):
+            self.adj_nodes[pos[n1]] = n2
+            self.adj_edges[pos[n1]] = e
+            pos[n1] += 1
+            self.adj_nodes[pos[n2]] = n1
+            self.adj_edges[pos[n2]] = e
+            pos[n2] += 1
+
+    def __find__(self, n):
+        """
+            Find the root of the component of a node, with path halving.
+
+            Args:
+                n (int): Index of a node
+
+            Returns:
+                (int): Index of the root
+        """
+        parent = self.parent
+        while not parent[n] == n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    def __union__(self, n1, n2):
+        """
+            Merge the components of two nodes, the smaller component
+            is attached to the root of the larger one.
+
+            Args:
+                n1 (int): Index of a node
+                n2 (int): Index of a node
+        """
+        r1 = self.__find__(n1)
+        r2 = self.__find__(n2)
+        if r1 == r2:
+            return
+        if self.component_size[r1] < self.component_size[r2]:
+            r1, r2 = r2, r1
+        self.parent[r2] = r1
+        self.component_size[r1] += self.component_size[r2]
+
+    def overlapping_pairs(self, tx_start_end):
+        """
+            Find all pairs of overlapping transcripts of one sequence
+            (same result as compare_tx_cds() for all pairs of transcripts
+            with overlapping start/end coordinates).
+            Only CDS segments on the same strand and reading frame are compared
+            with an index of the CDS segments sorted by start coordinate.
+
+            Args:
+                tx_start_end (list(list)): [node, coord, 0 for start or 1 for end]
+                                           for each start and end of all
+                                           transcripts of a sequence
+
+            Returns:
+                (list(list(int))): Pairs of node indices [n1, n2] of overlapping
+                                   transcripts, n1 is the transcript that ends first.
+                                   Pairs are sorted by the end of n1 and the start of n2.
+        """
+        # rank of the start/end of each tx in the sorted list of all starts and ends
+        start_rank = {}
+        end_rank = {}
+        tx_start_end = sorted(tx_start_end, key=lambda t:(t[1], t[2]))
+        for i, interval in enumerate(tx_start_end):
+            if interval[2] == 0:
+                start_rank.update({interval[0] : i})
+            else:
+                end_rank.update({interval[0] : i})
+
+        def sort_pair(n1, n2):
+            if end_rank[n1] < end_rank[n2]:
+                return (n1, n2)
+            return (n2, n1)
+
+        # cds_index['strand_phase'] = [[start, end, node]] of all CDS segments
+        cds_index = {}
+        # nodes that have overlapping CDS segments in the same reading frame,
+        # they overlap with all transcripts on the same strand
+        self_overlap = []
+        for node in start_rank.keys():
+            tx = self.__tx__(node)
+            coords = tx.get_cds_coords()
+            for phase in coords.keys():
+                cds = sorted(coords[phase], key=lambda c:c[0])
+                for i in range(1, len(cds)):
+                    if cds[i-1][1] - cds[i][0] > 1:
+                        self_overlap.append(node)
+                        break
+                index_key = '{}_{}'.format(tx.strand, phase)
+                if index_key not in cds_index.keys():
+                    cds_index.update({index_key : []})
+                cds_index[index_key] += [[c[0], c[1], node] for c in cds]
+
+        pairs = set()
+        for index_key in cds_index.keys():
+            segments = sorted(cds_index[index_key], key=lambda c:c[0])
+            # heap of [end, i] of segments that share at least 3 nucleotides
+            # with all following segments that start before end - 1
+            open_segments = []
+            # segments shorter than 3 nucleotides with the current start
+            short_segments = []
+            for i, (start, end, node) in enumerate(segments):
+                while open_segments and open_segments[0][0] - start <= 1:
+                    heapq.heappop(open_segments)
+                if short_segments and segments[short_segments[0]][0] < start:
+                    short_segments = []
+                for j in [s[1] for s in open_segments] + short_segments:
+                    match = segments[j][2]
+                    if match == node:
+                        continue
+                    pair = sort_pair(node, match)
+                    if segments[j][0] == start:
+                        # same start: the segment of the transcript that
+                        # ends first has to be at least 3 nucleotides long
+                        if pair[0] == node:
+                            first_end = end
+                        else:
+                            first_end = segments[j][1]
+                        if first_end - start <= 1:
+                            continue
+                    pairs.add(pair)
+                if end - start > 1:
+                    heapq.heappush(open_segments, [end, i])
                 else:
-                    open_intervals.remove(interval[0])
-                    for match in open_intervals:
-                        tx1 = self.__tx_from_key__(interval[0])
-                        tx2 = self.__tx_from_key__(match)
-                        if self.compare_tx_cds(tx1, tx2):
-                            new_edge_key = 'e{}'.format(edge_count)
-                            edge_count += 1
-                            self.edges.update({new_edge_key : Edge(interval[0], match)})
-                            self.nodes[interval[0]].edge_to.update({match : new_edge_key})
-                            self.nodes[match].edge_to.update({interval[0] : new_edge_key})
+                    short_segments.append(i)
+
+        for node in self_overlap:
+            strand = self.__tx__(node).strand
+            for match in start_rank.keys():
+                if match == node or not self.__tx__(match).strand == strand:
+                    continue
+                pair = sort_pair(node, match)
+                # pair[1] has to start before pair[0] ends
+                if start_rank[pair[1]] < end_rank[pair[0]]:
+                    pairs.add(pair)
+
+        return sorted(pairs, key=lambda p:(end_rank[p[0]], start_rank[p[1]]))
 
     def compare_tx_cds(self, tx1, tx2):
         """
@@ -207,51 +541,125 @@ class Graph:
             print(self.nodes[k].edge_to.keys())
             print('\n')
 
+    def __components__(self):
+        # node indices of all components in the order of their first node,
+        # nodes of a component are in the order of __traverse__()
+        numb_nodes = len(self.node_tx)
+        self.components = []
+        self.node_component = array('I', [0]) * numb_nodes
+        # component_index[root] = index of the component in self.components
+        component_index = [-1] * numb_nodes
+        for n in range(numb_nodes):
+            root = self.__find__(n)
+            if component_index[root] < 0:
+                component_index[root] = len(self.components)
+                self.components.append([])
+            i = component_index[root]
+            self.components[i].append(n)
+            self.node_component[n] = i
+        for i, component in enumerate(self.components):
+            if len(component) > 2:
+                self.components[i] = self.__traverse__(component[0])
+        return self.components
+
+    def __traverse__(self, n):
+        """
+            List the nodes of a component in the order of the original
+            traversal: the neighbors of n, then the new neighbors of the
+            last listed node that wasn't expanded yet, and so on.
+            The order of the transcripts in the output depends on it.
+
+            Args:
+                n (int): Index of the first node of the component
+
+            Returns:
+                (list(int)): Indices of all nodes of the component
+        """
+        adj_offset = self.adj_offset
+        adj_nodes = self.adj_nodes
+        component = [n]
+        listed = set(component)
+        not_visited = []
+        while True:
+            for m in adj_nodes[adj_offset[n]:adj_offset[n+1]]:
+                if m not in listed:
+                    listed.add(m)
+                    component.append(m)
+                    not_visited.append(m)
+            if not not_visited:
+                return component
+            n = not_visited.pop()
+
     def connected_components(self):
         """
             Compute all clusters of connected transcripts.
             A cluster is connected component of the graph.
-            Adds component IDs to nodes.
+            Adds component IDs to nodes. Components are numbered in the order
+            of their first node, nodes of a component are in the order in which
+            they are reached from the first node (see __traverse__()).
 
             Returns:
                 (list(list(str))): Lists of list of all node IDs of a component.
         """
-        visited = []
-        self.component_list = []
-        component_index = 0
-        for key in list(self.nodes.keys()):
-            component = [key]
-            if key in visited:
-                continue
-            visited.append(key)
-            not_visited = list(self.nodes[key].edge_to.keys())
-            component += not_visited
-            while not_visited:
-                next_node = not_visited.pop()
-                visited.append(next_node)
-                new_nodes = [n for n in self.nodes[next_node].edge_to.keys() if n not in component]
-                not_visited += new_nodes
-                component += new_nodes
-            self.component_list.append(component)
-            component_index += 1
-            for node in component:
-                self.nodes[node].component_id = 'g_{}'.format(component_index)
+        self.__components__()
         return self.component_list
 
     def add_node_features(self, evi):
         """
-            Compute for all nodes the feature vector based on the evidence support by evi.
+            Add the features based on the evidence support by evi to all nodes.
+            The absolute support (features 3 and 4) is only computed for nodes
+            of edges that aren't decided by the relative support (features 1
+            and 2). If NumPy is available, the features of all nodes are
+            computed at once and stored as matrix in self.feature_matrix
+            (one row per node). Otherwise, each feature of a node is computed
+            on its first access, see __feature__().
 
             Args:
                 evi (Evidence): Evidence class object with all hints from any source.
         """
-        for key in self.nodes.keys():
-            tx = self.__tx_from_key__(key)
-            new_node_feature = Node_features(tx, evi, self.para)
-            self.nodes[key].feature_vector = new_node_feature.get_features()
-            if self.nodes[key].feature_vector[0] >= self.para['intron_support'] \
-                or self.nodes[key].feature_vector[1] >= self.para['stasto_support']:
-                self.nodes[key].evi_support = True
+        if np is None:
+            cache = FeatureCache(evi, self.para)
+            for n in range(len(self.node_tx)):
+                features = Node_features(self.__tx__(n), evi, self.para, cache)
+                self.feature_vectors[n] = features.feature_vector
+                if features.get_feature(0) >= self.para['intron_support'] \
+                    or features.get_feature(1) >= self.para['stasto_support']:
+                    self.evi_support[n] = True
+                # only nodes with edges may need more features
+                if self.adj_offset[n + 1] > self.adj_offset[n]:
+                    self.node_features[n] = features
+            self.feature_lookups = [cache.lookups, cache.hits]
+            return
+
+        self.feature_matrix = feature_matrix([self.__tx__(n) for n in \
+            range(len(self.node_tx))], evi, self.para, self.feature_lookups, \
+            self.__tied_nodes__)
+        evi_support = (self.feature_matrix[:,0] >= self.para['intron_support']) \
+            | (self.feature_matrix[:,1] >= self.para['stasto_support'])
+        # features that weren't needed are None in the feature vectors
+        feature_vectors = self.feature_matrix.astype(object)
+        feature_vectors[np.isnan(self.feature_matrix)] = None
+        self.feature_vectors = feature_vectors.tolist()
+        self.evi_support = evi_support.tolist()
+
+    def __tied_nodes__(self, relative_support):
+        # boolean array of the nodes of all edges that aren't decided by
+        # features 1 and 2, relative_support has one row per node
+        node1 = np.frombuffer(self.edge_nodes[0], dtype='I').astype(np.int64)
+        node2 = np.frombuffer(self.edge_nodes[1], dtype='I').astype(np.int64)
+        diff = np.abs(relative_support[node1,:2] - relative_support[node2,:2])
+        tied = (diff[:,0] <= self.para['e_1']) & (diff[:,1] <= self.para['e_2'])
+        result = np.zeros(len(relative_support), dtype=bool)
+        result[node1[tied]] = True
+        result[node2[tied]] = True
+        return result
+
+    def __feature__(self, n, i):
+        # i-th feature of node n, computed by its Node_features on first access
+        feature = self.feature_vectors[n][i]
+        if feature is None:
+            return self.node_features[n].get_feature(i)
+        return feature
 
     def decide_edge(self, edge):
         """
@@ -263,56 +671,123 @@ class Graph:
             Returns:
                 (str): node ID of the transcript that is marked for removal
         """
-        n1 = self.nodes[edge.node1]
-        n2 = self.nodes[edge.node2]
+        node_index = self.__node_index__()
+        n = self.__compare__(node_index[edge.node1], node_index[edge.node2])
+        if n is None:
+            return None
+        return self.__key__(n)
+
+    def __compare__(self, n1, n2):
+        # index of the node n1 or n2 that is removed by the transcript
+        # comparison rule, None if it doesn't decide the pair
         for i in range(0,4):
-            diff = n1.feature_vector[i] - n2.feature_vector[i]
+            diff = self.__feature__(n1, i) - self.__feature__(n2, i)
             #print(diff)
             if diff > self.para['e_{}'.format(i+1)]:
-                self.f[i].append(n2.id)
-                return n2.id
+                self.f[i].append(n2)
+                return n2
             elif diff < (-1 * self.para['e_{}'.format(i+1)]):
-                self.f[i].append(n1.id)
-                return n1.id
+                self.f[i].append(n1)
+                return n1
         return None
 
+    def decide_edges(self):
+        """
+            Apply the transcript comparison rule to all edges at once
+            (same result as decide_edge() for each edge). Requires self.feature_matrix.
+
+            Returns:
+                (numpy.ndarray): For each edge the index of the node that
+                                 is marked for removal, -1 if no node is removed.
+        """
+        node1 = np.frombuffer(self.edge_nodes[0], dtype='I').astype(np.int64)
+        node2 = np.frombuffer(self.edge_nodes[1], dtype='I').astype(np.int64)
+        diff = self.feature_matrix[node1] - self.feature_matrix[node2]
+        epsilon = np.array([self.para['e_{}'.format(i+1)] for i in range(0,4)], \
+            dtype=np.float64)
+        remove_node2 = diff > epsilon
+        decisive = remove_node2 | (diff < (-1 * epsilon))
+        # first feature that decides each edge
+        feature = np.argmax(decisive, axis=1)
+        is_decided = decisive[np.arange(len(feature)), feature]
+        node_to_remove = np.where(remove_node2[np.arange(len(feature)), feature], \
+            node2, node1)
+        node_to_remove[~is_decided] = -1
+
+        if self.v > 0:
+            for i in range(0,4):
+                self.f[i] += node_to_remove[is_decided & (feature == i)].tolist()
+        return node_to_remove
+
+    def decide_nodes(self):
+        """
+            Apply the transcript comparison rule to all edges in one pass over
+            the edge arrays. A node is removed if any neighbor is decisively
+            better in the first feature that differs by more than the
+            tolerance. With NumPy, the edges are compared at once and grouped
+            by their deciding feature, see decide_edges(). Otherwise, the
+            features are compared edge by edge and edges whose nodes are both
+            removed are skipped (the verbose statistics need all edges).
+
+            Returns:
+                (list(boolean)): For each node True if it is removed.
+        """
+        if self.feature_matrix is not None:
+            removed = np.zeros(len(self.node_tx), dtype=bool)
+            if self.edge_nodes[0]:
+                node_to_remove = self.decide_edges()
+                removed[node_to_remove[node_to_remove >= 0]] = True
+            return removed.tolist()
+
+        removed = [False] * len(self.node_tx)
+        for n1, n2 in zip(self.edge_nodes[0], self.edge_nodes[1]):
+            if removed[n1] and removed[n2] and self.v == 0:
+                continue
+            node_to_remove = self.__compare__(n1, n2)
+            if node_to_remove is not None:
+                removed[node_to_remove] = True
+        return removed
+
     def decide_component(self, component):
         """
             Applies transcript comparison rule to all transcripts of one component
-            and returns the node IDs of all transcripts that are not removed by
+            and returns the nodes of all transcripts that are not removed by
             a comparison.
 
             Args:
-                component (list(str)): List of node IDs
+                component (list(int)): List of node indices
 
             Returns:
-                (list(str)): Filtered subset of component list.
-        """
-        # return all ids of vertices of a graph component, that weren't excluded by the decision rule
-        result = component.copy()
-        for node_id in component:
-            for e_id in self.nodes[node_id].edge_to.values():
-                node_to_remove = self.edges[e_id].node_to_remove
-                if node_to_remove:
-                    if node_to_remove in result:
-                        result.remove(node_to_remove)
-        return result
+                (list(int)): Filtered subset of component list.
+        """
+        if self.removed is None:
+            self.removed = self.decide_nodes()
+        return [n for n in component if not self.removed[n]]
 
     def decide_graph(self):
         """
             Create list of connected components of the graph and apply the
-            transcript comparison rule to all components.
-        """
-        for key in self.edges.keys():
-            self.edges[key].node_to_remove = self.decide_edge(self.edges[key])
-        self.decided_graph = []
-        if not self.component_list:
-            self.connected_components()
-        for component in self.component_list:
-            if len(component) > 1:
-                self.decided_graph += self.decide_component(component)
-            else:
-                self.decided_graph += component
+            transcript comparison rule to all components. The nodes that
+            aren't removed are collected for each annotation in one pass
+            over the components.
+        """
+        self.removed = self.decide_nodes()
+        if not self.components:
+            self.__components__()
+        self.decided = [[] for a in self.anno_ids]
+        for component in self.components:
+            for n in component:
+                if not self.removed[n]:
+                    self.decided[self.node_anno[n]].append(n)
+
+        if self.feature_matrix is None:
+            skipped = 0
+            for feature_vector in self.feature_vectors:
+                skipped += feature_vector.count(None)
+            self.node_features = [None] * len(self.node_tx)
+        else:
+            skipped = int(np.isnan(self.feature_matrix).sum())
+        self.skipped_features = [skipped, 4 * len(self.node_tx)]
 
     def get_decided_graph(self):
         """
@@ -327,19 +802,16 @@ class Graph:
                 for all input annotations
 
         """
-        if not self.decided_graph:
+        if self.removed is None:
             self.decide_graph()
         # result[anno_id] = [[tx_ids, new_gene_id]]
         result = {}
-        for key in self.anno.keys():
-            result.update({key : []})
-        for node in self.decided_graph:
-            if self.nodes[node].evi_support:
-                anno_id, tx_id = node.split(';')
-                result[anno_id].append([tx_id, self.nodes[node].component_id])
+        for key, nodes in zip(self.anno_ids, self.decided):
+            result.update({key : [[self.node_tx[n], 'g_{}'.format(\
+                self.node_component[n] + 1)] for n in nodes if self.evi_support[n]]})
 
         if self.v > 0:
-            print('NODES: {}'.format(len(self.nodes.keys())))
+            print('NODES: {}'.format(len(self.node_tx)))
             f = list(map(set, self.f))
             print('f1: {}'.format(len(f[0])))
             u = f[0]
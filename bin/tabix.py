@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# tabix.py: Reads the lines of a region from a BGZF compressed
+# gtf/gff file with a tabix (.tbi) or CSI (.csi) index, and creates
+# tabix indices.
+# ==============================================================
+import os
+import csv
+import struct
+
+from compressed import open_file, BgzfReader, BgzfWriter, inflate_block
+
+class TabixError(Exception):
+    pass
+
+def reg2bins(beg, end, min_shift, depth):
+    """
+        Returns:
+            (list(int)): Bins that may contain records in [beg, end),
+                         0-based coordinates.
+    """
+    bins = []
+    end -= 1
+    shift = min_shift + 3 * depth
+    t = 0
+    for level in range(depth + 1):
+        bins += range(t + (beg >> shift), t + (end >> shift) + 1)
+        shift -= 3
+        t += 1 << (3 * level)
+    return bins
+
+def reg2bin(beg, end, min_shift=14, depth=5):
+    """
+        Returns:
+            (int): Smallest bin that contains [beg, end), 0-based coordinates.
+    """
+    end -= 1
+    shift = min_shift
+    t = ((1 << (3 * depth)) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> shift == end >> shift:
+            return t + (beg >> shift)
+        shift += 3
+        t -= 1 << (3 * (level - 1))
+    return 0
+
+def index_path(path):
+    """
+        Returns:
+            (str): Path to the tabix or CSI index of path, None if there is none.
+    """
+    for suffix in ['.tbi', '.csi']:
+        if os.path.exists(path + suffix):
+            return path + suffix
+    return None
+
+class TabixIndex:
+    """
+        Tabix or CSI index of a BGZF compressed gtf/gff file. It has the same
+        interface as ChrBlocks, line numbers are the virtual offsets of the lines.
+    """
+    def __init__(self, path, index=None):
+        """
+            Args:
+                path (str): Path to a BGZF compressed gtf/gff file.
+                index (str): Path to its .tbi or .csi index.
+        """
+        self.path = path
+        # self.bins[chr][bin] = [[begin, end]] virtual offsets of chunks
+        self.bins = {}
+        # self.linear[chr] = minimal virtual offset of records in each 16kb window (.tbi)
+        self.linear = {}
+        self.min_shift = 14
+        self.depth = 5
+        self.read_index(index or index_path(path))
+
+    def read_index(self, index):
+        with open_file(index, binary=True) as file:
+            data = file.read()
+        magic = data[:4]
+        if magic == b'TBI\x01':
+            n_ref = struct.unpack('<i', data[4:8])[0]
+            pos = 8
+        elif magic == b'CSI\x01':
+            self.min_shift, self.depth, l_aux = struct.unpack('<iii', data[4:16])
+            pos = 16
+        else:
+            raise TabixError('{} is not a tabix or CSI index.'.format(index))
+        # tabix header, for CSI in the auxiliary data
+        self.col_seq, self.col_beg, self.col_end, meta, skip, l_nm = \
+            struct.unpack('<iiiiii', data[pos+4:pos+28])
+        self.meta = bytes([meta])
+        names = data[pos+28:pos+28+l_nm].split(b'\0')[:-1]
+        names = [n.decode() for n in names]
+        if magic == b'CSI\x01':
+            pos += l_aux
+            n_ref = struct.unpack('<i', data[pos:pos+4])[0]
+            pos += 4
+        else:
+            pos += 28 + l_nm
+
+        for name in names[:n_ref]:
+            bins = {}
+            n_bin = struct.unpack('<i', data[pos:pos+4])[0]
+            pos += 4
+            for i in range(n_bin):
+                if magic == b'TBI\x01':
+                    bin, n_chunk = struct.unpack('<Ii', data[pos:pos+8])
+                    pos += 8
+                else:
+                    bin, loffset, n_chunk = struct.unpack('<IQi', data[pos:pos+16])
+                    pos += 16
+                bins.update({bin : [list(struct.unpack('<QQ', data[p:p+16])) \
+                    for p in range(pos, pos + 16 * n_chunk, 16)]})
+                pos += 16 * n_chunk
+            self.bins.update({name : bins})
+            if magic == b'TBI\x01':
+                n_intv = struct.unpack('<i', data[pos:pos+4])[0]
+                self.linear.update({name : struct.unpack('<{}Q'.format(n_intv), \
+                    data[pos+4:pos+4+8*n_intv])})
+                pos += 4 + 8 * n_intv
+
+    def chromosomes(self):
+        """
+            Returns:
+                (list(str)): Names of all sequences in the index.
+        """
+        return list(self.bins.keys())
+
+    def chunks(self, chr, start=None, end=None):
+        """
+            Args:
+                chr (str): Chromosome name
+                start (int): Start of the region (1-based), whole chr if None
+                end (int): End of the region (1-based, inclusive)
+
+            Returns:
+                (list(list(int))): Sorted and merged [begin, end] virtual
+                                   offsets of all chunks that may contain
+                                   lines of the region.
+        """
+        bins = self.bins.get(chr, {})
+        if start is None:
+            chunks = [c for b in bins.values() for c in b]
+        else:
+            chunks = []
+            for bin in reg2bins(start - 1, end, self.min_shift, self.depth):
+                chunks += bins.get(bin, [])
+            linear = self.linear.get(chr, ())
+            window = (start - 1) >> 14
+            if linear and self.min_shift == 14:
+                min_offset = linear[min(window, len(linear) - 1)]
+                chunks = [c for c in chunks if c[1] > min_offset]
+        result = []
+        for c in sorted(chunks):
+            if result and c[0] <= result[-1][1]:
+                result[-1][1] = max(result[-1][1], c[1])
+            else:
+                result.append(list(c))
+        return result
+
+    def size(self, chr):
+        """
+            Returns:
+                (int): Approximate number of compressed bytes of all lines of chr.
+        """
+        return sum([(c[1] >> 16) - (c[0] >> 16) + 1 for c in self.chunks(chr)])
+
+    def rows(self, chr, start=None, end=None):
+        """
+            Read all lines of a chromosome or of all lines overlapping a region.
+
+            Args:
+                chr (str): Chromosome name
+                start (int): Start of the region, whole chr if None
+                end (int): End of the region
+
+            Yields:
+                (int, list(str)): Virtual offset and line as list
+        """
+        reader = BgzfReader(self.path, threads=1)
+        try:
+            for begin, chunk_end in self.chunks(chr, start, end):
+                for offset, line in self.__lines__(reader, begin, chunk_end):
+                    if not line or line.startswith(self.meta):
+                        continue
+                    row = next(csv.reader([line.decode()], delimiter='\t'))
+                    if not row[self.col_seq - 1] == chr:
+                        continue
+                    if start is not None and (int(row[self.col_beg - 1]) > end \
+                        or int(row[self.col_end - 1]) < start):
+                        continue
+                    yield offset, row
+        finally:
+            reader.close()
+
+    def __lines__(self, reader, begin, end):
+        # lines that start in [begin, end) as virtual offset and bytes
+        block_offset, pos = begin >> 16, begin & 0xffff
+        partial = b''
+        partial_offset = None
+        while True:
+            reader.file.seek(block_offset)
+            block = reader.__next_block__()
+            if block is None:
+                break
+            data = inflate_block(*block)
+            next_block_offset = reader.file.tell()
+            while pos < len(data):
+                offset = block_offset << 16 | pos
+                if not partial and offset >= end:
+                    return
+                newline = data.find(b'\n', pos)
+                if newline < 0:
+                    if not partial:
+                        partial_offset = offset
+                    partial += data[pos:]
+                    break
+                line = data[pos:newline].rstrip(b'\r')
+                if partial:
+                    line = partial + line
+                    offset = partial_offset
+                    partial = b''
+                yield offset, line
+                pos = newline + 1
+            block_offset = next_block_offset
+            pos = 0
+        if partial:
+            yield partial_offset, partial.rstrip(b'\r')
+
+class TabixIndexer:
+    """
+        Creates the tabix index (.tbi) of a BGZF compressed gtf/gff file
+        (same as 'tabix -p gff') while the lines are written. The tabix
+        format only covers positions below 2^29, if a line ends behind that
+        a CSI index (.csi) with more bin levels is created instead (same as
+        'tabix --csi -p gff').
+        Lines have to be sorted by start, the lines of a sequence have
+        to be consecutive.
+    """
+    def __init__(self):
+        # sequence names in order of the lines
+        self.names = []
+        # self.bins[chr][level, window] = [[begin, end]] positions of chunks,
+        # level 0 has bins of 16kb, each level above has 8 times larger bins
+        self.bins = {}
+        # self.linear[chr] = minimal position of the lines in each 16kb
+        # window, None for empty windows
+        self.linear = {}
+        self.last_start = 0
+        self.max_end = 0
+
+    def add(self, chr, beg, end, begin_pos, end_pos):
+        """
+            Args:
+                chr (str): Sequence name of a line
+                beg (int): Start of the line (0-based)
+                end (int): End of the line (0-based, exclusive)
+                begin_pos (int): Position of the line in the BGZF file
+                end_pos (int): Position behind the line
+        """
+        if not self.names or not self.names[-1] == chr:
+            if chr in self.bins.keys():
+                raise TabixError('Lines of {} are not consecutive.'.format(chr))
+            self.names.append(chr)
+            self.bins.update({chr : {}})
+            self.linear.update({chr : []})
+        elif beg < self.last_start:
+            raise TabixError('Lines of {} are not sorted by start.'.format(chr))
+        self.last_start = beg
+        end = max(end, beg + 1)
+        self.max_end = max(self.max_end, end)
+
+        # smallest bin that contains [beg, end)
+        level = 0
+        shift = 14
+        while not beg >> shift == (end - 1) >> shift:
+            level += 1
+            shift += 3
+        bin = (level, beg >> shift)
+        if bin not in self.bins[chr].keys():
+            self.bins[chr].update({bin : []})
+        chunks = self.bins[chr][bin]
+        if chunks and chunks[-1][1] == begin_pos:
+            chunks[-1][1] = end_pos
+        else:
+            chunks.append([begin_pos, end_pos])
+        linear = self.linear[chr]
+        for window in range(beg >> 14, ((end - 1) >> 14) + 1):
+            if window >= len(linear):
+                linear += [None] * (window + 1 - len(linear))
+            if linear[window] is None:
+                linear[window] = begin_pos
+
+    def is_csi(self):
+        """
+            Returns:
+                (boolean): True if the lines need a CSI index.
+        """
+        return self.max_end > 1 << 29
+
+    def suffix(self):
+        """
+            Returns:
+                (str): File suffix of the index, '.tbi' or '.csi'.
+        """
+        if self.is_csi():
+            return '.csi'
+        return '.tbi'
+
+    def depth(self):
+        """
+            Returns:
+                (int): Number of bin levels below the root bin, 5 for tabix
+                       and the smallest depth that covers all lines for CSI.
+        """
+        if not self.is_csi():
+            return 5
+        # as in htslib, with some space behind the last line
+        depth = 0
+        while self.max_end + 256 > 1 << (14 + 3 * depth):
+            depth += 1
+        return depth
+
+    def write(self, path, virtual_offset=None):
+        """
+            Write the index as BGZF compressed file.
+
+            Args:
+                path (str): Path to the index file, see suffix()
+                virtual_offset (function): Virtual file offset of a position
+                                           of add(), e.g. BgzfWriter.virtual_offset
+        """
+        if virtual_offset is None:
+            virtual_offset = lambda pos:pos
+        csi = self.is_csi()
+        depth = self.depth()
+        names = b''.join([n.encode() + b'\0' for n in self.names])
+        # format 0 (generic), columns of sequence, start and end, meta char, skip
+        header = struct.pack('<iiiiiii', 0, 1, 4, 5, ord('#'), 0, len(names)) \
+            + names
+        if csi:
+            index = [b'CSI\x01', struct.pack('<iii', 14, depth, len(header)), \
+                header, struct.pack('<i', len(self.names))]
+        else:
+            index = [b'TBI\x01', struct.pack('<i', len(self.names)), header]
+        for chr in self.names:
+            # empty windows have the offset of the previous window
+            offsets = []
+            previous = 0
+            for pos in self.linear[chr]:
+                if pos is not None:
+                    previous = virtual_offset(pos)
+                offsets.append(previous)
+            index.append(struct.pack('<i', len(self.bins[chr])))
+            for (level, window), chunks in self.bins[chr].items():
+                bin = ((1 << (3 * (depth - level))) - 1) // 7 + window
+                if csi:
+                    # offset of the first line that overlaps the bin
+                    first = window << (3 * level)
+                    index.append(struct.pack('<IQi', bin, offsets[first], \
+                        len(chunks)))
+                else:
+                    index.append(struct.pack('<Ii', bin, len(chunks)))
+                for begin, end in chunks:
+                    index.append(struct.pack('<QQ', virtual_offset(begin), \
+                        virtual_offset(end)))
+            if not csi:
+                index.append(struct.pack('<i{}Q'.format(len(offsets)), \
+                    len(offsets), *offsets))
+        writer = BgzfWriter(path, threads=1)
+        writer.write(b''.join(index))
+        writer.close()
@@ -19,6 +19,22 @@ graph = None
 out = ''
 v = 0
 quiet = False
+stream = False
+# sort the output by sequence name and start coordinate
+sort_output = False
+# write the output as BGZF with a tabix index
+bgzf_output = False
+threads = 1
+hint_cache = ''
+anno_cache = ''
+# keep byte offsets of the gene prediction lines instead of their attributes
+line_refs = False
+# add chromosome and strand to the transcript and gene IDs of the gene predictions
+fix_ids = False
+# number of processes that read the inputs, they are read in the main process by default
+load_processes = 1
+# [chr, start, end] of each region, None for all chromosomes
+regions = None
 parameter = {'intron_support' : 0, 'stasto_support' : 0, \
     'e_1' : 0, 'e_2' : 0, 'e_3' : 0, 'e_4' : 0}
 
@@ -37,9 +53,9 @@ def main():
         8. Create combined gene predicitions (all transcripts that weren't excluded).
     """
 
-    from genome_anno import Anno
     from overlap_graph import Graph
-    from evidence import Evidence
+    from input_loader import load_inputs
+    from gtf_writer import GtfWriter
 
     global anno, graph, parameter
 
@@ -49,26 +65,20 @@ def main():
     if v > 0:
         print(gtf)
 
-    # read gene prediciton files
-    c = 1
-    for g in gtf:
-        if not quiet:
-            sys.stderr.write('### READING GENE PREDICTION: [{}]\n'.format(g))
-        anno.append(Anno(g, 'anno{}'.format(c)))
-        anno[-1].addGtf()
-        anno[-1].norm_tx_format()
-        c += 1
-
-    # read hintfiles
-    evi = Evidence()
-    for h in hintfiles:
-        if not quiet:
-            sys.stderr.write('### READING EXTRINSIC EVIDENCE: [{}]\n'.format(h))
-        evi.add_hintfile(h)
+    if stream or threads > 1 or regions is not None:
+        main_stream()
+        return
+
+    # read gene prediciton files and hintfiles, concurrently if
+    # there is more than one input and CPU
+    anno, evi = load_inputs(gtf, hintfiles, load_processes, anno_cache, \
+        hint_cache, quiet, line_refs, fix_ids)
     for src in evi.src:
         if src not in parameter.keys():
             sys.stderr.write('ConfigError: No weight for src={}, it is set to 1\n'.format(src))
             parameter.update({src : 1})
+    # weight the hints once, features need one lookup per intron or codon
+    evi.set_weights(parameter)
 
     # create graph with an edge for each unique transcript
     # and an edge if two transcripts overlap
@@ -77,6 +87,7 @@ def main():
     if not quiet:
         sys.stderr.write('### BUILD OVERLAP GRAPH\n')
     graph.build()
+    report_duplicates(graph.duplicate_tx)
 
     # add features
     if not quiet:
@@ -87,6 +98,8 @@ def main():
     if not quiet:
         sys.stderr.write('### SELECT TRANSCRIPTS\n')
     combined_prediction = graph.get_decided_graph()
+    report_feature_lookups(graph.feature_lookups)
+    report_skipped_features(graph.skipped_features)
 
     if v > 0:
         sys.stderr.write(str(combined_prediction.keys()) + '\n')
@@ -96,19 +109,91 @@ def main():
     # write result to output file
     if not quiet:
         sys.stderr.write('### WRITE COMBINED GENE PREDICTION\n')
-    combined_gtf = []
-    for a in anno:
-        combined_gtf += a.get_subset_gtf(combined_prediction[a.id])
-    with open(out, 'w+') as file:
-        out_writer = csv.writer(file, delimiter='\t', quotechar = "'")
-        for line in combined_gtf:
-            out_writer.writerow(line)
+    with GtfWriter(out, sort_output, bgzf=bgzf_output) as writer:
+        for a in anno:
+            writer.add(a.iter_subset_gtf(combined_prediction[a.id], sort_output))
 
     if not quiet:
         sys.stderr.write('### FINISHED\n\n')
         sys.stderr.write('### The combined gene prediciton is located at {}.\n'.format(\
             out))
 
+def main_stream():
+    """
+        Same as main(), but the gene predictions and hints are read,
+        and the transcripts are selected one chromosome at a time.
+        With more than one thread, several chromosomes are processed in parallel.
+    """
+    from chr_stream import ChrStream
+
+    if anno_cache:
+        sys.stderr.write('WARNING: --anno-cache is only used for the indices of the ' \
+            + 'input files with --stream or --threads.\n')
+    if line_refs:
+        sys.stderr.write('WARNING: --line-refs is not used with --stream or --threads.\n')
+    hint_db = None
+    if hint_cache:
+        from hint_db import load_hint_db
+        hint_db = load_hint_db(hintfiles, hint_cache, quiet)
+    if not quiet:
+        sys.stderr.write('### INDEX SEQUENCES OF GENE PREDICTIONS AND EXTRINSIC EVIDENCE\n')
+    chr_stream = ChrStream(gtf, hintfiles, parameter, verbose=v, quiet=quiet, \
+        threads=threads, hint_db=hint_db, regions=regions, sort=sort_output, \
+        fix_ids=fix_ids, index_dir=hint_cache or anno_cache)
+    chr_stream.run()
+    report_duplicates(chr_stream.duplicate_tx)
+    report_feature_lookups(chr_stream.feature_lookups)
+    report_skipped_features(chr_stream.skipped_features)
+
+    if not quiet:
+        sys.stderr.write('### WRITE COMBINED GENE PREDICTION\n')
+    chr_stream.write(out, bgzf_output)
+
+    if not quiet:
+        sys.stderr.write('### FINISHED\n\n')
+        sys.stderr.write('### The combined gene prediciton is located at {}.\n'.format(\
+            out))
+
+def report_duplicates(duplicate_tx):
+    """
+        Print the number of duplicate transcripts of each annotation.
+
+        Args:
+            duplicate_tx (dict(int)): Number of duplicates for each annotation ID.
+    """
+    if quiet:
+        return
+    for anno_id, numb in duplicate_tx.items():
+        sys.stderr.write('### COLLAPSED DUPLICATE TRANSCRIPTS OF [{}]: {}\n'.format(\
+            anno_id, numb))
+
+def report_feature_lookups(feature_lookups):
+    """
+        Print the hit rate of the memo table of intron and start/stop codon features.
+
+        Args:
+            feature_lookups (list(int)): Number of lookups and hits.
+    """
+    if quiet or feature_lookups[0] == 0:
+        return
+    sys.stderr.write('### FEATURE CACHE HIT RATE: {:.1f}% ({} of {} lookups)\n'.format(\
+        100.0 * feature_lookups[1] / feature_lookups[0], feature_lookups[1], \
+        feature_lookups[0]))
+
+def report_skipped_features(skipped_features):
+    """
+        Print the number of node features that weren't needed by the
+        transcript comparison rule and weren't computed.
+
+        Args:
+            skipped_features (list(int)): Number of skipped and of all features.
+    """
+    if quiet or skipped_features[1] == 0:
+        return
+    sys.stderr.write('### SKIPPED FEATURE EVALUATIONS: {:.1f}% ({} of {})\n'.format(\
+        100.0 * skipped_features[0] / skipped_features[1], skipped_features[0], \
+        skipped_features[1]))
+
 def set_parameter(cfg_file):
     """
         read parameters from the cfg file and store them in the dict parameter.
@@ -126,7 +211,9 @@ def set_parameter(cfg_file):
                 parameter[line[0]] = float(line[1])
 
 def init(args):
-    global gtf, hintfiles, threads, hint_source_weight, out, v, quiet
+    global gtf, hintfiles, threads, hint_source_weight, out, v, quiet, stream, \
+        hint_cache, anno_cache, regions, load_processes, sort_output, line_refs, \
+        bgzf_output, fix_ids
     if args.gtf:
         gtf = args.gtf.split(',')
     if args.hintfiles:
@@ -142,6 +229,44 @@ def init(args):
         v = args.verbose
     if args.quiet:
         quiet = True
+    if args.stream:
+        stream = True
+    if args.sort:
+        sort_output = True
+    if args.bgzf:
+        bgzf_output = True
+        sort_output = True
+    if args.threads:
+        threads = args.threads
+    if args.hint_cache:
+        hint_cache = args.hint_cache
+    if args.anno_cache:
+        anno_cache = args.anno_cache
+    if args.load_processes:
+        load_processes = args.load_processes
+    if args.line_refs:
+        line_refs = True
+    if args.fix_ids:
+        fix_ids = True
+    if args.chromosomes:
+        regions = [[chr, None, None] for chr in args.chromosomes.split(',')]
+    if args.region:
+        regions = [args.region]
+
+def region_type(region):
+    """
+        Returns:
+            (list): [chr, start, end] of a region given as chr:start-end
+    """
+    try:
+        chr, coords = region.rsplit(':', 1)
+        start, end = map(int, coords.replace(',', '').split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('Region has to be chr:start-end, ' \
+            + 'not {}'.format(region))
+    if start > end:
+        raise argparse.ArgumentTypeError('Start of region {} is behind its end.'.format(region))
+    return [chr, start, end]
 
 def parseCmd():
     """Parse command line arguments
@@ -165,6 +290,60 @@ def parseCmd():
         help='Outputfile for the combined gene prediciton in gtf.')
     parser.add_argument('-q', '--quiet', action='store_true',
         help='Quiet mode.')
+    parser.add_argument('-s', '--stream', action='store_true',
+        help='Read the input files and select transcripts one sequence ' \
+            + 'at a time to reduce the memory usage. The result is the same.')
+    parser.add_argument('--sort', action='store_true',
+        help='Sort the lines of the combined gene prediction by sequence ' \
+            + 'name and start coordinate.')
+    parser.add_argument('--bgzf', action='store_true',
+        help='Write the combined gene prediction sorted (see --sort) and ' \
+            + 'BGZF compressed, with a tabix index <out>.tbi (a CSI index ' \
+            + '<out>.csi for sequences longer than 2^29 bp).')
+    parser.add_argument('-t', '--threads', type=int,
+        help='Number of processes, sequences are processed in parallel ' \
+            + '(uses the same procedure as --stream). The result is the same.')
+    parser.add_argument('--hint-cache', type=str,
+        help='Directory for a binary index of the hintfiles. It is created ' \
+            + 'by the first run and reused by later runs with the same ' \
+            + 'hintfiles, until one of them changes. With --stream, --threads, ' \
+            + '--region or --chromosomes, the indices of the sequences of the ' \
+            + 'input files are saved there as well.')
+    parser.add_argument('--anno-cache', type=str,
+        help='Directory for snapshots of the parsed gene predictions. They ' \
+            + 'are created by the first run and reused by later runs, until ' \
+            + 'the gene prediction file changes. With --stream or --threads, ' \
+            + 'which read one sequence at a time, only the indices of the ' \
+            + 'sequences of the input files are saved there (if --hint-cache ' \
+            + 'isn\'t set).')
+    parser.add_argument('--line-refs', action='store_true',
+        help='Keep only the byte offset of each line of the gene prediction ' \
+            + 'files in memory instead of its attributes, they are read from ' \
+            + 'a memory map of the file if needed. Only for uncompressed ' \
+            + 'files, not used with --stream or --threads.')
+    parser.add_argument('--fix-ids', action='store_true',
+        help='Add sequence name and strand as prefix to the transcript and ' \
+            + 'gene IDs of the gene predictions while they are read, for ' \
+            + 'IDs that are used on several sequences or strands. Same as ' \
+            + 'running fix_gtf_ids.py on each gene prediction file.')
+    parser.add_argument('--load-processes', type=int,
+        help='Number of processes that read the gene prediction files and ' \
+            + 'hintfiles concurrently, at most one per file. Default is 1, ' \
+            + 'the files are parsed one after another while the next file ' \
+            + 'is read and decompressed in the background. Experimental: ' \
+            + 'more processes are only faster for large inputs, the parsed ' \
+            + 'files have to be sent back from the processes. The result is ' \
+            + 'the same.')
+    parser.add_argument('--region', type=region_type,
+        help='Only select transcripts that overlap a region (chr:start-end). ' \
+            + 'Input files are read through a tabix/CSI index (BGZF inputs ' \
+            + 'with a .tbi/.csi file) or through an index of their sequences. ' \
+            + 'This index is created in each run, or once and saved in the ' \
+            + 'directory of --hint-cache or --anno-cache if one is set. ' \
+            + 'Nothing is written next to the input files.')
+    parser.add_argument('--chromosomes', type=str,
+        help='List (separated by commas) of sequences, transcripts are only ' \
+            + 'selected on these sequences. Uses the same indices as --region.')
     parser.add_argument('-v', '--verbose', type=int,
         help='')
     return parser.parse_args()
@@ -12,24 +12,15 @@ h2=$c/braker2_results/hintsfile.gff
 d=$c/tsebra_workdir/
 mkdir -p $d
 
-# Make sure that the transcript IDs of the BRAKER predicitons are in order
-# This step is OPTIONAL and not necassary for a succefull combination
-
-echo "\n*** Fix possible ID errors in *.gtf files ***\n"
-
-new_b1=$d/braker1.gtf
-new_b2=$d/braker2.gtf
-$c/../bin/fix_gtf_ids.py --gtf $b1 --out $new_b1
-$c/../bin/fix_gtf_ids.py --gtf $b2 --out $new_b2
-b1=$new_b1
-b2=$new_b2
-
 # Combine BRAKER1 and BRAKER2 predicitons
+# --fix-ids makes sure that the transcript IDs of the BRAKER predicitons are in order,
+# they are fixed while the files are read. This is OPTIONAL and not necassary
+# for a succefull combination
 
 o=$d/braker1+2.gtf
 
 echo "*** Running PrEvCo ***\n"
 
-$c/../bin/tsebra.py -g $b1,$b2 -c $c/../config/default.cfg -e $h1,$h2 -o $o
+$c/../bin/tsebra.py -g $b1,$b2 -c $c/../config/default.cfg -e $h1,$h2 -o $o --fix-ids
 
 echo "\n*** Finished. Result at: $o ***\n"
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+# ==============================================================
+# author: Lars Gabriel
+#
+# benchmark.py: memory and runtime measurements for TSEBRA
+# ==============================================================
+import os
+import csv
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+exampleDir = testDir + '/../example/'
+
+from genome_anno import Anno
+from overlap_graph import Graph
+from evidence import Hintfile, Evidence
+from features import FEATURE_TYPES
+from gtf_writer import GtfWriter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def copy_str(s):
+    # new str object, like the strings created by csv.reader for each line
+    if isinstance(s, str):
+        return s.encode().decode()
+    return s
+
+def anno_memory(gtf_files):
+    """
+        Memory of the parsed and normalized gene predictions with the columnar
+        GtfStore, compared to storing every line as a list (the layout of
+        Transcript.transcript_lines before the GtfStore).
+    """
+    tracemalloc.start()
+    anno = []
+    for i, g in enumerate(gtf_files):
+        anno.append(Anno(g, 'anno{}'.format(i+1)))
+        anno[-1].addGtf()
+        anno[-1].norm_tx_format()
+    store_mem = tracemalloc.get_traced_memory()[0]
+
+    lines = []
+    for a in anno:
+        for tx in a.get_transcript_list():
+            lines.append({k : [list(map(copy_str, l)) for l in tx.get_lines(k)] \
+                for k in tx.line_types})
+    list_mem = tracemalloc.get_traced_memory()[0] - store_mem
+    tracemalloc.stop()
+
+    numb_lines = sum([len(a.store) for a in anno])
+    numb_tx = sum([len(a.transcripts) for a in anno])
+
+    tracemalloc.start()
+    anno_refs = []
+    for i, g in enumerate(gtf_files):
+        anno_refs.append(Anno(g, 'anno{}'.format(i+1), line_refs=True))
+        anno_refs[-1].addGtf()
+        anno_refs[-1].norm_tx_format()
+    refs_mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('transcripts: {}, gtf lines: {}'.format(numb_tx, numb_lines))
+    print('GtfStore arrays: {} bytes'.format(sum([a.store.nbytes() for a in anno])))
+    print('Anno with GtfStore: {} bytes ({:.1f} per line)'.format(store_mem, \
+        store_mem / numb_lines))
+    print('Anno with GtfStore and line references: {} bytes ({:.1f} per line)'.format(\
+        refs_mem, refs_mem / numb_lines))
+    print('lines as lists: {} bytes ({:.1f} per line)'.format(list_mem, \
+        list_mem / numb_lines))
+
+def dense_locus(anno_id, numb_tx, seed=0):
+    """
+        Synthetic locus where the start/end coordinates of all transcripts
+        overlap, but only a few of them share CDS segments in the same frame.
+    """
+    random.seed(seed)
+    rows = []
+    for i in range(numb_tx):
+        start = random.randint(1, 10000)
+        for j in range(5):
+            end = start + random.randint(100, 200)
+            rows.append(['chr1', 'AUGUSTUS', 'CDS', start, end, '.', '+', \
+                random.choice(['0', '1', '2']), \
+                'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+            start = end + random.randint(20000, 40000)
+    anno = Anno('', anno_id)
+    anno.addGtf(enumerate(rows))
+    anno.norm_tx_format()
+    return anno
+
+def sweep_overlaps(graph):
+    # overlap detection before the CDS index: compare all pairs of
+    # transcripts with overlapping start/end coordinates
+    tx_start_end = []
+    for key in graph.nodes.keys():
+        tx = graph.__tx_from_key__(key)
+        tx_start_end.append([key, tx.start, 0])
+        tx_start_end.append([key, tx.end, 1])
+    tx_start_end = sorted(tx_start_end, key=lambda t:(t[1], t[2]))
+    open_intervals = []
+    result = []
+    for interval in tx_start_end:
+        if interval[2] == 0:
+            open_intervals.append(interval[0])
+        else:
+            open_intervals.remove(interval[0])
+            for match in open_intervals:
+                if graph.compare_tx_cds(graph.__tx_from_key__(interval[0]), \
+                    graph.__tx_from_key__(match)):
+                    result.append([interval[0], match])
+    return result
+
+def graph_build(numb_tx):
+    """
+        Runtime of the overlap detection for a dense locus with the CDS
+        index and with the sweep over transcript start/end coordinates.
+    """
+    anno = [dense_locus('anno1', numb_tx, 1), dense_locus('anno2', numb_tx, 2)]
+    graph = Graph(anno, {})
+    t = time.time()
+    graph.build()
+    index_time = time.time() - t
+    t = time.time()
+    edges = sweep_overlaps(graph)
+    sweep_time = time.time() - t
+    assert edges == [[e.node1, e.node2] for e in graph.edges.values()]
+    print('transcripts: {}, edges: {}'.format(len(graph.nodes), len(edges)))
+    print('CDS index: {:.2f}s'.format(index_time))
+    print('start/end sweep: {:.2f}s'.format(sweep_time))
+
+def giant_locus(anno_id, numb_tx, seed=0):
+    """
+        Synthetic locus where all transcripts share a CDS segment in the
+        same frame, e.g. the models of a tandem gene family. All transcripts
+        overlap each other and form one connected component.
+    """
+    random.seed(seed)
+    rows = []
+    for i in range(numb_tx):
+        start = random.randint(1, 500)
+        segments = [[start, 1000, '0'], [1100, 1200 + random.randint(0, 300), '0']]
+        end = segments[-1][1]
+        for j in range(random.randint(0, 3)):
+            start = end + random.randint(50, 300)
+            end = start + random.randint(50, 300)
+            segments.append([start, end, random.choice(['0', '1', '2'])])
+        for start, end, phase in segments:
+            rows.append(['chr1', 'AUGUSTUS', 'CDS', start, end, '.', '+', phase, \
+                'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+    anno = Anno('', anno_id)
+    anno.addGtf(enumerate(rows))
+    anno.norm_tx_format()
+    return anno
+
+def pairwise_decision(graph):
+    # transcript selection before decide_nodes(): decide each edge, then
+    # remove the marked nodes from a copy of each component list
+    node_to_remove = {}
+    for key, edge in graph.edges.items():
+        node_to_remove.update({key : graph.decide_edge(edge)})
+    decided_graph = []
+    for component in graph.component_list:
+        result = component.copy()
+        for node_id in component:
+            for e_id in graph.nodes[node_id].edge_to.values():
+                if node_to_remove[e_id]:
+                    if node_to_remove[e_id] in result:
+                        result.remove(node_to_remove[e_id])
+        decided_graph += result
+    return decided_graph
+
+def giant_component(numb_tx):
+    """
+        Runtime of the transcript selection for one giant component with
+        decide_nodes() and with the comparison of each edge followed by the
+        removal of the marked nodes from the component list. Features are
+        random, with few distinct values so that many edges are tied.
+    """
+    anno = [giant_locus('anno1', numb_tx, 1), giant_locus('anno2', numb_tx, 2)]
+    para = {'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    graph = Graph(anno, para)
+    t = time.time()
+    graph.build()
+    build_time = time.time() - t
+    graph.connected_components()
+    random.seed(0)
+    features = [[random.choice([0, 0.5, 1]), random.choice([0, 0.5, 1]), \
+        random.randint(0, 100), random.randint(0, 40)] for n in graph.nodes]
+    for key, feature_vector in zip(graph.nodes.keys(), features):
+        graph.nodes[key].feature_vector = feature_vector
+    t = time.time()
+    decided_graph = pairwise_decision(graph)
+    pairwise_time = time.time() - t
+    t = time.time()
+    graph.decide_graph()
+    decide_time = time.time() - t
+    assert set(decided_graph) == set(graph.decided_graph)
+    print('transcripts: {}, edges: {}, largest component: {}'.format(\
+        len(graph.nodes), len(graph.edges), max(map(len, graph.component_list))))
+    print('build(): {:.2f}s'.format(build_time))
+    print('pairwise edge decisions and list removal: {:.2f}s'.format(pairwise_time))
+    print('decide_nodes() without NumPy: {:.2f}s'.format(decide_time))
+    if np is not None:
+        graph.feature_matrix = np.array(features, dtype=np.float64)
+        t = time.time()
+        graph.decide_graph()
+        decide_time = time.time() - t
+        assert set(decided_graph) == set(graph.decided_graph)
+        print('decide_nodes() with NumPy: {:.2f}s'.format(decide_time))
+
+def many_loci(anno_id, numb_tx, seed=0):
+    """
+        Synthetic genome with loci of 1-10 transcripts, the transcripts of
+        a locus share a CDS segment in the same frame.
+    """
+    random.seed(seed)
+    rows = []
+    i = 0
+    locus_start = 1
+    while i < numb_tx:
+        for j in range(min(random.randint(1, 10), numb_tx - i)):
+            start = locus_start + random.randint(0, 200)
+            end = locus_start + 500 + random.randint(0, 300)
+            rows.append(['chr1', 'AUGUSTUS', 'CDS', start, end, '.', '+', '0', \
+                'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+            i += 1
+        locus_start += 2000
+    anno = Anno('', anno_id)
+    anno.addGtf(enumerate(rows))
+    anno.norm_tx_format()
+    return anno
+
+def selection(numb_tx):
+    """
+        Runtime of the transcript selection (decide_graph() and
+        get_decided_graph()) for many small loci, compared to the
+        comparison of each edge followed by the removal of the marked
+        nodes from the component list. Features are random.
+    """
+    anno = [many_loci('anno1', numb_tx, 1), many_loci('anno2', numb_tx, 2)]
+    para = {'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    graph = Graph(anno, para)
+    graph.build()
+    graph.connected_components()
+    random.seed(0)
+    for node in graph.nodes.values():
+        node.feature_vector = [random.choice([0, 0.5, 1]), random.choice([0, 0.5, 1]), \
+            random.randint(0, 100), random.randint(0, 40)]
+        node.evi_support = random.random() < 0.8
+    t = time.time()
+    decided_graph = pairwise_decision(graph)
+    result = {a.id : [] for a in anno}
+    for key in decided_graph:
+        if graph.nodes[key].evi_support:
+            anno_id, tx_id = key.split(';')
+            result[anno_id].append([tx_id, graph.nodes[key].component_id])
+    pairwise_time = time.time() - t
+    t = time.time()
+    graph.decide_graph()
+    combined_prediction = graph.get_decided_graph()
+    decide_time = time.time() - t
+    assert combined_prediction == result
+    print('transcripts: {}, edges: {}, components: {}'.format(len(graph.nodes), \
+        len(graph.edges), len(graph.component_list)))
+    print('pairwise edge decisions and list removal: {:.2f}s'.format(pairwise_time))
+    print('decide_graph() and get_decided_graph(): {:.2f}s'.format(decide_time))
+
+def gtf_output(numb_tx, out):
+    """
+        Peak memory and runtime of writing all transcripts with the
+        GtfWriter, unsorted and sorted, compared to collecting all output
+        lines in one list before they are written.
+    """
+    anno = [many_loci('anno1', numb_tx, 1), many_loci('anno2', numb_tx, 2)]
+    tx_lists = [[[tx_id, 'g_1'] for tx_id in a.transcripts.keys()] for a in anno]
+
+    tracemalloc.start()
+    t = time.time()
+    combined_gtf = []
+    for a, tx_list in zip(anno, tx_lists):
+        combined_gtf += a.get_subset_gtf(tx_list)
+    with open(out, 'w+') as file:
+        out_writer = csv.writer(file, delimiter='\t', quotechar = "'")
+        for line in combined_gtf:
+            out_writer.writerow(line)
+    del combined_gtf
+    print('lines in one list: {} bytes, {:.2f}s'.format(\
+        tracemalloc.get_traced_memory()[1], time.time() - t))
+    tracemalloc.stop()
+
+    for sort in [False, True]:
+        tracemalloc.start()
+        t = time.time()
+        with GtfWriter(out, sort) as writer:
+            for a, tx_list in zip(anno, tx_lists):
+                writer.add(a.iter_subset_gtf(tx_list, sort))
+        print('GtfWriter (sort={}): {} bytes, {:.2f}s'.format(sort, \
+            tracemalloc.get_traced_memory()[1], time.time() - t))
+        tracemalloc.stop()
+    os.remove(out)
+
+def start_end_duplicates(anno):
+    # duplicate detection before the CDS fingerprints: group transcripts by
+    # start, end and strand and compare the CDS coords with the whole group
+    unique_tx_keys = {}
+    numb_duplicates = 0
+    for a in anno:
+        for tx in a.get_transcript_list():
+            if tx.chr not in unique_tx_keys.keys():
+                unique_tx_keys.update({tx.chr : {}})
+            unique_key = '{}_{}_{}'.format(tx.start, tx.end, tx.strand)
+            if unique_key in unique_tx_keys[tx.chr].keys():
+                coords = tx.get_cds_coords()
+                if any([coords == t.get_cds_coords() for t in \
+                    unique_tx_keys[tx.chr][unique_key]]):
+                    numb_duplicates += 1
+                    continue
+            else:
+                unique_tx_keys[tx.chr].update({unique_key : []})
+            unique_tx_keys[tx.chr][unique_key].append(tx)
+    return numb_duplicates
+
+def duplicate_tx(gtf_files, copies):
+    """
+        Runtime of the duplicate detection with CDS fingerprints and with the
+        comparison of CDS coords of transcripts with the same start/end, for
+        several copies of each gene prediction file.
+    """
+    anno = []
+    for i in range(copies):
+        for g in gtf_files:
+            anno.append(Anno(g, 'anno{}'.format(len(anno) + 1)))
+            anno[-1].addGtf()
+            anno[-1].norm_tx_format()
+    t = time.time()
+    numb_duplicates = start_end_duplicates(anno)
+    start_end_time = time.time() - t
+    for a in anno:
+        for tx in a.get_transcript_list():
+            tx.cds_fingerprint = None
+    t = time.time()
+    for a in anno:
+        for tx in a.get_transcript_list():
+            tx.get_cds_fingerprint()
+    fingerprint_time = time.time() - t
+    graph = Graph(anno, {})
+    t = time.time()
+    graph.build()
+    build_time = time.time() - t
+    assert numb_duplicates == sum(graph.duplicate_tx.values())
+    print('transcripts: {}, duplicates: {}'.format(sum([len(a.transcripts) \
+        for a in anno]), numb_duplicates))
+    print('start/end groups: {:.2f}s'.format(start_end_time))
+    print('CDS fingerprints: {:.2f}s at load time, build() with fingerprint ' \
+        .format(fingerprint_time) + 'lookups: {:.2f}s'.format(build_time))
+
+def hint_dict(hintfiles):
+    # evidence index before HintArrays:
+    # hint_keys[chr][start_end_type_strand][src] = multiplicity
+    hint_keys = {}
+    for h in hintfiles:
+        hintfile = Hintfile(h)
+        for chr in hintfile.hints.keys():
+            if chr not in hint_keys.keys():
+                hint_keys.update({chr : {}})
+            for hint in hintfile.hints[chr]:
+                new_key = '{}_{}_{}_{}'.format(hint.start, hint.end, \
+                    hint.type, hint.strand)
+                if not new_key in hint_keys[chr].keys():
+                    hint_keys[chr].update({new_key : {}})
+                if not hint.src in hint_keys[chr][new_key].keys():
+                    hint_keys[chr][new_key].update({hint.src : 0})
+                hint_keys[chr][new_key][hint.src] += int(hint.mult)
+    return hint_keys
+
+def evidence_index(gtf_files, hintfiles, repeat):
+    """
+        Memory and lookup throughput of the evidence index with HintArrays,
+        compared to the dict of dicts with string keys used before.
+        Queries are all introns and start/stop codons of the gene predictions.
+    """
+    tracemalloc.start()
+    evi = Evidence()
+    for h in hintfiles:
+        evi.add_hintfile(h)
+    index_mem = tracemalloc.get_traced_memory()[0]
+    hint_keys = hint_dict(hintfiles)
+    dict_mem = tracemalloc.get_traced_memory()[0] - index_mem
+    tracemalloc.stop()
+
+    queries = []
+    for i, g in enumerate(gtf_files):
+        anno = Anno(g, 'anno{}'.format(i+1))
+        anno.addGtf()
+        anno.norm_tx_format()
+        for tx in anno.get_transcript_list():
+            for type in FEATURE_TYPES:
+                for line in tx.get_lines(type):
+                    queries.append([line[0], line[3], line[4], \
+                        type.replace('_codon', ''), line[6]])
+    queries *= repeat
+
+    t = time.time()
+    for chr, start, end, type, strand in queries:
+        key = '{}_{}_{}_{}'.format(start, end, type, strand)
+        if chr in hint_keys.keys():
+            if key in hint_keys[chr].keys():
+                hint_keys[chr][key]
+    dict_time = time.time() - t
+
+    t = time.time()
+    for chr, start, end, type, strand in queries:
+        evi.get_hint(chr, start, end, type, strand)
+    get_time = time.time() - t
+
+    numb_hints = sum([len(h) for h in evi.index.values()])
+    print('hints: {}, queries: {}'.format(numb_hints, len(queries)))
+    print('dict of dicts: {} bytes, {:.0f} lookups/s'.format(dict_mem, \
+        len(queries) / dict_time))
+    print('HintArrays: {} bytes, {:.0f} lookups/s with get_hint()'.format(\
+        index_mem, len(queries) / get_time))
+
+    if np is not None:
+        groups = {}
+        for chr, start, end, type, strand in queries:
+            if (chr, type, strand) not in groups.keys():
+                groups.update({(chr, type, strand) : [[], []]})
+            groups[(chr, type, strand)][0].append(start)
+            groups[(chr, type, strand)][1].append(end)
+        groups = {k : [np.array(v[0]), np.array(v[1])] for k, v in groups.items()}
+        t = time.time()
+        for (chr, type, strand), (start, end) in groups.items():
+            evi.find_hints(chr, type, strand, start, end)
+        find_time = time.time() - t
+        print('HintArrays: {:.0f} lookups/s with find_hints()'.format(\
+            len(queries) / find_time))
+
+def parseCmd():
+    parser = argparse.ArgumentParser(description='Benchmarks for TSEBRA.')
+    parser.add_argument('benchmark', type=str, choices=['anno_memory', \
+        'graph_build', 'evidence_index', 'duplicate_tx', 'giant_component', \
+        'selection', 'gtf_output'], \
+        help='Benchmark to run.')
+    parser.add_argument('-g', '--gtf', type=str,
+        help='List (separated by commas) of gene prediciton files in gtf, ' \
+            + 'the BRAKER predictions in example/ are used by default.')
+    parser.add_argument('-e', '--hintfiles', type=str,
+        help='List (separated by commas) of hintfiles, ' \
+            + 'the BRAKER hintfiles in example/ are used by default.')
+    parser.add_argument('-r', '--repeat', type=int, default=10,
+        help='Number of repetitions of the queries in evidence_index.')
+    parser.add_argument('-k', '--copies', type=int, default=4,
+        help='Number of copies of each gene prediction file in duplicate_tx.')
+    parser.add_argument('-n', '--numb_tx', type=int, default=500,
+        help='Number of transcripts per annotation in synthetic data.')
+    parser.add_argument('-o', '--out', type=str, default='benchmark_output.gtf',
+        help='Temporary output file of gtf_output.')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parseCmd()
+    if args.gtf:
+        gtf = args.gtf.split(',')
+    else:
+        gtf = [exampleDir + 'braker1_results/braker.gtf', \
+            exampleDir + 'braker2_results/braker.gtf']
+    if args.hintfiles:
+        hintfiles = args.hintfiles.split(',')
+    else:
+        hintfiles = [exampleDir + 'braker1_results/hintsfile.gff', \
+            exampleDir + 'braker2_results/hintsfile.gff']
+    if args.benchmark == 'anno_memory':
+        anno_memory(gtf)
+    elif args.benchmark == 'graph_build':
+        graph_build(args.numb_tx)
+    elif args.benchmark == 'evidence_index':
+        evidence_index(gtf, hintfiles, args.repeat)
+    elif args.benchmark == 'duplicate_tx':
+        duplicate_tx(gtf, args.copies)
+    elif args.benchmark == 'giant_component':
+        giant_component(args.numb_tx)
+    elif args.benchmark == 'selection':
+        selection(args.numb_tx)
+    elif args.benchmark == 'gtf_output':
+        gtf_output(args.numb_tx, args.out)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import os
+import sys
+import csv
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from genome_anno import Anno
+from overlap_graph import Graph
+from evidence import Evidence
+from chr_stream import ChrBlocks, ChrStream
+import chr_stream
+
+example_files = testDir + '/graph/'
+para = {'P' : 0.1, 'E' : 10, 'C' : 5, 'M' : 1, 'intron_support' : 0.75, \
+    'stasto_support' : 1, 'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+
+def copy_to_chr(path, chr_list):
+    # copy of all lines for each chr in chr_list, IDs are made unique per chr
+    with open(path, 'r') as file:
+        lines = [l for l in file.readlines() if l.strip()]
+    result = []
+    for chr in chr_list:
+        for l in lines:
+            l = l.split('\t')
+            l[0] = chr
+            l[8] = l[8].replace('"g', '"{}_g'.format(chr))
+            result.append('\t'.join(l))
+    return result
+
+@pytest.fixture
+def multi_chr_files(tmp_path):
+    files = {}
+    # chromosomes in different order and split into several blocks
+    content = {'anno1.gtf' : copy_to_chr(example_files + 'ex_feature_anno1.gtf', \
+                    ['2L', '3R', 'X']),
+                'anno2.gtf' : copy_to_chr(example_files + 'ex_feature_anno2.gtf', \
+                    ['X', '3R']) + ['#comment\n'] \
+                    + copy_to_chr(example_files + 'ex_feature_anno2.gtf', ['2L']),
+                'hint1.gff' : copy_to_chr(example_files + 'ex_feature_hint1.gff', \
+                    ['3R', '2L']),
+                'hint2.gff' : copy_to_chr(example_files + 'ex_feature_hint2.gff', \
+                    ['X', '2L', '3R', 'X'])}
+    for name in content.keys():
+        files.update({name : str(tmp_path / name)})
+        with open(files[name], 'w+') as file:
+            file.write(''.join(content[name]))
+    return files
+
+def run_in_memory(files, out):
+    anno = []
+    for i, g in enumerate(['anno1.gtf', 'anno2.gtf']):
+        anno.append(Anno(files[g], 'anno{}'.format(i+1)))
+        anno[-1].addGtf()
+        anno[-1].norm_tx_format()
+    evi = Evidence()
+    for h in ['hint1.gff', 'hint2.gff']:
+        evi.add_hintfile(files[h])
+    graph = Graph(anno, para=para.copy())
+    graph.build()
+    graph.add_node_features(evi)
+    combined_prediction = graph.get_decided_graph()
+    with open(out, 'w+') as file:
+        out_writer = csv.writer(file, delimiter='\t', quotechar = "'")
+        for a in anno:
+            for line in a.get_subset_gtf(combined_prediction[a.id]):
+                out_writer.writerow(line)
+
+def test_chr_blocks(multi_chr_files):
+    blocks = ChrBlocks(multi_chr_files['anno2.gtf'])
+    assert blocks.chromosomes() == ['X', '3R', '2L']
+    rows = list(blocks.rows('2L'))
+    assert len(rows) == 43
+    assert rows[0][0] == 87
+    assert all([r[1][0] == '2L' for r in rows])
+    blocks = ChrBlocks(multi_chr_files['hint2.gff'])
+    assert len(blocks.blocks['X']) == 2
+    assert len(list(blocks.rows('X'))) == 48
+
+@pytest.mark.parametrize('threads', [1, 2])
+def test_stream_equals_in_memory(multi_chr_files, tmp_path, threads):
+    run_in_memory(multi_chr_files, str(tmp_path / 'in_memory.gtf'))
+    chr_stream = ChrStream([multi_chr_files['anno1.gtf'], multi_chr_files['anno2.gtf']], \
+        [multi_chr_files['hint1.gff'], multi_chr_files['hint2.gff']], \
+        para.copy(), quiet=True, threads=threads)
+    chr_stream.run()
+    chr_stream.write(str(tmp_path / 'stream.gtf'))
+    with open(str(tmp_path / 'in_memory.gtf'), 'r') as file:
+        in_memory = file.read()
+    with open(str(tmp_path / 'stream.gtf'), 'r') as file:
+        stream = file.read()
+    assert in_memory
+    assert stream == in_memory
+
+def test_sorted_output(multi_chr_files, tmp_path):
+    from gtf_writer import GtfWriter
+    anno = []
+    for i, g in enumerate(['anno1.gtf', 'anno2.gtf']):
+        anno.append(Anno(multi_chr_files[g], 'anno{}'.format(i+1)))
+        anno[-1].addGtf()
+        anno[-1].norm_tx_format()
+    evi = Evidence()
+    for h in ['hint1.gff', 'hint2.gff']:
+        evi.add_hintfile(multi_chr_files[h])
+    graph = Graph(anno, para=para.copy())
+    graph.build()
+    graph.add_node_features(evi)
+    combined_prediction = graph.get_decided_graph()
+    with GtfWriter(str(tmp_path / 'in_memory.gtf'), sort=True) as writer:
+        for a in anno:
+            writer.add(a.iter_subset_gtf(combined_prediction[a.id], sort=True))
+    with open(str(tmp_path / 'in_memory.gtf'), 'r') as file:
+        in_memory = file.read()
+    lines = [l.split('\t') for l in in_memory.split('\n') if l]
+    assert [l[0] for l in lines] == sorted([l[0] for l in lines])
+    assert lines == sorted(lines, key=lambda l:(l[0], int(l[3])))
+    run_in_memory(multi_chr_files, str(tmp_path / 'unsorted.gtf'))
+    with open(str(tmp_path / 'unsorted.gtf'), 'r') as file:
+        assert sorted(file.read().split('\n')) == sorted(in_memory.split('\n'))
+    for threads in [1, 2]:
+        assert in_memory == run_stream(multi_chr_files, str(tmp_path / \
+            'stream.gtf'), threads=threads, sort=True)
+
+def filter_files(files, tmp_path, keep):
+    # copy of the input files with the lines for which keep(line) is True
+    result = {}
+    for name, path in files.items():
+        result.update({name : str(tmp_path / ('filtered_' + name))})
+        with open(path, 'r') as file:
+            lines = [l for l in file.readlines() if keep(l.split('\t'))]
+        with open(result[name], 'w+') as file:
+            file.write(''.join(lines))
+    return result
+
+def run_stream(files, out, **kwargs):
+    chr_stream = ChrStream([files['anno1.gtf'], files['anno2.gtf']], \
+        [files['hint1.gff'], files['hint2.gff']], para.copy(), quiet=True, **kwargs)
+    chr_stream.run()
+    chr_stream.write(out)
+    with open(out, 'r') as file:
+        return file.read()
+
+def test_chromosomes(multi_chr_files, tmp_path):
+    filtered = filter_files(multi_chr_files, tmp_path, \
+        lambda line: line[0] in ['X', '2L'])
+    run_in_memory(filtered, str(tmp_path / 'in_memory.gtf'))
+    with open(str(tmp_path / 'in_memory.gtf'), 'r') as file:
+        in_memory = file.read()
+    index_dir = str(tmp_path / 'cache')
+    stream = run_stream(multi_chr_files, str(tmp_path / 'stream.gtf'), \
+        regions=[['2L', None, None], ['X', None, None]], index_dir=index_dir)
+    assert in_memory
+    assert stream == in_memory
+    # indices are saved in index_dir and used in later runs
+    assert len(os.listdir(index_dir)) == 4
+    for path in multi_chr_files.values():
+        assert not [f for f in os.listdir(os.path.dirname(path)) if 'chridx' in f]
+    def no_scan(self):
+        raise AssertionError('index is not loaded')
+    scan = ChrBlocks.scan
+    ChrBlocks.scan = no_scan
+    try:
+        assert stream == run_stream(multi_chr_files, str(tmp_path / 'stream2.gtf'), \
+            regions=[['2L', None, None], ['X', None, None]], index_dir=index_dir)
+    finally:
+        ChrBlocks.scan = scan
+
+@pytest.mark.parametrize('region', [[21741000, 21746000], [21737000, 21737500], \
+    [21748923, 21760000], [1, 1000]])
+def test_region(tmp_path, monkeypatch, region):
+    # small blocks, so that the region read from the files has to be extended
+    monkeypatch.setattr(chr_stream, 'BLOCK_SIZE', 300)
+    files = {}
+    for name, example in [['anno1.gtf', 'ex_feature_anno1.gtf'], \
+        ['anno2.gtf', 'ex_feature_anno2.gtf'], ['hint1.gff', 'ex_feature_hint1.gff'], \
+        ['hint2.gff', 'ex_feature_hint2.gff']]:
+        files.update({name : example_files + example})
+    files = filter_files(files, tmp_path, lambda line: True)
+    # in-memory run with all transcripts that overlap the region
+    selected = set()
+    for g in ['anno1.gtf', 'anno2.gtf']:
+        anno = Anno(files[g], 'anno')
+        anno.addGtf()
+        selected.update([tx.id for tx in anno.transcripts.values() \
+            if tx.start <= region[1] and tx.end >= region[0]])
+    def keep(line):
+        if not line[1] == 'AUGUSTUS':
+            return True
+        tx_id = line[8].strip().split('transcript_id "')[-1].split('"')[0]
+        return tx_id in selected
+    filtered = filter_files(files, tmp_path, keep)
+    run_in_memory(filtered, str(tmp_path / 'in_memory.gtf'))
+    with open(str(tmp_path / 'in_memory.gtf'), 'r') as file:
+        in_memory = file.read()
+    stream = run_stream(files, str(tmp_path / 'stream.gtf'), \
+        regions=[['3R'] + region], tmp_dir=str(tmp_path))
+    assert stream == in_memory
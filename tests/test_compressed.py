@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+import os
+import sys
+import gzip
+import zlib
+import struct
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from compressed import file_format, open_file
+from genome_anno import Anno
+from evidence import Evidence
+from chr_stream import ChrBlocks, input_index, read_region
+from tabix import TabixIndex
+import compressed
+
+example_files = testDir + '/graph/'
+
+def bgzf(data, block_size=1000):
+    # BGZF blocks of block_size uncompressed bytes and the EOF block
+    result = b''
+    for i in range(0, len(data) + 1, block_size):
+        block = data[i:i + block_size]
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        cdata = compressor.compress(block) + compressor.flush()
+        result += b'\x1f\x8b\x08\x04\0\0\0\0\0\xff\x06\0BC\x02\0' \
+            + struct.pack('<H', len(cdata) + 25) + cdata \
+            + struct.pack('<II', zlib.crc32(block) & 0xffffffff, len(block))
+    return result
+
+def reg2bin(beg, end):
+    # smallest bin that contains [beg, end), 0-based coordinates
+    end -= 1
+    for shift, offset in [[14, 4681], [17, 585], [20, 73], [23, 9], [26, 1]]:
+        if beg >> shift == end >> shift:
+            return offset + (beg >> shift)
+    return 0
+
+def tabix_index(lines, block_size, csi=False):
+    # BGZF data of the lines and their tabix (.tbi) or CSI index
+    data = b''.join(lines)
+    block_offsets = [0]
+    for i in range(0, len(data) + 1, block_size):
+        block_offsets.append(block_offsets[-1] + len(bgzf(data[i:i + block_size], \
+            block_size)) - 28)
+    def virtual_offset(pos):
+        return block_offsets[pos // block_size] << 16 | pos % block_size
+    names = []
+    bins = {}
+    linear = {}
+    pos = 0
+    for line in lines:
+        if line.startswith(b'#'):
+            pos += len(line)
+            continue
+        chr, start, end = [line.split(b'\t')[i] for i in [0, 3, 4]]
+        chr = chr.decode()
+        beg, end = int(start) - 1, int(end)
+        if chr not in names:
+            names.append(chr)
+            bins.update({chr : {}})
+            linear.update({chr : []})
+        chunk = [virtual_offset(pos), virtual_offset(pos + len(line))]
+        bins[chr].setdefault(reg2bin(beg, end), []).append(chunk)
+        for window in range(beg >> 14, ((end - 1) >> 14) + 1):
+            linear[chr] += [None] * (window + 1 - len(linear[chr]))
+            if linear[chr][window] is None:
+                linear[chr][window] = chunk[0]
+        pos += len(line)
+    l_nm = sum([len(n) + 1 for n in names])
+    header = struct.pack('<iiiiiii', 0, 1, 4, 5, ord('#'), 0, l_nm) \
+        + b''.join([n.encode() + b'\0' for n in names])
+    if csi:
+        index = b'CSI\x01' + struct.pack('<iii', 14, 5, len(header)) + header \
+            + struct.pack('<i', len(names))
+    else:
+        index = b'TBI\x01' + struct.pack('<i', len(names)) + header
+    for chr in names:
+        index += struct.pack('<i', len(bins[chr]))
+        for bin, chunks in bins[chr].items():
+            if csi:
+                index += struct.pack('<IQi', bin, 0, len(chunks))
+            else:
+                index += struct.pack('<Ii', bin, len(chunks))
+            index += b''.join([struct.pack('<QQ', *c) for c in chunks])
+        if not csi:
+            # empty windows have the offset of the previous window
+            offsets = [0]
+            for o in linear[chr]:
+                offsets.append(offsets[-1] if o is None else o)
+            index += struct.pack('<i', len(offsets) - 1) \
+                + struct.pack('<{}Q'.format(len(offsets) - 1), *offsets[1:])
+    return bgzf(data, block_size), index
+
+@pytest.fixture
+def inputs(tmp_path):
+    files = {}
+    for name in ['ex_feature_anno1.gtf', 'ex_feature_hint1.gff']:
+        with open(example_files + name, 'rb') as file:
+            data = file.read()
+        files.update({name : {'plain' : example_files + name}})
+        files[name].update({'gzip' : str(tmp_path / (name + '.gz'))})
+        with gzip.open(files[name]['gzip'], 'wb') as file:
+            file.write(data)
+        files[name].update({'bgzf' : str(tmp_path / (name + '.bgz'))})
+        with open(files[name]['bgzf'], 'wb') as file:
+            file.write(bgzf(data))
+    return files
+
+def test_file_format(inputs):
+    for format, path in inputs['ex_feature_anno1.gtf'].items():
+        assert file_format(path) == format
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_bgzf_read_seek(inputs, threads):
+    paths = inputs['ex_feature_anno1.gtf']
+    with open(paths['plain'], 'rb') as file:
+        data = file.read()
+    with open_file(paths['bgzf'], binary=True, threads=threads) as file:
+        assert file.read() == data
+        for pos in [3500, 10, 999, 1000, 1001, len(data) - 3, 5000, 0]:
+            file.seek(pos)
+            assert file.tell() == pos
+            assert file.read(1500) == data[pos:pos + 1500]
+    with open_file(paths['bgzf']) as file:
+        assert file.read() == data.decode()
+
+def test_bgzf_corrupt(inputs, tmp_path):
+    with open(inputs['ex_feature_anno1.gtf']['bgzf'], 'rb') as file:
+        data = bytearray(file.read())
+    # wrong CRC of the first block
+    data[struct.unpack('<H', data[16:18])[0] - 7] ^= 1
+    path = str(tmp_path / 'corrupt.bgz')
+    with open(path, 'wb') as file:
+        file.write(data)
+    with pytest.raises(compressed.BgzfError):
+        with open_file(path) as file:
+            file.read()
+
+def test_compressed_inputs(inputs, tmp_path):
+    results = []
+    for format in ['plain', 'gzip', 'bgzf']:
+        anno = Anno(inputs['ex_feature_anno1.gtf'][format], 'anno1')
+        anno.addGtf()
+        anno.norm_tx_format()
+        evi = Evidence()
+        evi.add_hintfile(inputs['ex_feature_hint1.gff'][format])
+        blocks = ChrBlocks(inputs['ex_feature_hint1.gff'][format], tmp_dir=str(tmp_path))
+        results.append([[tx.get_gtf() for tx in anno.get_transcript_list()], \
+            {k : list(v.keys) for k, v in evi.index.items()}, \
+            {chr : list(blocks.rows(chr)) for chr in blocks.chromosomes()}])
+        blocks.close()
+    assert results[0] == results[1]
+    assert results[0] == results[2]
+
+def test_gzip_blocks(tmp_path, monkeypatch):
+    import chr_stream
+    lines = []
+    for i in range(300):
+        lines.append('{}\tx\tintron\t{}\t{}\t1\t+\t.\tsrc=P;mult=1;\n'.format(\
+            'chr{}'.format(i % 7), 100 * i + 1, 100 * i + 60))
+    plain = str(tmp_path / 'hints.gff')
+    with open(plain, 'w') as file:
+        file.writelines(lines)
+    path = plain + '.gz'
+    with gzip.open(path, 'wt') as file:
+        file.writelines(lines)
+    opened = []
+    def count_open(p, *args, **kwargs):
+        opened.append(p)
+        return open_file(p, *args, **kwargs)
+    monkeypatch.setattr(chr_stream, 'open_file', count_open)
+    blocks = input_index(path, str(tmp_path / 'cache'), str(tmp_path))
+    assert not os.path.exists(str(tmp_path / 'cache'))
+    reference = ChrBlocks(plain)
+    assert blocks.chromosomes() == reference.chromosomes()
+    for chr in blocks.chromosomes():
+        assert list(blocks.rows(chr)) == list(reference.rows(chr))
+        assert list(blocks.rows(chr, 1000, 2000)) == list(reference.rows(chr, 1000, 2000))
+    # the gzip file is decompressed once, the rows are read from the copy
+    assert opened.count(path) == 1
+    copy_path = blocks.copy_path
+    assert os.path.dirname(copy_path) == str(tmp_path)
+    blocks.close()
+    assert not os.path.exists(copy_path)
+
+@pytest.mark.parametrize('threads', [1, 3])
+def test_bgzf_writer(inputs, tmp_path, threads):
+    with open(inputs['ex_feature_anno1.gtf']['plain'], 'rb') as file:
+        data = file.read()
+    path = str(tmp_path / 'anno.gtf.bgz')
+    writer = compressed.BgzfWriter(path, threads=threads, block_size=1000)
+    positions = []
+    for line in data.splitlines(True):
+        positions.append(writer.tell())
+        writer.write(line.decode())
+    writer.close()
+    assert file_format(path) == 'bgzf'
+    with open_file(path, binary=True) as file:
+        assert file.read() == data
+    # each line starts at its virtual offset
+    reader = compressed.BgzfReader(path)
+    for line, pos in zip(data.splitlines(True), positions):
+        voffset = writer.virtual_offset(pos)
+        reader.file.seek(voffset >> 16)
+        block = compressed.inflate_block(*reader.__next_block__())
+        block = block[voffset & 0xffff:]
+        assert line.startswith(block) or block.startswith(line)
+    reader.close()
+
+@pytest.mark.parametrize('suffix', ['.tbi', '.csi'])
+def test_tabix_index(tmp_path, suffix):
+    with open(example_files + 'ex_feature_anno1.gtf', 'rb') as file:
+        lines = [l for l in file.readlines() if l.strip()]
+    # lines of two chromosomes, sorted by start
+    lines = sorted(lines, key=lambda l:int(l.split(b'\t')[3]))
+    lines = [b'#comment\n'] + lines + [b'X' + l[2:] for l in lines]
+    path = str(tmp_path / 'anno.gtf.bgz')
+    data, index = tabix_index(lines, 300, suffix == '.csi')
+    with open(path, 'wb') as file:
+        file.write(data)
+    with open(path + suffix, 'wb') as file:
+        file.write(index)
+
+    tabix = input_index(path)
+    assert isinstance(tabix, TabixIndex)
+    assert tabix.chromosomes() == ['3R', 'X']
+    rows = [l.decode().rstrip('\n').split('\t') for l in lines[1:]]
+    assert [r for o, r in tabix.rows('X')] == [r for r in rows if r[0] == 'X']
+    for start, end in [[21741000, 21746000], [21737000, 21737500], [1, 1000], \
+        [21748924, 21760000]]:
+        assert [r for o, r in tabix.rows('X', start, end)] == [r for r in rows \
+            if r[0] == 'X' and int(r[3]) <= end and int(r[4]) >= start]
+    # same transcripts as with a ChrBlocks index
+    anno, start, end = read_region(tabix, '3R', 21741000, 21746000, 'anno1')
+    blocks = ChrBlocks(path)
+    expected = read_region(blocks, '3R', 21741000, 21746000, 'anno1')
+    assert sorted(anno.transcripts.keys()) == ['g7604.t1', 'g7605.t1']
+    assert [start, end] == list(expected[1:])
+    assert [tx.get_gtf() for tx in anno.get_transcript_list()] == \
+        [tx.get_gtf() for tx in expected[0].get_transcript_list()]
@@ -6,7 +6,8 @@ import csv
 testDir = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(testDir + '/../bin/')
 
-from evidence import NotGtfFormat, AttributeMissing, Hint, Evidence
+import evidence
+from evidence import NotGtfFormat, AttributeMissing, Hint, HintArrays, Evidence
 
 @pytest.fixture
 def hints1():
@@ -34,3 +35,103 @@ def test_get_hint():
     evi.add_hintfile(testDir + '/evidence/hint3.gff')
     mult = evi.get_hint('3R','801','899','intron','+')
     assert sum(mult.values()) == 28
+
+def test_hint_arrays():
+    hints = HintArrays()
+    hints.add(801, 899, 1, 2)
+    hints.add(501, 599, 0, 3)
+    hints.add(801, 899, 0, 4)
+    hints.compact()
+    hints.add(801, 899, 1, 5)
+    hints.add(801, 899, 2, 1)
+    hints.add(100, 102, 2, 1)
+    hints.compact()
+    assert list(hints.keys) == [100 << 32 | 102, 501 << 32 | 599, 801 << 32 | 899]
+    assert hints.src_mult(hints.get(801, 899)) == [(1, 7), (0, 4), (2, 1)]
+    assert hints.get(801, 900) == -1
+    assert list(hints.find([501, 801, 1], [599, 949, 2])) == [1, -1, -1]
+
+def test_get_hint_src_order():
+    evi = Evidence()
+    evi.add_hintfile(testDir + '/evidence/hint3.gff')
+    assert list(evi.get_hint('3R', 801, 899, 'intron', '+').items()) == [('E', 4), ('P', 24)]
+    assert evi.get_hint('3R', 100, 102, 'start_codon', '+') == {'E' : 2}
+    assert evi.get_hint('3R', 801, 899, 'intron', '-') == {}
+    assert evi.get_hint('X', 801, 899, 'intron', '+') == {}
+
+def test_skip_unused_types(monkeypatch):
+    # merge the hints after every 2 new hints
+    monkeypatch.setattr(evidence, 'COMPACT_SIZE', 2)
+    rows = [['3R', 'b2h', 'exonpart', '10', '20', '.', '+', '.', 'grp=1;'],
+            ['3R', 'b2h', 'intron', '801', '899', '.', '+', '.', 'src=E;mult=2;'],
+            ['3R', 'b2h', 'dss', '801', '801', '.', '+', '.', 'src=W;'],
+            ['3R', 'b2h', 'intron', '801', '899', '.', '+', '.', 'src=P;'],
+            ['3R', 'b2h', 'stop', '698', '700', '.', '+', '.', 'src=E;mult=3;'],
+            ['3R', 'b2h', 'intron', '801', '899', '.', '+', '.', 'src=E;mult=5;']]
+    evi = Evidence()
+    evi.add_hintfile('', enumerate(rows))
+    assert evi.src == {'E', 'P'}
+    assert list(evi.get_hint('3R', 801, 899, 'intron', '+').items()) == [('E', 7), ('P', 1)]
+    assert evi.get_hint('3R', 698, 700, 'stop_codon', '+') == {'E' : 3}
+    assert evi.get_hint('3R', 10, 20, 'exonpart', '+') == {}
+    with pytest.raises(AttributeMissing):
+        evi.add_hintfile('', enumerate([rows[1][:8] + ['mult=2;']]))
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_add_evidence(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(evidence, 'np', None)
+    paths = [testDir + '/graph/ex_feature_hint2.gff', testDir + '/evidence/hint3.gff', \
+        testDir + '/graph/ex_feature_hint1.gff']
+    evi = Evidence()
+    for p in paths:
+        evi.add_hintfile(p)
+    merged = Evidence()
+    for p in paths:
+        partial = Evidence()
+        partial.add_hintfile(p)
+        merged.add_evidence(partial)
+    assert merged.src_list == evi.src_list
+    assert merged.src_code == evi.src_code
+    assert sorted(merged.index.keys()) == sorted(evi.index.keys())
+    for key, hints in evi.index.items():
+        assert [list(a) for a in [hints.keys, hints.offset, hints.src, hints.mult]] \
+            == [list(a) for a in [merged.index[key].keys, merged.index[key].offset, \
+            merged.index[key].src, merged.index[key].mult]]
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_set_weights(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(evidence, 'np', None)
+    evi = Evidence()
+    evi.add_hintfile(testDir + '/evidence/hint3.gff')
+    evi.set_weights({'P' : 0.1, 'E' : 10, 'C' : 5, 'M' : 1})
+    assert evi.get_weighted('3R', 801, 899, 'intron', '+') == (10 * 4, 0.1 * 24)
+    assert evi.get_weighted('3R', 100, 102, 'start_codon', '+') == (20.0,)
+    assert evi.get_weighted('3R', 801, 899, 'intron', '-') == ()
+    assert evi.get_weighted('X', 801, 899, 'intron', '+') == ()
+    # the multiplicities of each source are unchanged
+    assert list(evi.get_hint('3R', 801, 899, 'intron', '+').items()) == [('E', 4), ('P', 24)]
+    # hints added later are weighted as well
+    evi.add_hintfile('', enumerate([['3R', 'b2h', 'intron', '801', '899', '.', '+', \
+        '.', 'src=C;mult=2;']]))
+    assert evi.get_weighted('3R', 801, 899, 'intron', '+') == (10 * 4, 0.1 * 24, 5 * 2)
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_hint_limits(monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(evidence, 'np', None)
+    monkeypatch.setattr(evidence, 'COMPACT_SIZE', 2)
+    # multiplicities that add up to more than 2^32
+    rows = [['3R', 'b2h', 'intron', '801', str(2**32 - 1), '.', '+', '.', \
+        'src=E;mult={};'.format(2**32 - 1)] for i in range(5)]
+    evi = Evidence()
+    evi.add_hintfile('', enumerate(rows))
+    other = Evidence()
+    other.add_hintfile('', enumerate(rows))
+    evi.add_evidence(other)
+    assert evi.get_hint('3R', 801, 2**32 - 1, 'intron', '+') == {'E' : 10 * (2**32 - 1)}
+    for start, end, mult in [[801, 2**32, 1], [-1, 899, 1], [801, 899, 2**63]]:
+        with pytest.raises(NotGtfFormat):
+            evi.add_hintfile('', enumerate([['3R', 'b2h', 'intron', str(start), \
+                str(end), '.', '+', '.', 'src=E;mult={};'.format(mult)]]))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os
+import sys
+import random
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from genome_anno import Anno
+from evidence import Evidence
+from features import Node_features, FeatureCache, feature_matrix
+
+np = pytest.importorskip('numpy')
+
+example_files = testDir + '/graph/'
+sw = {'P' : 0.1, 'E' : 10, 'C' : 5, 'M' : 1}
+
+def random_data(seed):
+    # transcripts with up to 5 exons and hints for some of their introns and codons
+    random.seed(seed)
+    rows = []
+    hints = []
+    for i in range(50):
+        chr = random.choice(['1', '2'])
+        strand = random.choice(['+', '-'])
+        start = random.randint(1, 5000)
+        for j in range(random.randint(1, 5)):
+            end = start + random.randint(50, 300)
+            rows.append([chr, 'AUGUSTUS', 'CDS', start, end, '.', strand, '0', \
+                'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+            start = end + random.randint(50, 300)
+    anno = Anno('', 'anno1')
+    anno.addGtf(enumerate(rows))
+    anno.norm_tx_format()
+    for tx in anno.get_transcript_list():
+        for type in ['intron', 'start_codon', 'stop_codon']:
+            for line in tx.get_lines(type):
+                for k in range(random.choice([0, 0, 1, 2, 3])):
+                    hint_type = type.replace('_codon', '')
+                    hints.append([line[0], 'b2h', hint_type, str(line[3]), \
+                        str(line[4]), '.', line[6], '.', 'src={};mult={};'.format(\
+                        random.choice(list(sw.keys())), random.randint(1, 30))])
+    evi = Evidence()
+    evi.add_hintfile('', enumerate(hints))
+    return anno, evi
+
+def compare_features(tx_list, evi):
+    matrix = feature_matrix(tx_list, evi, sw)
+    assert matrix.shape == (len(tx_list), 4)
+    for tx, row in zip(tx_list, matrix.tolist()):
+        assert row == Node_features(tx, evi, sw).get_features()
+
+def test_feature_matrix_example():
+    anno = []
+    for i in [1, 2]:
+        anno.append(Anno(example_files + 'ex_feature_anno{}.gtf'.format(i), \
+            'anno{}'.format(i)))
+        anno[-1].addGtf()
+        anno[-1].norm_tx_format()
+    evi = Evidence()
+    for i in [1, 2]:
+        evi.add_hintfile(example_files + 'ex_feature_hint{}.gff'.format(i))
+    compare_features(anno[0].get_transcript_list() + anno[1].get_transcript_list(), evi)
+
+@pytest.mark.parametrize('seed', range(5))
+def test_feature_matrix_random(seed):
+    anno, evi = random_data(seed)
+    compare_features(anno.get_transcript_list(), evi)
+
+def test_feature_matrix_no_hints():
+    anno, evi = random_data(0)
+    matrix = feature_matrix(anno.get_transcript_list(), Evidence(), sw)
+    assert (matrix[:,1:] == 0).all()
+
+def test_feature_cache():
+    anno, evi = random_data(1)
+    tx_list = anno.get_transcript_list()
+    # the same gene models in a second annotation
+    copy, evi = random_data(1)
+    copy.change_id('anno2')
+    tx_list += copy.get_transcript_list()
+    cache = FeatureCache(evi, sw)
+    features = [Node_features(tx, evi, sw, cache).get_features() for tx in tx_list]
+    assert features == [Node_features(tx, evi, sw).get_features() for tx in tx_list]
+    assert cache.lookups == 2 * (cache.lookups - cache.hits)
+    assert len(cache) == cache.lookups - cache.hits
+    stats = [0, 0]
+    assert feature_matrix(tx_list, evi, sw, stats).tolist() == features
+    assert stats == [cache.lookups, cache.hits]
+    assert cache.get('1', 1, 2, 'intron', '+') == ()
+
+def test_pre_weighted():
+    anno, evi = random_data(2)
+    tx_list = anno.get_transcript_list()
+    features = [Node_features(tx, evi, sw).get_features() for tx in tx_list]
+    matrix = feature_matrix(tx_list, evi, sw).tolist()
+    evi.set_weights(sw)
+    assert FeatureCache(evi, sw).weighted
+    assert [Node_features(tx, evi, sw).get_features() for tx in tx_list] == features
+    assert feature_matrix(tx_list, evi, sw).tolist() == matrix
+    # other weights than the ones of the scores in evi
+    assert not FeatureCache(evi, dict(sw, P=1)).weighted
+
+def test_feature_matrix_absolute():
+    anno, evi = random_data(3)
+    tx_list = anno.get_transcript_list()
+    matrix = feature_matrix(tx_list, evi, sw)
+    needed = np.arange(len(tx_list)) % 3 == 0
+    lazy = feature_matrix(tx_list, evi, sw, absolute=lambda m:needed)
+    assert (lazy[:,:2] == matrix[:,:2]).all()
+    assert (lazy[needed] == matrix[needed]).all()
+    assert np.isnan(lazy[~needed,2:]).all()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from genome_anno import Anno
+from file_cache import fingerprint, is_unchanged, load_anno
+
+example_files = testDir + '/graph/'
+
+@pytest.fixture
+def gtf(tmp_path):
+    path = str(tmp_path / 'anno.gtf')
+    shutil.copy(example_files + 'ex_feature_anno1.gtf', path)
+    return path
+
+def read_anno(path, anno_id):
+    anno = Anno(path, anno_id)
+    anno.addGtf()
+    anno.norm_tx_format()
+    return anno
+
+def compare_anno(anno1, anno2):
+    assert anno1.id == anno2.id
+    assert list(anno1.transcripts.keys()) == list(anno2.transcripts.keys())
+    for tx1, tx2 in zip(anno1.get_transcript_list(), anno2.get_transcript_list()):
+        assert tx1.source_anno == tx2.source_anno
+        assert tx1.line_number == tx2.line_number
+        assert tx1.get_gtf() == tx2.get_gtf()
+
+def test_is_unchanged(gtf):
+    file_fingerprint = fingerprint(gtf)
+    assert is_unchanged(gtf, file_fingerprint)
+    stat = os.stat(gtf)
+    os.utime(gtf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert is_unchanged(gtf, file_fingerprint)
+    with open(gtf, 'a') as file:
+        file.write('\n')
+    assert not is_unchanged(gtf, file_fingerprint)
+
+def test_load_anno(gtf, tmp_path, capsys):
+    cache_dir = str(tmp_path / 'cache')
+    compare_anno(load_anno(gtf, 'anno1', cache_dir), read_anno(gtf, 'anno1'))
+    assert 'ANNO CACHE MISS' in capsys.readouterr().err
+    # snapshot of anno1 used as anno2
+    compare_anno(load_anno(gtf, 'anno2', cache_dir), read_anno(gtf, 'anno2'))
+    assert 'ANNO CACHE HIT' in capsys.readouterr().err
+
+    # changed gene prediction
+    shutil.copy(example_files + 'ex_feature_anno2.gtf', gtf)
+    compare_anno(load_anno(gtf, 'anno1', cache_dir), read_anno(gtf, 'anno1'))
+    assert 'ANNO CACHE MISS' in capsys.readouterr().err
+    assert len(os.listdir(cache_dir)) == 1
+
+def test_load_anno_line_refs(gtf, tmp_path, capsys, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    load_anno(gtf, 'anno1', cache_dir)
+    # separate snapshots with and without line references
+    anno = load_anno(gtf, 'anno1', cache_dir, line_refs=True)
+    assert capsys.readouterr().err.count('ANNO CACHE MISS') == 2
+    assert anno.store.path == gtf
+    assert not load_anno(gtf, 'anno1', cache_dir).store.path
+    # the line references of a snapshot don't depend on the working directory
+    monkeypatch.chdir(str(tmp_path))
+    anno = load_anno('anno.gtf', 'anno1', cache_dir, line_refs=True)
+    assert 'ANNO CACHE HIT' in capsys.readouterr().err
+    assert anno.store.path == gtf
+    reference = read_anno(gtf, 'anno1')
+    monkeypatch.chdir('/')
+    for tx in anno.get_transcript_list():
+        assert tx.transcript_lines == reference.transcripts[tx.id].transcript_lines
+    assert len(os.listdir(cache_dir)) == 2
+
+def test_touched_input(gtf, tmp_path, capsys, monkeypatch):
+    import file_cache
+    from hint_db import load_hint_db
+    from chr_stream import input_index
+    hints = str(tmp_path / 'hints.gff')
+    shutil.copy(example_files + 'ex_feature_hint1.gff', hints)
+    cache_dir = str(tmp_path / 'cache')
+    hashed = []
+    original = file_cache.file_hash
+    def file_hash(path):
+        hashed.append(path)
+        return original(path)
+    monkeypatch.setattr(file_cache, 'file_hash', file_hash)
+    def load():
+        del hashed[:]
+        compare_anno(load_anno(gtf, 'anno1', cache_dir), read_anno(gtf, 'anno1'))
+        load_hint_db([hints], cache_dir)
+        assert input_index(gtf, cache_dir).chromosomes() == ['3R']
+        return list(hashed)
+
+    assert sorted(load()) == sorted([gtf, hints, gtf])
+    assert load() == []
+    capsys.readouterr()
+    for i in range(2):
+        # the inputs are hashed once after they were touched
+        for path in [gtf, hints]:
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert sorted(load()) == sorted([gtf, hints, gtf])
+        assert load() == []
+        err = capsys.readouterr().err
+        assert 'CACHE MISS' not in err and 'WARNING' not in err
+    assert len(os.listdir(cache_dir)) == 3
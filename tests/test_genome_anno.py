@@ -87,11 +87,39 @@ def test_anno_read_file(anno_anno1, file_anno1):
         print(gtf_anno)
         assert line in gtf_anno
 
+def test_store_compact(anno_anno1):
+    gtf_before = anno_anno1.get_gtf()
+    anno_anno1.norm_tx_format()
+    offset = 0
+    for tx in anno_anno1.get_transcript_list():
+        assert tx.rows is None
+        assert tx.offset == offset
+        offset += tx.length
+    assert offset == len(anno_anno1.store)
+    gtf_after = anno_anno1.get_gtf()
+    for line in gtf_before:
+        assert line in gtf_after
+
 def test_format_error():
     anno = Anno(anno_format_error, 'error_anno')
     with pytest.raises(NotGtfFormat):
         anno.addGtf()
 
+@pytest.mark.parametrize('start,end', [[1, 2**32], [-5, 100], [2**32 - 10, 2**32 - 1]])
+def test_coordinate_range(start, end):
+    line = ['chr1', 'AUGUSTUS', 'CDS', str(start), str(end), '.', '+', '0', \
+        'transcript_id "t1"; gene_id "g1";']
+    anno = Anno('', 'anno')
+    if end < 2**32 and start >= 0:
+        anno.add_rows(enumerate([line]))
+        tx = anno.transcripts['t1']
+        assert tx.get_cds_coords()['0'] == [[start, end]]
+        assert tx.get_cds_fingerprint()[2:4] == (start, end)
+    else:
+        with pytest.raises(NotGtfFormat) as error:
+            anno.add_rows(enumerate([line]))
+        assert 'chr1\tAUGUSTUS\tCDS\t{}\t{}'.format(start, end) in str(error.value)
+
 def test_missing_gid(file_anno1):
     anno = Anno(anno_missing_gid, 'anno1')
     anno.addGtf()
@@ -103,6 +131,45 @@ def test_missing_gid(file_anno1):
         assert line in file_anno1
 
 
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_line_refs(tmp_path, newline):
+    import pickle
+    path = str(tmp_path / 'anno1.gtf')
+    with open(anno1, 'r') as file:
+        text = file.read()
+    with open(path, 'w', newline='') as file:
+        file.write(text.replace('\n', newline))
+    anno = Anno(path, 'anno1')
+    anno.addGtf()
+    anno.norm_tx_format()
+    anno_refs = Anno(path, 'anno1', line_refs=True)
+    anno_refs.addGtf()
+    anno_refs.norm_tx_format()
+    # attributes of the file lines aren't in memory, but are read if needed
+    assert len(anno_refs.store.values['attribute']) < len(anno.store.values['attribute'])
+    assert anno_refs.get_gtf() == anno.get_gtf()
+    anno_refs = pickle.loads(pickle.dumps(anno_refs))
+    for tx_id, tx in anno.transcripts.items():
+        assert anno_refs.transcripts[tx_id].transcript_lines == tx.transcript_lines
+        assert anno_refs.transcripts[tx_id].get_gtf('a', 'g1') == tx.get_gtf('a', 'g1')
+
+@pytest.mark.parametrize('line_refs', [False, True])
+def test_fix_ids(tmp_path, line_refs):
+    from fix_gtf_ids import fix_lines
+    path = str(tmp_path / 'anno1_fixed.gtf')
+    with open(anno1, 'r') as file, open(path, 'w') as out:
+        out.writelines(fix_lines(file))
+    anno = Anno(path, 'anno1')
+    anno.addGtf()
+    anno.norm_tx_format()
+    anno_fixed = Anno(anno1, 'anno1', line_refs, fix_ids=True)
+    anno_fixed.addGtf()
+    anno_fixed.norm_tx_format()
+    assert sorted(anno_fixed.transcripts.keys()) == sorted(anno.transcripts.keys())
+    assert anno_fixed.genes == anno.genes
+    assert anno_fixed.get_gtf() == anno.get_gtf()
+    for tx_id, tx in anno.transcripts.items():
+        assert anno_fixed.transcripts[tx_id].transcript_lines == tx.transcript_lines
 
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import sys
+import random
 import pytest
 
 testDir = os.path.abspath(os.path.dirname(__file__))
@@ -8,7 +9,7 @@ sys.path.append(testDir + '/../bin/')
 
 from genome_anno import Anno
 from overlap_graph import Graph, Node
-from evidence import Hintfile
+from evidence import Hintfile, Evidence
 
 example_files = testDir + '/graph/'
 
@@ -55,3 +56,256 @@ def test_example_3():
     graph.build()
     component_list = graph.connected_components()
     compare_lists(result, component_list)
+
+def random_anno(anno_id, numb_tx, seed):
+    # random CDS segments, including short and self overlapping segments
+    random.seed(seed)
+    rows = []
+    for i in range(numb_tx):
+        strand = random.choice(['+', '-'])
+        start = random.randint(1, 400)
+        for j in range(random.randint(1, 4)):
+            end = start + random.choice([0, 1, 2, random.randint(3, 80)])
+            rows.append(['1', 'AUGUSTUS', 'CDS', start, end, '.', strand, \
+                random.choice(['0', '1', '2']), \
+                'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+            start = random.choice([start, end + random.randint(-3, 60)])
+    anno = Anno('', anno_id)
+    anno.addGtf(enumerate(rows))
+    anno.norm_tx_format()
+    return anno
+
+def random_hints(anno):
+    # Evidence with random hints for some introns and start/stop codons
+    # of the transcripts, continues the random sequence of random_anno()
+    hints = []
+    for a in anno:
+        for tx in a.get_transcript_list():
+            for type in ['intron', 'start_codon', 'stop_codon']:
+                for line in tx.get_lines(type):
+                    if random.random() < 0.6:
+                        hints.append([line[0], 'b2h', type, str(line[3]), str(line[4]), \
+                            '.', line[6], '.', 'src={};mult={};'.format(\
+                            random.choice(['P', 'E']), random.randint(1, 3))])
+    evi = Evidence()
+    evi.add_hintfile('', enumerate(hints))
+    return evi
+
+def sweep_edges(graph):
+    # reference: compare all transcripts with overlapping start/end coordinates
+    tx_start_end = []
+    for key in graph.nodes.keys():
+        tx = graph.__tx_from_key__(key)
+        tx_start_end.append([key, tx.start, 0])
+        tx_start_end.append([key, tx.end, 1])
+    tx_start_end = sorted(tx_start_end, key=lambda t:(t[1], t[2]))
+    open_intervals = []
+    result = []
+    for interval in tx_start_end:
+        if interval[2] == 0:
+            open_intervals.append(interval[0])
+        else:
+            open_intervals.remove(interval[0])
+            for match in open_intervals:
+                if graph.compare_tx_cds(graph.__tx_from_key__(interval[0]), \
+                    graph.__tx_from_key__(match)):
+                    result.append([interval[0], match])
+    return result
+
+@pytest.mark.parametrize('seed', range(5))
+def test_overlap_index(seed):
+    anno1 = random_anno('anno1', 60, seed)
+    anno2 = random_anno('anno2', 60, seed + 100)
+    graph = Graph([anno1, anno2], {})
+    graph.build()
+    edges = [[e.node1, e.node2] for e in graph.edges.values()]
+    assert edges
+    assert edges == sweep_edges(graph)
+
+def bfs_components(graph):
+    # reference: traversal of the original connected_components() with the
+    # edges in the order of sweep_edges(), components in the order of their
+    # first node
+    edge_to = {key : [] for key in graph.nodes.keys()}
+    for key1, key2 in sweep_edges(graph):
+        edge_to[key1].append(key2)
+        edge_to[key2].append(key1)
+    visited = set()
+    result = []
+    for key in graph.nodes.keys():
+        if key in visited:
+            continue
+        component = [key] + edge_to[key]
+        not_visited = list(edge_to[key])
+        while not_visited:
+            next_node = not_visited.pop()
+            new_nodes = [n for n in edge_to[next_node] if n not in component]
+            not_visited += new_nodes
+            component += new_nodes
+        visited = visited.union(component)
+        result.append(component)
+    return result
+
+@pytest.mark.parametrize('seed', range(3))
+def test_component_ids(seed):
+    graph = Graph([random_anno('anno1', 80, seed), \
+        random_anno('anno2', 80, seed + 100)], {})
+    graph.build()
+    component_list = graph.connected_components()
+    assert component_list == bfs_components(graph)
+    assert max([len(c) for c in component_list]) > 2
+    for i, component in enumerate(component_list):
+        for key in component:
+            assert graph.nodes[key].component_id == 'g_{}'.format(i + 1)
+
+def decided_nodes(graph):
+    # reference: nodes that aren't removed by the comparison of any edge
+    removed = set([graph.decide_edge(e) for e in graph.edges.values()])
+    return set([key for key in graph.nodes.keys() if key not in removed])
+
+def test_decide_edges():
+    np = pytest.importorskip('numpy')
+    para = {'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    graph = Graph([random_anno('anno1', 80, 1), random_anno('anno2', 80, 2)], para)
+    graph.build()
+    # few distinct values, so that there are ties and differences equal to e_i
+    random.seed(0)
+    graph.feature_matrix = np.array([[random.choice([0, 0.5, 1]), \
+        random.choice([0, 0.5, 1]), random.choice([0, 25, 50]), \
+        random.choice([0, 10, 20])] for n in graph.nodes], dtype=np.float64)
+    for key, feature_vector in zip(graph.nodes.keys(), graph.feature_matrix.tolist()):
+        graph.nodes[key].feature_vector = feature_vector
+    node_keys = list(graph.nodes.keys())
+    result = [node_keys[n] if n >= 0 else None for n in graph.decide_edges().tolist()]
+    assert None in result
+    assert result == [graph.decide_edge(e) for e in graph.edges.values()]
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_decide_nodes(numpy):
+    para = {'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    graph = Graph([random_anno('anno1', 150, 3), random_anno('anno2', 150, 4)], para)
+    graph.build()
+    assert max(map(len, graph.connected_components())) > 20
+    random.seed(1)
+    features = [[random.choice([0, 0.5, 1]), random.choice([0, 0.5, 1]), \
+        random.choice([0, 25, 50]), random.choice([0, 10, 20])] for n in graph.nodes]
+    for key, feature_vector in zip(graph.nodes.keys(), features):
+        graph.nodes[key].feature_vector = feature_vector
+    if numpy:
+        np = pytest.importorskip('numpy')
+        graph.feature_matrix = np.array(features, dtype=np.float64)
+    graph.decide_graph()
+    assert set(graph.decided_graph) == decided_nodes(graph)
+    assert len(graph.decided_graph) < len(graph.nodes)
+
+def test_duplicate_tx():
+    def cds_rows(tx_id, segments):
+        return [['1', 'AUGUSTUS', 'CDS', s, e, '.', '+', p, \
+            'transcript_id "{}"; gene_id "g1";'.format(tx_id)] for s, e, p in segments]
+    segments = [[100, 200, '0'], [300, 400, '1']]
+    rows = {'anno1' : cds_rows('t1', segments),
+            # same CDS in different order, different frame, different start
+            'anno2' : cds_rows('t1', segments[::-1]) \
+                + cds_rows('t2', [[100, 200, '0'], [300, 400, '2']]) \
+                + cds_rows('t3', segments) + [['1', 'AUGUSTUS', 'exon', 50, 200, \
+                '.', '+', '.', 'transcript_id "t3"; gene_id "g1";']],
+            'anno3' : cds_rows('t1', segments)}
+    anno = []
+    for anno_id in ['anno1', 'anno2', 'anno3']:
+        anno.append(Anno('', anno_id))
+        anno[-1].addGtf(enumerate(rows[anno_id]))
+        anno[-1].norm_tx_format()
+    graph = Graph(anno, {})
+    graph.build()
+    assert graph.duplicate_tx == {'anno1' : 0, 'anno2' : 1, 'anno3' : 1}
+    assert list(graph.nodes.keys()) == ['anno1;t1', 'anno2;t2', 'anno2;t3']
+
+@pytest.mark.parametrize('seed', range(3))
+def test_decided_order(seed):
+    # transcripts of the output in the order of the original traversal
+    para = {'P' : 0.1, 'E' : 10, 'intron_support' : 0.75, 'stasto_support' : 1, \
+        'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    anno = [random_anno('anno1', 80, seed), random_anno('anno2', 80, seed + 100)]
+    evi = random_hints(anno)
+    graph = Graph(anno, para)
+    graph.build()
+    graph.add_node_features(evi)
+    result = graph.get_decided_graph()
+    decided = decided_nodes(graph)
+    reference = {'anno1' : [], 'anno2' : []}
+    for i, component in enumerate(bfs_components(graph)):
+        for key in component:
+            if key in decided and graph.nodes[key].evi_support:
+                anno_id, tx_id = key.split(';')
+                reference[anno_id].append([tx_id, 'g_{}'.format(i + 1)])
+    assert result == reference
+    assert min([len(r) for r in result.values()]) > 1
+
+@pytest.mark.parametrize('numpy', [True, False])
+@pytest.mark.parametrize('weighted', [True, False])
+def test_summation_order(monkeypatch, numpy, weighted):
+    # the weighted multiplicities of all hints of a transcript are added one
+    # after another, 0.1 + (0.1 + 20) would be 20.200000000000003 and
+    # anno1;a.t1 wouldn't be removed by e_3
+    import overlap_graph
+    if numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(overlap_graph, 'np', None)
+    para = {'P' : 0.1, 'E' : 10, 'C' : 5, 'M' : 1, 'intron_support' : 0.75, \
+        'stasto_support' : 1, 'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    anno = []
+    for anno_id, tx_id, cds in [['anno1', 'a', [[100, 200], [301, 400], [501, 600]]], \
+        ['anno2', 'b', [[100, 210], [311, 400], [511, 600]]]]:
+        anno.append(Anno('', anno_id))
+        anno[-1].addGtf(enumerate([['chr1', 'AUG', 'CDS', start, end, '.', '+', \
+            '0', 'transcript_id "{}.t1"; gene_id "{}";'.format(tx_id, tx_id)] \
+            for start, end in cds]))
+        anno[-1].norm_tx_format()
+    evi = Evidence()
+    for hints in [[[201, 300, 'P', 1], [401, 500, 'P', 1], [211, 310, 'P', 2], \
+        [401, 510, 'C', 9]], [[401, 500, 'E', 2]]]:
+        evi.add_hintfile('', enumerate([['chr1', 'x', 'intron', str(start), \
+            str(end), '1', '+', '.', 'src={};mult={};'.format(src, mult)] \
+            for start, end, src, mult in hints]))
+    if weighted:
+        evi.set_weights(para)
+    graph = Graph(anno, para)
+    graph.build()
+    graph.add_node_features(evi)
+    graph.decide_graph()
+    assert graph.nodes['anno1;a.t1'].feature_vector[2] == 20.2
+    assert graph.nodes['anno2;b.t1'].feature_vector[2] == 45.2
+    assert graph.decided_graph == ['anno2;b.t1']
+
+@pytest.mark.parametrize('numpy', [True, False])
+def test_lazy_features(monkeypatch, numpy):
+    import overlap_graph
+    from features import Node_features
+    if numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(overlap_graph, 'np', None)
+    para = {'P' : 0.1, 'E' : 10, 'intron_support' : 0.75, 'stasto_support' : 1, \
+        'e_1' : 0, 'e_2' : 0.5, 'e_3' : 25, 'e_4' : 10}
+    anno = [random_anno('anno1', 80, 1), random_anno('anno2', 80, 2)]
+    evi = random_hints(anno)
+    evi.set_weights(para)
+    graph = Graph(anno, para)
+    graph.build()
+    graph.add_node_features(evi)
+    graph.decide_graph()
+    skipped, total = graph.skipped_features
+    assert 0 < skipped < total == 4 * len(graph.nodes)
+    for key, node in graph.nodes.items():
+        features = Node_features(graph.__tx_from_key__(key), evi, para).get_features()
+        assert node.feature_vector[0] == features[0]
+        assert [f for f in node.feature_vector if f is not None] \
+            == [f for f, g in zip(features, node.feature_vector) if g is not None]
+        if not node.edge_to:
+            assert node.feature_vector[2:] == [None, None]
+    # the same decision as with all features
+    for node in graph.nodes.values():
+        node.feature_vector = Node_features(graph.__tx_from_key__(node.id), evi, \
+            para).get_features()
+    assert decided_nodes(graph) == set(graph.decided_graph)
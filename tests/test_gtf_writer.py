@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+import sys
+import random
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from gtf_writer import GtfWriter, sorted_lines, line_key
+
+def random_transcripts(numb_tx, seed):
+    # gtf lines of random transcripts sorted by chr and start,
+    # the lines of each transcript are sorted by start
+    random.seed(seed)
+    result = []
+    for i in range(numb_tx):
+        chr = random.choice(['1', '2', 'X'])
+        start = random.randint(1, 1000)
+        lines = []
+        for j in range(random.randint(1, 5)):
+            lines.append([chr, 'AUGUSTUS', 'CDS', start, start + random.randint(0, 200), \
+                '.', '+', '0', 'transcript_id "t{}"; gene_id "g{}";'.format(i, i)])
+            start += random.randint(0, 300)
+        result.append(lines)
+    return sorted(result, key=lambda tx:line_key(tx[0]))
+
+@pytest.mark.parametrize('seed', range(3))
+def test_sorted_lines(seed):
+    transcripts = random_transcripts(200, seed)
+    lines = [l for tx in transcripts for l in tx]
+    assert list(sorted_lines(iter(transcripts))) == sorted(lines, key=line_key)
+
+def test_gtf_writer(tmp_path):
+    streams = [random_transcripts(100, 1), random_transcripts(100, 2)]
+    with GtfWriter(str(tmp_path / 'unsorted.gtf')) as writer:
+        for s in streams:
+            writer.add(iter(s))
+    with GtfWriter(str(tmp_path / 'sorted.gtf'), sort=True, buffer_size=256) as writer:
+        for s in streams:
+            writer.add(iter(s))
+    with open(str(tmp_path / 'unsorted.gtf'), 'r') as file:
+        unsorted = file.read().split('\n')
+    with open(str(tmp_path / 'sorted.gtf'), 'r') as file:
+        result = file.read().split('\n')
+    assert unsorted[:-1] == ['\t'.join(map(str, l)) for s in streams \
+        for tx in s for l in tx]
+    # lines with the same start are in the order of the streams
+    assert result == sorted(unsorted[:-1], key=lambda l:(l.split('\t')[0], \
+        int(l.split('\t')[3]))) + ['']
+
+def test_bgzf_output(tmp_path):
+    from compressed import open_file
+    from tabix import TabixIndex
+    streams = [random_transcripts(2000, 3), random_transcripts(2000, 4)]
+    with GtfWriter(str(tmp_path / 'sorted.gtf'), sort=True) as writer:
+        for s in streams:
+            writer.add(iter(s))
+    path = str(tmp_path / 'sorted.gtf.gz')
+    with GtfWriter(path, bgzf=True) as writer:
+        for s in streams:
+            writer.add(iter(s))
+    with open(str(tmp_path / 'sorted.gtf'), 'r') as file:
+        result = file.read()
+    with open_file(path) as file:
+        assert file.read() == result
+    # regions through the tabix index
+    rows = [l.split('\t') for l in result.split('\n') if l]
+    tabix = TabixIndex(path)
+    assert tabix.chromosomes() == ['1', '2', 'X']
+    for chr, start, end in [['1', 1, 100], ['2', 500, 520], ['X', 1, 3000], \
+        ['X', 1200, 1300]]:
+        assert [r for o, r in tabix.rows(chr, start, end)] == [r for r in rows \
+            if r[0] == chr and int(r[3]) <= end and int(r[4]) >= start]
+
+def test_csi_output(tmp_path):
+    from tabix import TabixIndex
+    # lines behind 2^29, the limit of the tabix format
+    random.seed(5)
+    transcripts = []
+    for i in range(300):
+        chr = random.choice(['1', '2'])
+        start = random.choice([1, 2**29 - 5000, 600000000, 2**31]) \
+            + random.randint(0, 20000)
+        end = start + random.choice([100, 3000, 2**20])
+        transcripts.append([[chr, 'AUGUSTUS', 'CDS', start, end, '.', '+', '0', \
+            'transcript_id "t{}"; gene_id "g{}";'.format(i, i)]])
+    transcripts = sorted(transcripts, key=lambda tx:line_key(tx[0]))
+    path = str(tmp_path / 'large.gtf.gz')
+    # index of a previous output
+    with open(path + '.tbi', 'w') as file:
+        file.write('old')
+    with GtfWriter(path, bgzf=True) as writer:
+        writer.add(iter(transcripts))
+    assert os.path.exists(path + '.csi')
+    assert not os.path.exists(path + '.tbi')
+
+    tabix = TabixIndex(path)
+    assert tabix.depth > 5
+    rows = [[str(c) for c in tx[0]] for tx in transcripts]
+    assert tabix.chromosomes() == ['1', '2']
+    for chr, start, end in [['1', 1, 30000], ['2', 2**29 - 100, 2**29 + 100], \
+        ['1', 600000000, 600000100], ['2', 600010000, 600020000], \
+        ['1', 2**31 + 10000, 2**31 + 10100], ['2', 2**31 + 2**20, 2**32]]:
+        result = [r for o, r in tabix.rows(chr, start, end)]
+        assert result == [r for r in rows if r[0] == chr and int(r[3]) <= end \
+            and int(r[4]) >= start]
+        assert result
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from evidence import Evidence
+from hint_db import HintDB, load_hint_db
+
+example_files = testDir + '/graph/'
+
+@pytest.fixture
+def hintfiles(tmp_path):
+    files = []
+    for i in [1, 2]:
+        files.append(str(tmp_path / 'hint{}.gff'.format(i)))
+        shutil.copy(example_files + 'ex_feature_hint{}.gff'.format(i), files[-1])
+    return files
+
+def compare_evidence(evi1, evi2):
+    assert evi1.src_list == evi2.src_list
+    assert evi1.index.keys() == evi2.index.keys()
+    for key in evi1.index.keys():
+        for name in ['keys', 'offset', 'src', 'mult']:
+            assert list(getattr(evi1.index[key], name)) \
+                == list(getattr(evi2.index[key], name))
+
+def test_hint_db(hintfiles, tmp_path):
+    evi = Evidence()
+    for h in hintfiles:
+        evi.add_hintfile(h)
+    cache_dir = str(tmp_path / 'cache')
+    hint_db = load_hint_db(hintfiles, cache_dir, quiet=True)
+    compare_evidence(hint_db.get_evidence(), evi)
+    chr = hint_db.chromosomes()[0]
+    assert all([key[0] == chr for key in hint_db.get_evidence(chr).index.keys()])
+    assert hint_db.size(chr) > 0
+
+    # reused by the next run
+    assert len(os.listdir(cache_dir)) == 1
+    path = os.path.join(cache_dir, os.listdir(cache_dir)[0])
+    mtime = os.stat(path).st_mtime_ns
+    compare_evidence(load_hint_db(hintfiles, cache_dir, quiet=True).get_evidence(), evi)
+    assert os.stat(path).st_mtime_ns == mtime
+
+def test_hint_db_invalid(hintfiles, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    hint_db = load_hint_db(hintfiles, cache_dir, quiet=True)
+    assert hint_db.is_valid(hintfiles)
+    assert not hint_db.is_valid(hintfiles[:1])
+    assert not hint_db.is_valid(hintfiles[::-1])
+    # new mtime, same content
+    stat = os.stat(hintfiles[0])
+    os.utime(hintfiles[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert hint_db.is_valid(hintfiles)
+    # same size, different content
+    with open(hintfiles[1], 'r') as file:
+        content = file.read()
+    stat = os.stat(hintfiles[1])
+    with open(hintfiles[1], 'w') as file:
+        file.write(content.replace('mult=2;', 'mult=3;', 1))
+    os.utime(hintfiles[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not hint_db.is_valid(hintfiles)
+
+    evi = Evidence()
+    for h in hintfiles:
+        evi.add_hintfile(h)
+    compare_evidence(load_hint_db(hintfiles, cache_dir, quiet=True).get_evidence(), evi)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+import os
+import sys
+import gzip
+import shutil
+import pytest
+
+testDir = os.path.abspath(os.path.dirname(__file__))
+sys.path.append(testDir + '/../bin/')
+
+from input_loader import load_inputs, numb_processes, prefetch
+from genome_anno import Anno
+from evidence import Evidence
+import input_loader
+import compressed
+
+example_files = testDir + '/graph/'
+gtf = [example_files + 'ex_feature_anno2.gtf', example_files + 'ex_feature_anno1.gtf', \
+    example_files + 'ex1_anno1.gtf']
+hintfiles = [example_files + 'ex_feature_hint2.gff', testDir + '/evidence/hint3.gff', \
+    example_files + 'ex_feature_hint1.gff']
+
+def summary(anno, evi):
+    return [[[a.id, [tx.get_gtf() for tx in a.get_transcript_list()]] for a in anno], \
+        evi.src_list, {k : [list(h.keys), list(h.offset), list(h.src), list(h.mult)] \
+        for k, h in evi.index.items()}]
+
+def test_numb_processes():
+    assert numb_processes(5, 2) == 2
+    assert numb_processes(2, 8) == 2
+    assert numb_processes(0, 4) == 1
+    assert numb_processes(3) == 1
+    assert numb_processes(3, None) == min(3, os.cpu_count() or 1)
+
+@pytest.mark.parametrize('processes', [2, 6])
+def test_load_inputs(processes):
+    expected = summary(*load_inputs(gtf, hintfiles, 1, quiet=True))
+    assert [a[0] for a in expected[0]] == ['anno1', 'anno2', 'anno3']
+    assert summary(*load_inputs(gtf, hintfiles, processes, quiet=True)) == expected
+
+def test_load_inputs_cache(tmp_path):
+    expected = summary(*load_inputs(gtf, hintfiles, 1, quiet=True))
+    for i in range(2):
+        assert summary(*load_inputs(gtf, hintfiles, 3, str(tmp_path), \
+            str(tmp_path), quiet=True)) == expected
+
+def test_prefetch(tmp_path, monkeypatch):
+    # small chunks, the reading thread has to wait for the parser
+    monkeypatch.setattr(compressed, 'PREFETCH_CHUNK_SIZE', 100)
+    monkeypatch.setattr(compressed, 'PREFETCH_CHUNKS', 2)
+    opened = []
+    def open_file(path, binary=False, threads=None, prefetch=False):
+        opened.append(path)
+        return compressed.open_file(path, binary, threads, prefetch)
+    monkeypatch.setattr(input_loader, 'open_file', open_file)
+    # a gzip compressed copy of a hintfile
+    paths = list(hintfiles)
+    with open(paths[1], 'rb') as file, gzip.open(str(tmp_path / 'h.gz'), 'wb') as out:
+        shutil.copyfileobj(file, out)
+    paths[1] = str(tmp_path / 'h.gz')
+    files = prefetch(paths)
+    for i, path in enumerate(paths):
+        file = next(files)
+        # the current and the next file are read ahead
+        assert opened == paths[:min(i + 2, len(paths))]
+        with compressed.open_file(path, binary=True) as expected:
+            assert file.read() == expected.read()
+    files.close()
+
+    expected = [[a.id, [tx.get_gtf() for tx in a.get_transcript_list()]] for a \
+        in load_inputs(gtf, [], 1, quiet=True)[0]]
+    anno = []
+    for i, g in enumerate(gtf):
+        anno.append(Anno(g, 'anno{}'.format(i+1)))
+        anno[-1].addGtf()
+        anno[-1].norm_tx_format()
+    assert expected == [[a.id, [tx.get_gtf() for tx in a.get_transcript_list()]] \
+        for a in anno]
+    evi = Evidence()
+    for h in hintfiles:
+        evi.add_hintfile(h)
+    assert summary([], load_inputs([], paths, 1, quiet=True)[1]) == summary([], evi)
+    with pytest.raises(FileNotFoundError):
+        load_inputs(gtf + [str(tmp_path / 'missing.gtf')], hintfiles, 1, quiet=True)